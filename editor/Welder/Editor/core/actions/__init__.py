@@ -1,3 +1,4 @@
 from .actions import ActionManager
 from .actions import ActionTemplate
 from .actions import ActionStack
+from .actions import CompoundAction
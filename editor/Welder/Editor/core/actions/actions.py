@@ -2,18 +2,107 @@
 Created on Oct 10, 2011
 
 '''
+import sys
+
+import numpy
+
 import welder_kernel as kernel
 
 
 class ActionStack(object):
-    def __init__(self, name):
+
+    '''
+    the undo history of one part of the editor. _stack[0] is a None
+    placeholder and _current_action the index of the last applied action.
+    the history is kept under a budget in bytes and a cap on the number of
+    actions, once over either the oldest actions are forgotten. the newest
+    action is always kept, even if it is bigger than the budget on its own
+    '''
+
+    # in megabytes, 0 means no limit
+    default_budget = 256
+    # 0 means no limit
+    default_max_actions = 1000
+
+    def __init__(self, name, budget=None, max_actions=None):
         self._stack = [None]
+        # the size in bytes of every action in _stack
+        self._sizes = [0]
         self._current_action = 0
         self.name = name
+        if budget is None:
+            budget = ActionStack.getConfig("UndoBudget", ActionStack.default_budget)
+        if max_actions is None:
+            max_actions = ActionStack.getConfig(
+                "UndoLimit", ActionStack.default_max_actions)
+        # in bytes, 0 means no limit
+        self.budget = budget * 1024 * 1024
+        self.max_actions = max_actions
+        self.bytes = 0
+        self.dropped = 0
+        # the CompoundAction collecting actions between
+        # ActionManager.BeginCompound and EndCompound
+        self._compound = None
+        self._compound_depth = 0
+
+    @staticmethod
+    def getConfig(name, default):
+        try:
+            return int(kernel.Config.getUnified()["Main"][name])
+        except Exception:
+            return default
+
+    def add(self, actions):
+        '''
+        drops everything that was undone and puts the applied actions on
+        top
+        '''
+        del self._stack[self._current_action + 1:]
+        del self._sizes[self._current_action + 1:]
+        for action in actions:
+            self._stack.append(action)
+            self._sizes.append(action.getSize())
+        self.bytes = sum(self._sizes)
+        self._current_action = len(self._stack) - 1
+        self.trim()
+
+    def remove(self, index):
+        del self._stack[index]
+        self.bytes -= self._sizes.pop(index)
+        if index <= self._current_action:
+            self._current_action -= 1
+
+    def trim(self):
+        '''
+        forgets the oldest actions until the stack is within its budget
+        '''
+        while len(self._stack) > 2 and self._current_action > 1 and (
+                (self.budget > 0 and self.bytes > self.budget) or
+                (self.max_actions > 0 and len(self._stack) - 1 > self.max_actions)):
+            self.remove(1)
+            self.dropped += 1
+
+    def getMemoryUsage(self):
+        '''
+        the bytes held by the actions in the stack, as sized when they
+        were added
+        '''
+        return self.bytes
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "actions": len(self._stack) - 1,
+            "current": self._current_action,
+            "bytes": self.bytes,
+            "budget": self.budget,
+            "max_actions": self.max_actions,
+            "dropped": self.dropped
+        }
 
 
 class ActionManager(object):
-    _action_stacks = {None: ActionStack("default")}
+    _action_stacks = {None: ActionStack(None)}
     _last_stack = None
 
     @staticmethod
@@ -27,6 +116,61 @@ class ActionManager(object):
         if name in ActionManager._action_stacks:
             del ActionManager._action_stacks[name]
 
+    @staticmethod
+    def GetMemoryUsage(stack=None):
+        '''
+        the bytes held by the undo history of a stack
+        '''
+        if stack not in ActionManager._action_stacks:
+            raise RuntimeError("Action stack '%s' does not exist" % (stack,))
+        return ActionManager._action_stacks[stack].getMemoryUsage()
+
+    @staticmethod
+    def GetStats():
+        '''
+        the stats of every stack, see ActionStack.stats
+        '''
+        return [action_stack.stats()
+                for action_stack in ActionManager._action_stacks.values()]
+
+    @staticmethod
+    def BeginCompound(stack=None):
+        '''
+        actions applied on stack from now until the matching EndCompound
+        are undone and redone as one, like the cells painted in a brush
+        stroke. calls nest, only the outermost pair makes an action
+        '''
+        if stack not in ActionManager._action_stacks:
+            raise RuntimeError("Action stack '%s' does not exist" % (stack,))
+        action_stack = ActionManager._action_stacks[stack]
+        if action_stack._compound is None:
+            action_stack._compound = CompoundAction(stack)
+        action_stack._compound_depth += 1
+        return action_stack._compound
+
+    @staticmethod
+    def EndCompound(stack=None):
+        '''
+        closes a BeginCompound, the collected actions go on the stack as a
+        single CompoundAction which is returned. nothing is added if no
+        action was applied in between
+        '''
+        if stack not in ActionManager._action_stacks:
+            raise RuntimeError("Action stack '%s' does not exist" % (stack,))
+        action_stack = ActionManager._action_stacks[stack]
+        if action_stack._compound is None:
+            return None
+        action_stack._compound_depth -= 1
+        if action_stack._compound_depth > 0:
+            return None
+        compound = action_stack._compound
+        action_stack._compound = None
+        if not compound.actions:
+            return None
+        compound.close()
+        action_stack.add([compound])
+        return compound
+
     @staticmethod
     def Undo(stack=None):
         if stack not in ActionManager._action_stacks:
@@ -46,7 +190,7 @@ class ActionManager(object):
             raise RuntimeError("Action stack '%s' does not exist" % (stack,))
         ActionManager._last_stack = stack
         action_stack = ActionManager._action_stacks[stack]
-        if len(action_stack._stack) > 1:
+        if action_stack._current_action < len(action_stack._stack) - 1:
             ActionManager.BatchAction(
                 action_stack._current_action,
                 action_stack._current_action + 1,
@@ -74,14 +218,13 @@ class ActionManager(object):
             raise RuntimeError("Action stack '%s' does not exist" % (stack,))
         ActionManager._last_stack = stack
         action_stack = ActionManager._action_stacks[stack]
-        args = [start, end]
-        reverse_flag = False
-        if args[0] > args[1]:
-            args.sort()
-            reverse_flag = True
-        actions = action_stack[args[0]:args[1]]
-        if reverse_flag:
+        # undoing from start to end undoes the actions end + 1 to start,
+        # newest first, redoing applies start + 1 to end
+        if undo:
+            actions = action_stack._stack[end + 1:start + 1]
             actions.reverse()
+        else:
+            actions = action_stack._stack[start + 1:end + 1]
 
         success, i = ActionManager._doActions(actions, undo)
 
@@ -106,8 +249,11 @@ class ActionManager(object):
         if stack not in ActionManager._action_stacks:
             raise RuntimeError("Action stack '%s' does not exist" % (stack,))
         action_stack = ActionManager._action_stacks[stack]
-        del action_stack._stack[action_stack._current_action + 1:]
-        action_stack._stack.extend(actions)
+        if action_stack._compound is not None:
+            for action in actions:
+                action_stack._compound.add(action)
+        else:
+            action_stack.add(actions)
 
     @staticmethod
     def RemoveActions(*actions, stack=None):
@@ -116,10 +262,7 @@ class ActionManager(object):
         action_stack = ActionManager._action_stacks[stack]
         for action in actions:
             if action in action_stack._stack:
-                index = action_stack._stack.index(action)
-                if index >= action_stack._current_action:
-                    action_stack._current_action -= 1
-                action_stack._stack.remove(action)
+                action_stack.remove(action_stack._stack.index(action))
 
 
 class ActionTemplate(object):
@@ -129,20 +272,17 @@ class ActionTemplate(object):
     def __init__(self, sub_action=False, stack=None):
         self._applyed = False
         self.sub_action = sub_action
-        self.stack = _AM.AddStack(stack)
+        self.stack = self._AM.AddStack(stack)
 
     def apply(self):
         if not self._applyed:
-            updatecurrentactionflag = False
             success = self.do_apply()
             if success:
-                if not self.sub_action or not self.in_stack():
-                    updatecurrentactionflag = True
-                    self._AM.AddActions(self, stack=self.stack.name)
-
                 self._applyed = True
-                if not self.sub_action and updatecurrentactionflag:
-                    self.stack._current_action = len(self.stack._stack) - 1
+                # sub actions are undone and redone by the action that
+                # owns them
+                if not self.sub_action and not self.in_stack():
+                    self._AM.AddActions(self, stack=self.stack.name)
             return success
         else:
             return False
@@ -162,9 +302,105 @@ class ActionTemplate(object):
     def do_undo(self):
         return False
 
+    def getSize(self):
+        '''
+        the bytes this action holds on to so it can be undone and redone,
+        subclasses holding large values should keep them compact
+        '''
+        return ActionTemplate.sizeOf(self.__dict__)
+
+    def merge(self, action):
+        '''
+        folds action, applied right after this one inside a compound
+        action, into this one so both are undone and redone together.
+        returns True when it did, by default actions are kept apart
+        '''
+        return False
+
+    def compact(self):
+        '''
+        called once the action is done changing, after the compound action
+        holding it is closed, a chance to pack what it keeps for undo
+        '''
+        pass
+
+    @staticmethod
+    def sizeOf(value, depth=3):
+        '''
+        a rough size in bytes of value, arrays and Tables count their
+        buffers, containers their contents a few levels deep and actions
+        their own getSize
+        '''
+        if isinstance(value, ActionTemplate):
+            return value.getSize()
+        if isinstance(value, numpy.ndarray):
+            return sys.getsizeof(value) + (value.nbytes if value.base is not None else 0)
+        data = getattr(value, "_data", None)
+        if isinstance(data, numpy.ndarray):
+            # a Table
+            return sys.getsizeof(value) + data.nbytes
+        size = sys.getsizeof(value)
+        if depth <= 0:
+            return size
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if isinstance(item, ActionStack):
+                    continue
+                size += ActionTemplate.sizeOf(item, depth - 1)
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            for item in value:
+                size += ActionTemplate.sizeOf(item, depth - 1)
+        return size
+
     def in_stack(self):
         return self in self.stack._stack
 
     def remove_from_stack(self):
         if self.in_stack():
             self._AM.RemoveActions(self, stack=self.stack.name)
+
+
+class CompoundAction(ActionTemplate):
+
+    '''
+    a group of actions that were applied together and are undone and
+    redone as one, see ActionManager.BeginCompound. every action is given
+    the chance to merge into the one before it, so a stroke of single cell
+    table edits ends up as one action
+    '''
+
+    def __init__(self, stack=None):
+        super(CompoundAction, self).__init__(False, stack)
+        self.actions = []
+
+    def add(self, action):
+        # the compound action applies and undoes it from now on
+        action.sub_action = True
+        if self.actions and self.actions[-1].merge(action):
+            return
+        self.actions.append(action)
+
+    def close(self):
+        for action in self.actions:
+            action.compact()
+        self._applyed = True
+
+    def do_apply(self):
+        for index, action in enumerate(self.actions):
+            if not action.apply():
+                # put back the ones already applied
+                for applied in reversed(self.actions[:index]):
+                    applied.undo()
+                return False
+        return True
+
+    def do_undo(self):
+        for index, action in enumerate(reversed(self.actions)):
+            if not action.undo():
+                for undone in self.actions[len(self.actions) - index:]:
+                    undone.apply()
+                return False
+        return True
+
+    def getSize(self):
+        return sum(action.getSize() for action in self.actions)
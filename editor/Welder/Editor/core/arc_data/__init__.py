@@ -1,3 +1,5 @@
 from .arc_data import ARC_Dump
+from .arc_data import ArcEncoder
+from .arc_data import ArcDecoder
 from .arc_data import Dump as ARCDataDumpFunction
 from .arc_data import Load as ARCDataLoadFunction
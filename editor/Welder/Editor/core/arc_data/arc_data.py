@@ -1,4 +1,4 @@
-from struct import pack, unpack
+from struct import Struct
 import types
 
 class ARC_Dump(object):
@@ -19,389 +19,411 @@ class ARC_Dump(object):
         "Object" : b"\x00"
         }
     
-    _io = None
-    _strings = [None]
-    _arrays = [None]
-    _hashes = [None]
-    _objects = [None]
-    _class_path_redirects = {}
-    _extended_namespace = {}
-    
     @staticmethod
     def dump(io, obj, redirects = {}):
-        ARC_Dump._class_path_redirects = redirects
-        ARC_Dump._io = io
-        ARC_Dump._io.write(ARC_Dump._HEADER)
-        ARC_Dump._io.write(ARC_Dump._VERSION)
-        try:
-            ARC_Dump._dump(obj)
-        except Exception:
-            try:
-                print("stream position: %s" % ARC_Dump._io.tell())
-            except Exception:
-                pass
-            raise
-        ARC_Dump._reset()
+        ArcEncoder(redirects).dump(io, obj)
     
     
     @staticmethod
     def load(io, redirects = {}, extended_namespace={}):
-        ARC_Dump._class_path_redirects = redirects
-        extended_namespace.update(globals())
-        ARC_Dump._extended_namespace = dict(extended_namespace)
-        extended_namespace = {}
-        ARC_Dump._io = io
-        header = ARC_Dump._io.read(4)
-        if ARC_Dump._HEADER != header:
-            raise TypeError("Error: header mismatch! Expected: %s Found: %s" %(repr(ARC_Dump._HEADER), repr(header)))
-        version = ARC_Dump._io.read(2)
-        if ARC_Dump._VERSION != version:
-            raise TypeError("Error: version mismatch! Expected: %s Found: %s" %(repr(ARC_Dump._VERSION), repr(version)))
-        try:
-            data = ARC_Dump._load()
-        except Exception:
-            try:
-                print("stream position: %s" % ARC_Dump._io.tell())
-            except Exception:
-                pass
-            raise
-        ARC_Dump._reset()
-        return data
+        return ArcDecoder(redirects, extended_namespace).load(io)
     
     
     @staticmethod
-    def _reset():
-        ARC_Dump._io = None
-        ARC_Dump._strings = [None]
-        ARC_Dump._arrays = [None]
-        ARC_Dump._hashes = [None]
-        ARC_Dump._objects = [None]
-        ARC_Dump._class_path_redirects = {}
-        ARC_Dump._extended_namespace = {}
+    def _request_instance_variables(obj):
+        if hasattr(obj, "_arc_instance_variables"):
+            return obj._arc_instance_variables
+        result = []
+        for key, value in list(obj.__dict__.items()):
+            if key[0] != "_":
+                if not isinstance(value, (types.FunctionType, type, types.MethodType, 
+                                          types.ModuleType, slice, types.LambdaType, 
+                                          types.GeneratorType)):
+                    result.append(key)
+        return result
     
 
-    @staticmethod
-    def __get_class_path(name):
-        if name in ARC_Dump._class_path_redirects:
-            return ARC_Dump._class_path_redirects[name]
-        else: 
-            return name
-    
-    
-    @staticmethod
-    def __get_class_object(class_path):
-        classes = class_path.split("::")
-        if classes[0] not in ARC_Dump._extended_namespace:
-            raise TypeError("Class not defined: %s" % classes[0])	
-        classe = ARC_Dump._extended_namespace[classes.pop(0)]
-        for c in classes:
-            if c not in classe.__dict__:
-                raise TypeError("Class not defined: %s" % c)
-            classe = classe.__dict__[c]
-        return classe
-    
+class ArcEncoder(object):
 
-    @staticmethod
-    def __try_map_equality(data, obj):
+    '''
+    Encodes an object graph into the ARC data format in a single pass.
+
+    Strings are mapped by value and arrays, hashes and objects by identity
+    through dicts, so looking up a back-reference is O(1). Output is
+    collected in a buffer that is flushed to the target io in large blocks.
+    The produced bytes are the same as what ARC_Dump.dump always wrote.
+    '''
+
+    _BUFFER_SIZE = 65536
+
+    _int32 = Struct("<I").pack
+    _float = Struct("<f").pack
+
+    def __init__(self, redirects={}):
+        self._class_path_redirects = redirects
+        self._io = None
+        self._buffer = bytearray()
+        self._written = 0
+        # index 0 is reserved, the first mapped entry gets id 1
+        self._strings = {}
+        self._arrays = {}
+        self._hashes = {}
+        self._objects = {}
+        # mapped containers are kept alive so their ids can't be reused
+        self._mapped = []
+        self._dispatch = {
+            type(None): self._dump_none,
+            bool: self._dump_bool,
+            int: self._dump_number,
+            float: self._dump_number,
+            str: self._dump_string,
+            list: self._dump_array,
+            tuple: self._dump_array,
+            dict: self._dump_hash,
+            }
+
+    def dump(self, io, obj):
+        self._io = io
+        self._buffer.extend(ARC_Dump._HEADER)
+        self._buffer.extend(ARC_Dump._VERSION)
         try:
-            index = data.index(obj)
-        except ValueError:
-            index = None
-        if index == None:
-            ARC_Dump.__dump_int32(len(data))
-            data.append(obj)
+            self._dump(obj)
+            self._flush()
+        except Exception:
+            print("stream position: %s" % self.tell())
+            raise
+        finally:
+            self._io = None
+
+    def tell(self):
+        return self._written + len(self._buffer)
+
+    def _flush(self):
+        if self._buffer:
+            self._io.write(self._buffer)
+            self._written += len(self._buffer)
+            self._buffer = bytearray()
+
+    def _write(self, data):
+        self._buffer.extend(data)
+        if len(self._buffer) >= self._BUFFER_SIZE:
+            self._flush()
+
+    def _get_class_path(self, name):
+        if name in self._class_path_redirects:
+            return self._class_path_redirects[name]
+        else:
+            return name
+
+    def _try_map_equality(self, table, obj):
+        index = table.get(obj)
+        if index is None:
+            index = len(table) + 1
+            table[obj] = index
+            self._buffer.extend(self._int32(index))
             return True
-        ARC_Dump.__dump_int32(index)
+        self._buffer.extend(self._int32(index))
         return False
-    
 
-    @staticmethod
-    def __try_map_identity(data, obj):
-        index = None
-        for i in range(len(data)):
-            if data[i] is obj:
-                index = i
-                break
-        if index == None:
-            ARC_Dump.__dump_int32(len(data))
-            data.append(obj)
+    def _try_map_identity(self, table, obj):
+        key = id(obj)
+        index = table.get(key)
+        if index is None:
+            index = len(table) + 1
+            table[key] = index
+            self._mapped.append(obj)
+            self._buffer.extend(self._int32(index))
             return True
-        ARC_Dump.__dump_int32(index)
+        self._buffer.extend(self._int32(index))
         return False
-    
-
-    @staticmethod
-    def __map(data, obj):
-        data.append(obj)
-    
-
-    @staticmethod
-    def __find_mapped(data, id_num):
-        if id_num < len(data):
-            return data[id_num]
-        else:
-            return None
-    
-    
-    @staticmethod
-    def __dump_int32(obj):
-        ARC_Dump._io.write(pack("<I", obj))
-    
 
-    @staticmethod
-    def __load_int32():
-        return unpack("<I", ARC_Dump._io.read(4))[0]
-    
-    
-    @staticmethod
-    def _dump(obj):
+    def _dump(self, obj):
+        handler = self._dispatch.get(type(obj))
+        if handler is not None:
+            return handler(obj)
+        # anything that isn't an exact builtin type goes through the same
+        # chain of tests ARC_Dump has always used
         if obj == None:
-            return ARC_Dump._dump_none(obj)
+            return self._dump_none(obj)
         if obj == False:
-            return ARC_Dump._dump_false(obj) 
+            return self._write(ARC_Dump._TYPES["FalseClass"])
         if obj == True:
-            return ARC_Dump._dump_true(obj)
+            return self._write(ARC_Dump._TYPES["TrueClass"])
         if isinstance(obj, int):
-            return ARC_Dump._dump_fixnum(obj)
-        if isinstance(obj, int):
-            return ARC_Dump._dump_bignum(obj)
+            return self._dump_fixnum(obj)
         if isinstance(obj, float):
-            return ARC_Dump._dump_float(obj)
+            return self._dump_float(obj)
         if isinstance(obj, str):
-            return ARC_Dump._dump_string(obj)
+            return self._dump_string(obj)
         if isinstance(obj, (list, tuple)):
-            return ARC_Dump._dump_array(obj)
+            return self._dump_array(obj)
         if isinstance(obj, dict):
-            return ARC_Dump._dump_hash(obj)
+            return self._dump_hash(obj)
         if isinstance(obj, object):
-            return ARC_Dump._dump_object(obj)
+            return self._dump_object(obj)
         raise TypeError("Error: %s cannot be dumped!" % obj.__class__)
-    
-    @staticmethod
-    def _load():
-        type_id = ARC_Dump._io.read(1)
-        if type_id == ARC_Dump._TYPES["NoneClass"]:
-            return ARC_Dump._load_none()
-        elif type_id == ARC_Dump._TYPES["FalseClass"]:
-            return ARC_Dump._load_false()
-        elif type_id == ARC_Dump._TYPES["TrueClass"]:
-            return ARC_Dump._load_true()
-        elif type_id == ARC_Dump._TYPES["Fixnum"]:
-            return ARC_Dump._load_fixnum()
-        elif type_id == ARC_Dump._TYPES["Bignum"]:
-            return ARC_Dump._load_bignum()
-        elif type_id == ARC_Dump._TYPES["Float"]:
-            return ARC_Dump._load_float()
-        elif type_id == ARC_Dump._TYPES["String"]:
-            return ARC_Dump._load_string()
-        elif type_id == ARC_Dump._TYPES["Array"]:
-            return ARC_Dump._load_array()
-        elif type_id == ARC_Dump._TYPES["Hash"]:
-            return ARC_Dump._load_hash()
-        elif type_id == ARC_Dump._TYPES["Object"]:
-            return ARC_Dump._load_object()
-        
-        raise TypeError("Error: Unknown type 0x%02X detected!" % ord(type_id))
-    
-    
-    @staticmethod
-    def _dump_none(obj):
-        ARC_Dump._io.write(ARC_Dump._TYPES["NoneClass"])
-    
 
-    @staticmethod
-    def _dump_false(obj):
-        ARC_Dump._io.write(ARC_Dump._TYPES["FalseClass"])
-    
+    def _dump_none(self, obj):
+        self._write(ARC_Dump._TYPES["NoneClass"])
 
-    @staticmethod
-    def _dump_true(obj):
-        ARC_Dump._io.write(ARC_Dump._TYPES["TrueClass"])
-    
-    
-    @staticmethod
-    def _dump_fixnum(obj):
-        ARC_Dump._io.write(ARC_Dump._TYPES["Fixnum"])
-        ARC_Dump.__dump_int32(obj)
-    
-    
-    @staticmethod
-    def _dump_bignum(obj):
-        ARC_Dump._io.write(ARC_Dump._TYPES["Bignum"])
-        ARC_Dump.__dump_int32(obj) # our C++ implementation uses a "long" of 32 bit
-    
-    
-    @staticmethod
-    def _dump_float(obj):
-        ARC_Dump._io.write(ARC_Dump._TYPES["Float"])
-        ARC_Dump._io.write(pack("<f", obj))
-    
-    
-    @staticmethod
-    def _dump_string(obj):
-        ARC_Dump._io.write(ARC_Dump._TYPES["String"])
-        if not ARC_Dump.__try_map_equality(ARC_Dump._strings, obj): # abort if object has already been mapped
+    def _dump_bool(self, obj):
+        if obj:
+            self._write(ARC_Dump._TYPES["TrueClass"])
+        else:
+            self._write(ARC_Dump._TYPES["FalseClass"])
+
+    def _dump_number(self, obj):
+        # 0 and 1 compare equal to False and True and have always been
+        # written as such
+        if obj == 0:
+            self._write(ARC_Dump._TYPES["FalseClass"])
+        elif obj == 1:
+            self._write(ARC_Dump._TYPES["TrueClass"])
+        elif isinstance(obj, int):
+            self._dump_fixnum(obj)
+        else:
+            self._dump_float(obj)
+
+    def _dump_fixnum(self, obj):
+        self._buffer.extend(ARC_Dump._TYPES["Fixnum"])
+        # our C++ implementation uses a "long" of 32 bit
+        self._write(self._int32(obj))
+
+    def _dump_float(self, obj):
+        self._buffer.extend(ARC_Dump._TYPES["Float"])
+        self._write(self._float(obj))
+
+    def _dump_string(self, obj):
+        self._buffer.extend(ARC_Dump._TYPES["String"])
+        if not self._try_map_equality(self._strings, obj): # abort if object has already been mapped
             return
-        ARC_Dump.__dump_int32(len(obj))
-        ARC_Dump._io.write(bytes(obj, encoding='utf-8'))
-    
-    
-    @staticmethod
-    def _dump_array(obj):
-        ARC_Dump._io.write(ARC_Dump._TYPES["Array"])
-        if not ARC_Dump.__try_map_identity(ARC_Dump._arrays, obj): # abort if object has already been mapped
-            return 
-        ARC_Dump.__dump_int32(len(obj))
+        data = obj.encode('utf-8')
+        self._buffer.extend(self._int32(len(data)))
+        self._write(data)
+
+    def _dump_array(self, obj):
+        self._buffer.extend(ARC_Dump._TYPES["Array"])
+        if not self._try_map_identity(self._arrays, obj): # abort if object has already been mapped
+            return
+        self._write(self._int32(len(obj)))
         for value in obj:
-            ARC_Dump._dump(value)
-    
-    
-    @staticmethod
-    def _dump_hash(obj):
-        ARC_Dump._io.write(ARC_Dump._TYPES["Hash"])
-        if not ARC_Dump.__try_map_identity(ARC_Dump._hashes, obj): # abort if object has already been mapped
-            return 
-        ARC_Dump.__dump_int32(len(obj))
+            self._dump(value)
+
+    def _dump_hash(self, obj):
+        self._buffer.extend(ARC_Dump._TYPES["Hash"])
+        if not self._try_map_identity(self._hashes, obj): # abort if object has already been mapped
+            return
+        self._write(self._int32(len(obj)))
         for key, value in list(obj.items()):
-            ARC_Dump._dump(key)
-            ARC_Dump._dump(value)
-        
-    
-    @staticmethod
-    def _request_instance_variables(obj):
-        if hasattr(obj, "_arc_instance_variables"):
-            return obj._arc_instance_variables
-        result = []
-        for key, value in list(obj.__dict__.items()):
-            if key[0] != "_":
-                if not isinstance(value, (types.FunctionType, type, types.MethodType, 
-                                          types.ModuleType, slice, types.LambdaType, 
-                                          types.GeneratorType)):
-                    result.append(key)
-        return result
-    
-    @staticmethod
-    def _dump_object(obj):
-        ARC_Dump._io.write(ARC_Dump._TYPES["Object"])
+            self._dump(key)
+            self._dump(value)
+
+    def _dump_object(self, obj):
+        self._buffer.extend(ARC_Dump._TYPES["Object"])
         if hasattr(obj, "_arc_class_path"):
             klass_path = obj._arc_class_path
         else:
             klass_path = "%s::%s" % (obj.__class__.__module__, obj.__class__.__name__)
-        ARC_Dump._dump_string(ARC_Dump.__get_class_path(klass_path)) # first the string path because this is required to load the object
-        if not ARC_Dump.__try_map_identity(ARC_Dump._objects, obj): # abort if object has already been mapped
+        self._dump_string(self._get_class_path(klass_path)) # first the string path because this is required to load the object
+        if not self._try_map_identity(self._objects, obj): # abort if object has already been mapped
             return
         if hasattr(obj, "_arc_dump"):
             data = obj._arc_dump()
-            ARC_Dump.__dump_int32(len(data))
-            ARC_Dump._io.write(data)
+            self._buffer.extend(self._int32(len(data)))
+            self._write(data)
         else:
             if hasattr(obj, "_arc_exclude"):
                 excludes = obj._arc_exclude
             else:
                 excludes = []
             variables = list(set(ARC_Dump._request_instance_variables(obj)) - set(excludes))
-            ARC_Dump.__dump_int32(len(variables))
+            self._write(self._int32(len(variables)))
             variables.sort()
             for variable in variables:
-                ARC_Dump._dump_string(variable)
+                self._dump_string(variable)
                 try:
                     attr = getattr(obj, variable)
                 except AttributeError:
                     attr = None
-                ARC_Dump._dump(attr)
-        
-    
-    
+                self._dump(attr)
+
+
+class ArcDecoder(object):
+
+    '''
+    Decodes the ARC data format back into an object graph.
+
+    All state lives on the instance so several files can be decoded at the
+    same time from different threads, one decoder per file. The whole
+    stream is read up front and parsed from memory.
+    '''
+
+    _int32 = Struct("<I").unpack_from
+    _float = Struct("<f").unpack_from
+
+    def __init__(self, redirects={}, extended_namespace={}):
+        self._class_path_redirects = redirects
+        self._extended_namespace = dict(extended_namespace)
+        self._extended_namespace.update(globals())
+        self._data = b""
+        self._pos = 0
+        self._strings = [None]
+        self._arrays = [None]
+        self._hashes = [None]
+        self._objects = [None]
+        self._dispatch = {
+            ARC_Dump._TYPES["NoneClass"][0]: self._load_none,
+            ARC_Dump._TYPES["FalseClass"][0]: self._load_false,
+            ARC_Dump._TYPES["TrueClass"][0]: self._load_true,
+            ARC_Dump._TYPES["Fixnum"][0]: self._load_fixnum,
+            ARC_Dump._TYPES["Bignum"][0]: self._load_bignum,
+            ARC_Dump._TYPES["Float"][0]: self._load_float,
+            ARC_Dump._TYPES["String"][0]: self._load_string,
+            ARC_Dump._TYPES["Array"][0]: self._load_array,
+            ARC_Dump._TYPES["Hash"][0]: self._load_hash,
+            ARC_Dump._TYPES["Object"][0]: self._load_object,
+            }
+
+    def load(self, io):
+        header = io.read(4)
+        if ARC_Dump._HEADER != header:
+            raise TypeError("Error: header mismatch! Expected: %s Found: %s" %(repr(ARC_Dump._HEADER), repr(header)))
+        version = io.read(2)
+        if ARC_Dump._VERSION != version:
+            raise TypeError("Error: version mismatch! Expected: %s Found: %s" %(repr(ARC_Dump._VERSION), repr(version)))
+        try:
+            start = io.tell()
+        except Exception:
+            start = None
+        self._data = io.read()
+        self._pos = 0
+        try:
+            data = self._load()
+        except Exception:
+            if start is not None:
+                print("stream position: %s" % (start + self._pos))
+            raise
+        finally:
+            # leave the stream just after the data that was decoded
+            if start is not None and io.seekable():
+                io.seek(start + self._pos)
+            self._data = b""
+        return data
+
+    def _read(self, size):
+        start = self._pos
+        self._pos += size
+        if self._pos > len(self._data):
+            raise EOFError("Error: unexpected end of data")
+        return self._data[start:self._pos]
+
+    def _load_int32(self):
+        value = self._int32(self._data, self._pos)[0]
+        self._pos += 4
+        return value
+
+    def _get_class_object(self, class_path):
+        classes = class_path.split("::")
+        if classes[0] not in self._extended_namespace:
+            raise TypeError("Class not defined: %s" % classes[0])	
+        classe = self._extended_namespace[classes.pop(0)]
+        for c in classes:
+            if c not in classe.__dict__:
+                raise TypeError("Class not defined: %s" % c)
+            classe = classe.__dict__[c]
+        return classe
+
     @staticmethod
-    def _load_none():
+    def _find_mapped(table, id_num):
+        if id_num < len(table):
+            return table[id_num]
+        else:
+            return None
+
+    def _load(self):
+        try:
+            type_id = self._data[self._pos]
+        except IndexError:
+            raise EOFError("Error: unexpected end of data")
+        self._pos += 1
+        handler = self._dispatch.get(type_id)
+        if handler is None:
+            raise TypeError("Error: Unknown type 0x%02X detected!" % type_id)
+        return handler()
+
+    def _load_none(self):
         return None
-    
 
-    @staticmethod
-    def _load_false():
+    def _load_false(self):
         return False
-    
 
-    @staticmethod
-    def _load_true():
+    def _load_true(self):
         return True
-    
-    
-    @staticmethod
-    def _load_fixnum():
-        return ARC_Dump.__load_int32()
-    
-    
-    @staticmethod
-    def _load_bignum():
-        return ARC_Dump.__load_int32() # our C++ implementation uses a "long" of 32 bit
-    
-    
-    @staticmethod
-    def _load_float():
-        return unpack("<f", ARC_Dump._io.read(4))[0]
-    
-    
-    @staticmethod
-    def _load_string():
-        id_num = ARC_Dump.__load_int32()
-        obj = ARC_Dump.__find_mapped(ARC_Dump._strings, id_num)
-        if obj != None:
+
+    def _load_fixnum(self):
+        return self._load_int32()
+
+    def _load_bignum(self):
+        return self._load_int32() # our C++ implementation uses a "long" of 32 bit
+
+    def _load_float(self):
+        value = self._float(self._data, self._pos)[0]
+        self._pos += 4
+        return value
+
+    def _load_string(self):
+        id_num = self._load_int32()
+        obj = self._find_mapped(self._strings, id_num)
+        if obj is not None:
             return obj
-        size = ARC_Dump.__load_int32()
-        obj = ARC_Dump._io.read(size).decode('utf-8')
-        ARC_Dump.__map(ARC_Dump._strings, obj)
+        size = self._load_int32()
+        obj = self._read(size).decode('utf-8')
+        self._strings.append(obj)
         return obj
-    
-    
-    @staticmethod
-    def _load_array():
-        id_num = ARC_Dump.__load_int32()
-        obj = ARC_Dump.__find_mapped(ARC_Dump._arrays, id_num)
-        if obj != None:
+
+    def _load_array(self):
+        id_num = self._load_int32()
+        obj = self._find_mapped(self._arrays, id_num)
+        if obj is not None:
             return obj
-        size = ARC_Dump.__load_int32()
+        size = self._load_int32()
         obj = []
-        ARC_Dump.__map(ARC_Dump._arrays, obj)
+        self._arrays.append(obj)
         for i in range(size):
-            obj.append(ARC_Dump._load())
+            obj.append(self._load())
         return obj
-    
-    
-    @staticmethod
-    def _load_hash():
-        id_num = ARC_Dump.__load_int32()
-        obj = ARC_Dump.__find_mapped(ARC_Dump._hashes, id_num)
-        if obj != None:
+
+    def _load_hash(self):
+        id_num = self._load_int32()
+        obj = self._find_mapped(self._hashes, id_num)
+        if obj is not None:
             return obj
-        size = ARC_Dump.__load_int32()
+        size = self._load_int32()
         obj = {}
-        ARC_Dump.__map(ARC_Dump._hashes, obj)
+        self._hashes.append(obj)
         for i in range(size):
-            # obj[key] can be evaluated after the second ARC_Dump._load, this makes sure the key is loaded first
-            key = ARC_Dump._load()
-            obj[key] = ARC_Dump._load()
+            # obj[key] can be evaluated after the second self._load, this makes sure the key is loaded first
+            key = self._load()
+            obj[key] = self._load()
         return obj
-    
-    
-    @staticmethod
-    def _load_object():
-        class_path = ARC_Dump._load()
-        obj = ARC_Dump.__find_mapped(ARC_Dump._objects, ARC_Dump.__load_int32())
-        if obj != None:
+
+    def _load_object(self):
+        class_path = self._load()
+        obj = self._find_mapped(self._objects, self._load_int32())
+        if obj is not None:
             return obj
-        classe = ARC_Dump.__get_class_object(class_path)
-        size = ARC_Dump.__load_int32()
+        classe = self._get_class_object(class_path)
+        size = self._load_int32()
         if hasattr(classe, "_arc_load"):
-            obj = classe._arc_load(ARC_Dump._io.read(size))
-            ARC_Dump.__map(ARC_Dump._objects, obj)
+            obj = classe._arc_load(self._read(size))
+            self._objects.append(obj)
             return obj
         obj = classe.__new__(classe)
-        ARC_Dump.__map(ARC_Dump._objects, obj)
+        self._objects.append(obj)
         for i in range(size):
-            setattr(obj, ARC_Dump._load(), ARC_Dump._load())
+            setattr(obj, self._load(), self._load())
         return obj
-    
+
 global Dump, Load
 Dump = ARC_Dump.dump
 Load = ARC_Dump.load
\ No newline at end of file
@@ -24,6 +24,8 @@ def NewProject(mainwindow):
         result = dlg.ShowModal()
         if result == wx.YES:
             kernel.Syatem.load("SaveProjectHandler")()
+        # the files are written in the background, finish before moving on
+        current_project.waitForSave()
     # pull the dialog for the newproject
     dlg = NewProject_Dialog(mainwindow)
     result = dlg.ShowModal()
@@ -77,6 +79,8 @@ def OpenProject(mainwindow, filehistory, path=""):
         result = dlg.ShowModal()
         if result == wx.YES:
             kernel.Syatem.load("SaveProjectHandler")()
+        # the files are written in the background, finish before moving on
+        current_project.waitForSave()
     # now lets open a project
     if path == "":
         # if we open the project through file history we alrady have a path
@@ -140,11 +144,14 @@ def SaveProject():
     kernel.System.fire_event("SaveProject")
     if "PROJECT" in kernel.GlobalObjects and (kernel.GlobalObjects["PROJECT"] is not None):
         project = kernel.GlobalObjects["PROJECT"]
-        if "CurrentProjectDir" in kernel.GlobalObjects and not (kernel.GlobalObjects["CurrentProjectDir"] == ""):
-            path = kernel.GlobalObjects["CurrentProjectDir"]
+        if project.getProjectPath() != "":
+            # save in place, only the changed files are written
+            path = ""
+        elif "CurrentProjectDir" in kernel.GlobalObjects and not (kernel.GlobalObjects["CurrentProjectDir"] == ""):
+            path = os.path.join(kernel.GlobalObjects["CurrentProjectDir"], "Project.arcproj")
         else:
             path = os.path.join(
-                wx.StandardPaths.Get().GetDocumentsDir(), "ARC", "TEMP_No_project_dirrectory_save")
+                wx.StandardPaths.Get().GetDocumentsDir(), "ARC", "TEMP_No_project_dirrectory_save", "Project.arcproj")
         projectsaver = ARCProjectSaver(project)
         # this might take a while lets say we busy
         kernel.StatusBar.BeginTask(1, "Saving Project")
@@ -1,34 +1,35 @@
-from .database_actions import DatabaseAction
-from .database_actions import TableEditAction
-from .database_actions import ArmorEditAction
-from .database_actions import ActorEditAction
-from .database_actions import ClassEditAction
-from .database_actions import LearningEditAction
-from .database_actions import TroopEditAction
-from .database_actions import SkillEditAction
-from .database_actions import WeaponEditAction
-from .database_actions import ItemEditActon
-from .database_actions import AnimationFrameEditAction
-from .database_actions import AnimationEditAction
-from .database_actions import AnimationTimingEditAction
-from .database_actions import AudioFileEditAction
-from .database_actions import EnemyEditAction
-from .database_actions import EnemyActionEditAction
-from .database_actions import EventEditAction
-from .database_actions import EventPageEditAction
-from .database_actions import EventConditionEditAction
-from .database_actions import EventGraphicEditAction
-from .database_actions import EventCommandEditAction
-from .database_actions import CommonEventEditAction
-from .database_actions import MapEditAction
-from .database_actions import MapInfoEditAction
-from .database_actions import MoveCommandEditAction
-from .database_actions import MoveRouteEditAction
-from .database_actions import StateEditAction
-from .database_actions import SystemEditAction
-from .database_actions import TestBattlerEditAction
-from .database_actions import WordsEditAction
-from .database_actions import TilesetEditAction
-from .database_actions import TroopPageEditAction
-from .database_actions import TroopConditionEditAction
-from .database_actions import MemberEditAction
+from .data_actions import DataAction
+from .data_actions import TableEditAction
+from .data_actions import ArmorEditAction
+from .data_actions import ActorEditAction
+from .data_actions import ClassEditAction
+from .data_actions import LearningEditAction
+from .data_actions import TroopEditAction
+from .data_actions import SkillEditAction
+from .data_actions import WeaponEditAction
+from .data_actions import ItemEditActon
+from .data_actions import AnimationFrameEditAction
+from .data_actions import AnimationEditAction
+from .data_actions import AnimationTimingEditAction
+from .data_actions import AudioFileEditAction
+from .data_actions import EnemyEditAction
+from .data_actions import EnemyActionEditAction
+from .data_actions import EventObjectEditAction
+from .data_actions import EventEditAction
+from .data_actions import EventPageEditAction
+from .data_actions import EventConditionEditAction
+from .data_actions import EventGraphicEditAction
+from .data_actions import EventCommandEditAction
+from .data_actions import CommonEventEditAction
+from .data_actions import MapEditAction
+from .data_actions import MapInfoEditAction
+from .data_actions import MoveCommandEditAction
+from .data_actions import MoveRouteEditAction
+from .data_actions import StateEditAction
+from .data_actions import SystemEditAction
+from .data_actions import TestBattlerEditAction
+from .data_actions import WordsEditAction
+from .data_actions import TilesetEditAction
+from .data_actions import TroopPageEditAction
+from .data_actions import TroopConditionEditAction
+from .data_actions import MemberEditAction
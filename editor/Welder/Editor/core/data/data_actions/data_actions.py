@@ -3,7 +3,7 @@ import numpy
 
 import welder_kernel as kernel
 
-from PyitectConsumes import Table, ActionTemplate
+from PyitectConsumes import Table, EventIndex, ActionTemplate
 
 
 class DataAction(ActionTemplate):
@@ -46,6 +46,8 @@ class DataAction(ActionTemplate):
         result &= self.apply_extra()
         if not result:
             self.undo_keys()
+        else:
+            kernel.System.fire_event("DataEdited", self.type, self.obj)
         return result
 
     def do_undo(self):
@@ -55,16 +57,20 @@ class DataAction(ActionTemplate):
         result &= self.undo_extra()
         if not result:
             self.apply_keys()
+        else:
+            kernel.System.fire_event("DataEdited", self.type, self.obj)
         return result
 
     def apply_keys(self):
         keys_applyed = []
         try:
-            for key, value in self.data:
+            for key, value in self.data.items():
                 if key in self.keys:
                     if hasattr(self.obj, key):
-                        self.old_data[key] = copy(getattr(self.obj, key))
-                        setattr(self.obj, key, copy(value))
+                        new_value = copy(value)
+                        self.old_data[key] = DataAction.makeDelta(
+                            getattr(self.obj, key), new_value)
+                        setattr(self.obj, key, new_value)
                         keys_applyed.append(key)
             return True
         except Exception:
@@ -75,7 +81,8 @@ class DataAction(ActionTemplate):
             try:
                 for key in keys_applyed:
                     self.data[key] = getattr(self.obj, key)
-                    setattr(self.obj, key, self.old_data[key])
+                    setattr(self.obj, key, DataAction.applyDelta(
+                        self.old_data[key], self.data[key]))
                 kernel.Log("'Apply' Database Action(%s) sucessfuly reverted" %
                            self.type, "[DataAction]", True)
             except Exception:
@@ -91,11 +98,13 @@ class DataAction(ActionTemplate):
     def undo_keys(self):
         keys_applyed = []
         try:
-            for key, value in self.old_data:
+            for key, delta in list(self.old_data.items()):
                 if key in self.keys:
                     if hasattr(self.obj, key):
-                        self.data[key] = copy(getattr(self.obj, key))
-                        setattr(self.obj, key, copy(value))
+                        current = getattr(self.obj, key)
+                        self.data[key] = copy(current)
+                        setattr(self.obj, key,
+                                DataAction.applyDelta(delta, current))
                         keys_applyed.append(key)
             return True
         except Exception:
@@ -106,7 +115,8 @@ class DataAction(ActionTemplate):
 
             try:
                 for key in keys_applyed:
-                    self.old_data[key] = getattr(self.obj, key)
+                    self.old_data[key] = DataAction.makeDelta(
+                        getattr(self.obj, key), self.data[key])
                     setattr(self.obj, key, self.data[key])
                 kernel.Log("'Undo' Database Action(%s) sucessfuly reverted" %
                            self.type, "[DataAction]", True)
@@ -121,6 +131,56 @@ class DataAction(ActionTemplate):
     def undo_extra(self):
         return True
 
+    @staticmethod
+    def makeDelta(old, new):
+        '''
+        the old value of an attribute kept against the new value replacing
+        it, so undo only holds on to what the edit changed: a list keeps
+        the run of items between the common start and end, a Table the
+        cells that differ. anything else is kept whole
+        '''
+        if isinstance(old, list) and isinstance(new, list):
+            limit = min(len(old), len(new))
+            start = 0
+            while start < limit and DataAction.sameItem(old[start], new[start]):
+                start += 1
+            end = 0
+            while end < limit - start and DataAction.sameItem(
+                    old[-1 - end], new[-1 - end]):
+                end += 1
+            return ("list", start, end, old[start:len(old) - end])
+        if (isinstance(old, Table) and isinstance(new, Table) and
+                old.getShape() == new.getShape()):
+            indexes = numpy.flatnonzero(old._data != new._data)
+            # an index and a value take 5 times the space of a plain value
+            if len(indexes) * 5 < old._data.size:
+                return ("table", indexes, old._data.take(indexes))
+        return ("copy", copy(old))
+
+    @staticmethod
+    def applyDelta(delta, current):
+        '''
+        rebuilds the old value from a makeDelta delta and the value that
+        replaced it
+        '''
+        kind = delta[0]
+        if kind == "list":
+            start, end, items = delta[1:]
+            return current[:start] + list(items) + current[len(current) - end:]
+        if kind == "table":
+            indexes, values = delta[1:]
+            table = Table(*current.getShape())
+            table._data = current._data.copy()
+            numpy.put(table._data, indexes, values)
+            return table
+        return delta[1]
+
+    @staticmethod
+    def sameItem(a, b):
+        if a is b:
+            return True
+        return type(a) is type(b) and isinstance(a, (int, float, str)) and a == b
+
 
 class TableEditAction(ActionTemplate):
 
@@ -135,6 +195,13 @@ class TableEditAction(ActionTemplate):
         self.table = table
         self.data = data
         self.oldvalue = None
+        # resizes keep the old shape and the cells the resize cropped away
+        self.oldshape = None
+        # edits merged into this one in a compound action, first as a list
+        # of (flat indexes, old values) then packed by compact into
+        # (flat indexes, old values, new values)
+        self.cells = None
+        self.delta = None
 
     def do_apply(self):
         """
@@ -170,6 +237,10 @@ class TableEditAction(ActionTemplate):
             # if your doing a slice on a 1d table
             # put the slice tupel or list in a tuple or list like so
             # ((0,2),)
+            # for scattered cells, like a flood fill, index may also be
+            # a numpy bool array the shape of the table (a mask)
+            # or a tuple of len dim of numpy int arrays (coordinates)
+            # these keep only the cells they change for undo
             "index": (x [, y [, z]]),
 
             # the python list (pref numpy array)
@@ -180,14 +251,22 @@ class TableEditAction(ActionTemplate):
             "resize": True,
             # NOTE CAN NOT CHANGE SHAPE DIMENSION JUST SIZE
             # len(shape) == len(table.getShape())
-            "shape": (x [, y [, z]])
+            "shape": (x [, y [, z]]),
+            # optional, where the old (0, 0, 0) lands in the resized table
+            # positive values grow the table at the start (left or up)
+            "offset": (x [, y [, z]])
         }
         """
 
-        if 'resize' in self.data and self.data['resize']:
-            return self.resize_apply()
+        if self.delta is not None:
+            result = self.delta_apply(2)
+        elif 'resize' in self.data and self.data['resize']:
+            result = self.resize_apply()
         else:
-            return self.normal_apply()
+            result = self.normal_apply()
+        if result:
+            kernel.System.fire_event("DataEdited", "Table", self.table)
+        return result
 
     def resize_apply(self):
         shape = self.data['shape']
@@ -197,8 +276,30 @@ class TableEditAction(ActionTemplate):
                 " must be the same (%d for %d)"
                 % (len(shape), len(self.table.getShape())))
 
-        self.oldvalue = numpy.copy(self.table._data)
-        self.table.resize(*shape)
+        offset = self.data.get('offset')
+        self.oldshape = self.table.getShape()
+        self.oldvalue = self.lost_cells(shape, offset)
+        self.table.resize(*shape, offset=offset)
+        return True
+
+    def lost_cells(self, shape, offset):
+        '''
+        the flat indexes and values of the non zero cells that fall off the
+        table when it is resized to shape, the only ones undo can't get
+        back by resizing again
+        '''
+        data = self.table._data
+        if offset is None:
+            offset = (0,) * len(shape)
+        kept = numpy.zeros(data.shape, dtype=bool)
+        index = []
+        for old, new, shift in zip(data.shape, shape, offset):
+            skip = max(-shift, 0)
+            count = min(old - skip, new - max(shift, 0))
+            index.append(slice(skip, skip + max(count, 0)))
+        kept[tuple(index)] = True
+        indexes = numpy.flatnonzero(~kept & (data != 0))
+        return indexes, data.take(indexes)
 
     def ensure_shape(self, dim):
         if dim > 3:
@@ -209,15 +310,56 @@ class TableEditAction(ActionTemplate):
     def convert_index(self, index):
         args = []
         for index_part in index:
-            if isinstance(index_part, int):
-                args.append(index_part)
+            if isinstance(index_part, (int, numpy.integer)):
+                args.append(int(index_part))
             elif isinstance(index_part, (tuple, list)):
                 args.append(slice(*index_part))
+            elif isinstance(index_part, numpy.ndarray):
+                args.append(index_part)
             else:
                 raise TypeError(
-                    "Error: %s is not an int, tuple or list" % index_part)
+                    "Error: %s is not an int, tuple, list or array" % index_part)
         return args
 
+    def is_scatter(self):
+        '''
+        if the index is a mask or coordinate arrays rather than ints and
+        slices
+        '''
+        index = self.data.get('index')
+        if isinstance(index, numpy.ndarray):
+            return True
+        if isinstance(index, (tuple, list)):
+            return any(isinstance(part, numpy.ndarray) for part in index)
+        return False
+
+    def scatter_apply(self):
+        '''
+        writes a mask or coordinate array edit, keeping the old and new
+        values of the cells that changed as a delta. the index and value
+        are dropped afterwards, the delta is all undo and redo need
+        '''
+        index = self.data['index']
+        if isinstance(index, numpy.ndarray):
+            key = index
+        else:
+            key = tuple(self.convert_index(index))
+            if any(isinstance(part, slice) for part in key):
+                raise TypeError(
+                    "coordinate arrays can't be mixed with slices")
+        data = self.table._data
+        indexes = self.flat_indexes()
+        if key is not index:
+            # coordinates may repeat, a mask's cells are already unique
+            indexes = numpy.unique(indexes)
+        old_values = data.take(indexes)
+        self.table[key] = self.data['value']
+        new_values = data.take(indexes)
+        changed = old_values != new_values
+        self.delta = (indexes[changed], old_values[changed], new_values[changed])
+        self.data = dict(self.data, index=None, value=None)
+        return True
+
     def normal_apply(self):
         # collect data
         dim = self.data['dim']
@@ -226,6 +368,8 @@ class TableEditAction(ActionTemplate):
         # ensure the data is the right shape
         self.ensure_shape(dim)
 
+        if self.is_scatter():
+            return self.scatter_apply()
         if isinstance(index, int):
             # a 1D index
             if dim > 1:
@@ -250,13 +394,92 @@ class TableEditAction(ActionTemplate):
         return True
 
     def do_undo(self):
-        if 'resize' in self.data:
-            if self.data['resize']:
-                return self.resize_undo()
-            else:
-                return self.normal_undo()
+        if self.delta is not None:
+            result = self.delta_apply(1)
+        elif 'resize' in self.data and self.data['resize']:
+            result = self.resize_undo()
         else:
-            return self.normal_undo()
+            result = self.normal_undo()
+        if result:
+            kernel.System.fire_event("DataEdited", "Table", self.table)
+        return result
+
+    def is_resize(self):
+        return bool(self.data.get('resize'))
+
+    def flat_indexes(self):
+        '''
+        the flat (C order) indexes of the cells a normal edit covers, in
+        the order of the values it copied out
+        '''
+        shape = self.table._data.shape
+        index = self.data['index']
+        if isinstance(index, numpy.ndarray):
+            return numpy.flatnonzero(index)
+        if isinstance(index, int):
+            index = (index,)
+        if self.is_scatter():
+            parts = [numpy.asarray(part) % size for part, size in
+                     zip(self.convert_index(index), shape)]
+            return numpy.ravel_multi_index(
+                numpy.broadcast_arrays(*parts), shape).ravel()
+        axes = []
+        for part, size in zip(self.convert_index(index), shape):
+            if isinstance(part, slice):
+                axes.append(numpy.arange(*part.indices(size)))
+            else:
+                axes.append(numpy.array([part % size]))
+        return numpy.ravel_multi_index(numpy.ix_(*axes), shape).ravel()
+
+    def merge(self, action):
+        '''
+        edits of the same table are folded into one sparse delta, so a
+        brush stroke is a single action however many cells it touched
+        '''
+        if (not isinstance(action, TableEditAction) or
+                action.table is not self.table or
+                self.is_resize() or action.is_resize()):
+            return False
+        if self.cells is None:
+            self.cells = [self.changed_cells()]
+            self.oldvalue = None
+            self.delta = None
+        self.cells.append(action.changed_cells())
+        return True
+
+    def changed_cells(self):
+        '''
+        the flat indexes and old values of the cells this edit wrote
+        '''
+        if self.delta is not None:
+            return self.delta[0], self.delta[1]
+        return self.flat_indexes(), numpy.ravel(self.oldvalue)
+
+    def compact(self):
+        if self.cells is None:
+            return
+        indexes = numpy.concatenate([cells[0] for cells in self.cells])
+        values = numpy.concatenate([cells[1] for cells in self.cells])
+        # a cell painted more than once keeps the value it had first
+        indexes, first = numpy.unique(indexes, return_index=True)
+        values = values[first]
+        new_values = self.table._data.take(indexes)
+        changed = values != new_values
+        self.delta = (indexes[changed], values[changed], new_values[changed])
+        self.cells = None
+
+    def delta_apply(self, which):
+        '''
+        writes the old (which 1) or new (which 2) values of a merged
+        delta back in one scatter
+        '''
+        indexes = self.delta[0]
+        numpy.put(self.table._data, indexes, self.delta[which])
+        if len(indexes):
+            cells = numpy.unravel_index(indexes, self.table._data.shape)
+            self.table.markChanged(tuple(
+                slice(int(axis.min()), int(axis.max()) + 1) for axis in cells))
+        return True
 
     def resize_undo(self):
         shape = self.data['shape']
@@ -265,7 +488,22 @@ class TableEditAction(ActionTemplate):
                 "new dimension and table old dimension"
                 " must be the same (%d for %d)"
                 % (len(shape), len(self.table.getShape())))
-        self.table._data[:] = self.oldvalue[:]
+        # resizing back with the opposite offset restores the cells both
+        # sizes share, the journal covers the cropped ones put back after
+        offset = self.data.get('offset')
+        if offset is not None:
+            offset = tuple(-shift for shift in offset)
+        self.table.resize(*self.oldshape, offset=offset)
+        indexes, values = self.oldvalue
+        numpy.put(self.table._data, indexes, values)
+        return True
+
+    def getSize(self):
+        # the table itself belongs to the project, not the action
+        return (ActionTemplate.sizeOf(self.data) +
+                ActionTemplate.sizeOf(self.oldvalue) +
+                ActionTemplate.sizeOf(self.cells) +
+                ActionTemplate.sizeOf(self.delta))
 
     def normal_undo(self):
         # collect data
@@ -796,7 +1034,25 @@ class EnemyActionEditAction(DataAction):
             'condition_switch_id', 'rating')
 
 
-class EventEditAction(DataAction):
+class EventObjectEditAction(DataAction):
+
+    '''
+    base of the actions that edit an event or a part of one, tells the
+    map views about the edit through the "EventEdited" kernel event
+    '''
+
+    def apply_extra(self):
+        EventIndex.eventChanged(self.obj)
+        kernel.System.fire_event("EventEdited", self.obj)
+        return True
+
+    def undo_extra(self):
+        EventIndex.eventChanged(self.obj)
+        kernel.System.fire_event("EventEdited", self.obj)
+        return True
+
+
+class EventEditAction(EventObjectEditAction):
 
     ''' edits an Event Object '''
 
@@ -807,7 +1063,7 @@ class EventEditAction(DataAction):
         self.addKeys('id', 'name', 'x', 'y', 'pages')
 
 
-class EventPageEditAction(DataAction):
+class EventPageEditAction(EventObjectEditAction):
 
     ''' edits a Event::Page object '''
 
@@ -836,7 +1092,7 @@ class EventConditionEditAction(DataAction):
             'variable_id', 'variable_value', 'self_switch_ch')
 
 
-class EventGraphicEditAction(DataAction):
+class EventGraphicEditAction(EventObjectEditAction):
 
     ''' edits a Event::Page::Graphic '''
 
@@ -914,6 +1170,8 @@ class MapEditAction(DataAction):
                     "Exception reverting failed 'Apply' Map Edit Action, "
                     "Possible Project coruption", "[DataAction]", True, True)
             result = False
+        if result:
+            kernel.System.fire_event("MapEdited", self.obj)
         return result
 
     def undo_extra(self):
@@ -944,6 +1202,8 @@ class MapEditAction(DataAction):
                 kernel.Log(
                     "Exception reverting failed 'Undo' Map Edit Action, "
                     "Possible Project coruption", "[DataAction]", True, True)
+        if result:
+            kernel.System.fire_event("MapEdited", self.obj)
         return result
 
 
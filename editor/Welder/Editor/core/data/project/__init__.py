@@ -2,6 +2,25 @@ from .project import Project
 from .project import AdvancedDataHandler
 from .project import ARCProjectCreator
 from .project import ARCProjectSaveFunction
+from .project import ARCProjectEncodeFunction
+from .project import ARCProjectWriteFunction
+from .project import ARCProjectSaveContext
+from .project import AtomicWriteFile
 from .project import ARCProjectLoadFunction
+from .project import ARCProjectLoadContext
+from .project import ARCProjectCopyFunction
+from .project import DeferredDataStore
 from .project import ARCProjectSaver
 from .project import ARCProjectLoader
+from .project import ProjectDataEdited
+
+
+def bind_on_enable():
+    import welder_kernel as kernel
+
+    # edits mark the records they touch, and their files, as changed
+    kernel.System.bind_event("DataEdited", ProjectDataEdited)
+    kernel.Log(
+        "Project: bound ProjectDataEdited to 'DataEdited'",
+        "[PLUGIN]"
+    )
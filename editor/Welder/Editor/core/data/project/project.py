@@ -5,36 +5,298 @@ Contains data for a open project
 
 '''
 import os
+import sys
 import time
 import configparser
 import zipfile
+import shutil
 import re
+import io
+import json
+import zlib
+import hashlib
 import copy
+import concurrent.futures
 
 import collections
 
 import welder_kernel as kernel
 
-from PyitectConsumes import ARCDataDumpFunction, ARCDataLoadFunction
+from PyitectConsumes import ARCDataDumpFunction, ArcDecoder
+
+
+class DeferredDataStore(collections.OrderedDict):
+
+    '''
+    keeps deferred data (maps) as key -> [changed, value, size] in least
+    recently used order. once the total size goes over the budget clean
+    entries are dropped oldest first, they are decoded again from disk the
+    next time they are requested. changed entries stay until saved and
+    pinned entries (ie. a map open in an editor panel, see pin) are never
+    dropped. entries are added and removed with put and drop so the total
+    size is kept as they change
+    '''
+
+    def __init__(self, budget=0):
+        super(DeferredDataStore, self).__init__()
+        # in bytes, 0 means no limit
+        self.budget = budget
+        self.total = 0
+        # key -> number of holders
+        self.pins = {}
+
+    def put(self, key, changed, value, size):
+        if key in self:
+            self.total -= self[key][2]
+        self[key] = [changed, value, size]
+        self.total += size
+        self.touch(key)
+
+    def drop(self, key):
+        self.total -= self[key][2]
+        del self[key]
+
+    def touch(self, key):
+        if key in self:
+            self.move_to_end(key)
+
+    def size(self):
+        return self.total
+
+    def pin(self, key):
+        '''
+        keeps key in the store until it is released as often as pinned
+        '''
+        self.pins[key] = self.pins.get(key, 0) + 1
+
+    def release(self, key):
+        count = self.pins.get(key, 0) - 1
+        if count > 0:
+            self.pins[key] = count
+        else:
+            self.pins.pop(key, None)
+
+    def trim(self, keep=None):
+        '''
+        drops clean, unpinned entries oldest first until the store fits its
+        budget, keep is a key the caller is about to hand out
+        '''
+        evicted = []
+        if self.budget <= 0:
+            return evicted
+        for key in list(self.keys()):
+            if self.total <= self.budget:
+                break
+            if self[key][0] or key in self.pins or key == keep:
+                continue
+            self.drop(key)
+            evicted.append(key)
+        return evicted
+
+    @staticmethod
+    def estimateSize(obj):
+        '''
+        rough estimate of the memory held by a decoded object graph
+        '''
+        size = 0
+        seen = set()
+        stack = [obj]
+        while stack:
+            item = stack.pop()
+            if id(item) in seen:
+                continue
+            seen.add(id(item))
+            if hasattr(item, "nbytes"):
+                # numpy arrays, ie. the data of a Table
+                size += item.nbytes
+            else:
+                size += sys.getsizeof(item)
+            if isinstance(item, (list, tuple)):
+                stack.extend(item)
+            elif isinstance(item, dict):
+                stack.extend(item.keys())
+                stack.extend(item.values())
+            elif hasattr(item, "__dict__"):
+                stack.extend(item.__dict__.values())
+        return size
+
+
+class BackupStore(object):
+
+    '''
+    content addressed incremental backups of a project folder. every file
+    is stored once under objects/ keyed by the sha1 of its contents and a
+    snapshot is a small json manifest mapping relative paths to hashes, so
+    taking a snapshot only copies the files that changed since the last
+    one. file hashes are cached by size and modification time so unchanged
+    files are not even read again
+    '''
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.objects_path = os.path.join(self.path, "objects")
+        self.index_path = os.path.join(self.path, "index.json")
+
+    def objectPath(self, digest):
+        return os.path.join(self.objects_path, digest[:2], digest)
+
+    def loadIndex(self):
+        try:
+            with open(self.index_path, "r") as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def saveIndex(self, index):
+        AtomicWriteFile(self.index_path, json.dumps(index).encode("utf-8"))
+
+    def hashFile(self, path, index, rel_path):
+        stat = os.stat(path)
+        cached = index.get(rel_path)
+        if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2], None
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha1(data).hexdigest()
+        index[rel_path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest, data
+
+    def snapshot(self, folder, rel_path, manifest_path):
+        '''
+        records every file under folder (stored as rel_path/...) and writes
+        the manifest, returns the number of files that had to be stored
+        '''
+        index = self.loadIndex()
+        files = {}
+        stored = 0
+        folder = os.path.abspath(folder)
+        for root, dirs, names in os.walk(folder):
+            for name in names:
+                path = os.path.join(root, name)
+                rel = os.path.join(rel_path, os.path.relpath(path, folder)).replace(os.sep, "/")
+                digest, data = self.hashFile(path, index, rel)
+                object_path = self.objectPath(digest)
+                if not os.path.exists(object_path):
+                    if data is None:
+                        with open(path, "rb") as f:
+                            data = f.read()
+                    if not os.path.isdir(os.path.dirname(object_path)):
+                        os.makedirs(os.path.dirname(object_path))
+                    AtomicWriteFile(object_path, zlib.compress(data))
+                    stored += 1
+                files[rel] = digest
+        manifest = {"created": time.time(), "files": files}
+        AtomicWriteFile(manifest_path, json.dumps(manifest, indent=1, sort_keys=True).encode("utf-8"))
+        self.saveIndex(index)
+        return stored
+
+    @staticmethod
+    def readManifest(manifest_path):
+        with open(manifest_path, "r") as f:
+            return json.load(f)
+
+    def readObject(self, digest):
+        with open(self.objectPath(digest), "rb") as f:
+            return zlib.decompress(f.read())
+
+    def restore(self, manifest_path, target, filename=None):
+        '''
+        writes the files of a snapshot back under target, only the file
+        matching filename (a relative path or a bare file name) if given.
+        returns the relative paths restored
+        '''
+        files = self.readManifest(manifest_path)["files"]
+        if filename is not None:
+            filename = filename.replace(os.sep, "/")
+            files = dict((rel, digest) for rel, digest in files.items()
+                         if rel == filename or rel.rsplit("/", 1)[-1] == filename)
+        for rel, digest in files.items():
+            path = os.path.join(target, *rel.split("/"))
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            AtomicWriteFile(path, self.readObject(digest))
+        return sorted(files.keys())
+
+    def collectGarbage(self, manifest_paths):
+        '''
+        removes the stored files no longer referenced by any of the given
+        manifests
+        '''
+        referenced = set()
+        for manifest_path in manifest_paths:
+            try:
+                referenced.update(self.readManifest(manifest_path)["files"].values())
+            except (IOError, ValueError, KeyError):
+                # an unreadable manifest can't be restored from anyway
+                continue
+        if not os.path.isdir(self.objects_path):
+            return 0
+        removed = 0
+        for root, dirs, names in os.walk(self.objects_path):
+            for name in names:
+                if name not in referenced:
+                    os.remove(os.path.join(root, name))
+                    removed += 1
+        return removed
 
 
 class Project(object):
 
+    # the data file edits of each type of DataAction land in, for the
+    # objects locateObject can't find. EventCommandFormater reads it too
+    data_types = {
+        "Actor": "Actors", "Animation": "Animations",
+        "AnimationFrame": "Animations", "AnimationTiming": "Animations",
+        "Armor": "Armors", "Class": "Classes", "CommonEvent": "CommonEvents",
+        "Enemy": "Enemies", "EnemyAction": "Enemies", "Item": "Items",
+        "Learning": "Classes", "MapInfo": "MapInfos", "Skill": "Skills",
+        "State": "States", "System": "System", "Tileset": "Tilesets",
+        "Troop": "Troops", "Weapon": "Weapons", "Words": "System"
+    }
+
     def __init__(self):
         self._data = {}
-        self._deferred_data = {}
+        self._deferred_data = DeferredDataStore(self.getDeferredBudget())
         self._info = {}
+        # data key -> set of the indexes/keys of the objects changed in it
+        self._changed_objects = {}
+        # id of every object in the loaded data -> (object, data key,
+        # index), see indexData
+        self._locations = {}
+        # data key -> ids indexed for it
+        self._indexed = {}
+        self._save_executor = None
+        self._pending_saves = []
+        self._backup_executor = None
+        # data key -> seconds it took to encode and write the file
+        self.save_timings = {}
         self.advanced_handlers = {}
         self.project_path = ""
         self.load_func = None
+        self.load_context_func = None
         self.save_func = None
+        self.save_context_func = None
+        self.encode_func = None
+        self.write_func = None
 
     def setLoadFunc(self, func):
         self.load_func = func
 
+    def setLoadContextFunc(self, func):
+        self.load_context_func = func
+
     def setSaveFunc(self, func):
         self.save_func = func
 
+    def setSaveContextFunc(self, func):
+        self.save_context_func = func
+
+    def setEncodeFunc(self, func):
+        self.encode_func = func
+
+    def setWriteFunc(self, func):
+        self.write_func = func
+
     def setProjectPath(self, path):
         self.project_path = path
 
@@ -44,15 +306,18 @@ class Project(object):
     def setData(self, key, value, changed=True):
         if key in self._data:
             self._data[key][0] = changed
-            self._data[key][1] = value
+            if self._data[key][1] is not value:
+                self._data[key][1] = value
+                self.indexData(key, value)
         else:
             self._data[key] = [changed, value]
+            self.indexData(key, value)
 
     def getData(self, key):
         if key in self._data:
             return self._data[key][1]
         else:
-            Kernel.Log("Warning: data key %s does not exist. Returned None" % key, "[Project]")
+            kernel.Log("Warning: data key %s does not exist. Returned None" % key, "[Project]")
             return None
 
     def getDataCopy(self, key):
@@ -72,23 +337,57 @@ class Project(object):
     def hasData(self, key):
         return key in self._data
 
+    def getDeferredBudget(self):
+        try:
+            budget = int(kernel.Config.getUnified()["Main"]["DeferredDataLimit"])
+        except Exception:
+            budget = 128
+        return budget * 1024 * 1024
+
     def setDeferredData(self, key, value, changed=True):
-        if key in self._deferred_data:
-            self._deferred_data[key][0] = changed
-            self._deferred_data[key][1] = value
+        entry = self._deferred_data.get(key)
+        if entry is not None and entry[1] is value:
+            # the same object, only its changed flag moves
+            size = entry[2]
         else:
-            self._deferred_data[key] = [changed, value]
+            size = DeferredDataStore.estimateSize(value)
+            self.indexData(key, value)
+        self._deferred_data.put(key, changed, value, size)
+        self.trimDeferredData(key)
 
     def getDeferredData(self, key):
         if key in self._deferred_data:
+            self._deferred_data.touch(key)
             return self._deferred_data[key][1]
         else:
             try:
-                self._deferred_data[key] = [False, self.load_func(os.path.dirname(self.project_path), key)]
-                return self._deferred_data[key][1]
+                value = self.load_func(os.path.dirname(self.project_path), key)
             except Exception:
-                Kernel.Log("Warning: Deferred data '%s' does not exist. Returned None" % key, "[Project]")
+                kernel.Log("Warning: Deferred data '%s' does not exist. Returned None" % key, "[Project]")
                 return None
+            self._deferred_data.put(key, False, value, DeferredDataStore.estimateSize(value))
+            self.indexData(key, value)
+            # make room for it
+            self.trimDeferredData(key)
+            return value
+
+    def hasDeferredData(self, key):
+        return key in self._deferred_data
+
+    def pinDeferredData(self, key):
+        '''
+        keeps the deferred data of key loaded while it is open in an
+        editor, call releaseDeferredData once for each pin when done
+        '''
+        self._deferred_data.pin(key)
+
+    def releaseDeferredData(self, key):
+        self._deferred_data.release(key)
+        self.trimDeferredData()
+
+    def trimDeferredData(self, keep=None):
+        for key in self._deferred_data.trim(keep):
+            self.unindexData(key)
 
     def setInfo(self, key, value, changed=True):
         if key.lower() in self._info:
@@ -101,7 +400,7 @@ class Project(object):
         if key.lower() in self._info:
             return self._info[key.lower()][1]
         else:
-            Kernel.Log("Warning: info key %s does not exist. Returned None" % key, "[Project]")
+            kernel.Log("Warning: info key %s does not exist. Returned None" % key, "[Project]")
             return None
 
     def hasInfo(self, key):
@@ -111,7 +410,7 @@ class Project(object):
         if key.lower() in self._info:
             self._info[key.lower()][0] = value
         else:
-            Kernel.Log("Info key %s does not exist. change flag not set" % key, "[Project]")
+            kernel.Log("Info key %s does not exist. change flag not set" % key, "[Project]")
 
     def getChangedInfo(self, key):
         if key.lower() in self._info:
@@ -122,8 +421,10 @@ class Project(object):
     def setChangedData(self, key, value):
         if key in self._data:
             self._data[key][0] = value
+            if not value:
+                self._changed_objects.pop(key, None)
         else:
-            Kernel.Log("Data key %s does not exist. changed flag not set" % key, "[Project]")
+            kernel.Log("Data key %s does not exist. changed flag not set" % key, "[Project]")
 
     def getChangedData(self, key):
         if key in self._data:
@@ -134,8 +435,10 @@ class Project(object):
     def setChangedDeferredData(self, key, value):
         if key in self._deferred_data:
             self._deferred_data[key][0] = value
+            if not value:
+                self._changed_objects.pop(key, None)
         else:
-            Kernel.Log("Deferred data key %s does not exist. changed flag not set" % key, "[Project]")
+            kernel.Log("Deferred data key %s does not exist. changed flag not set" % key, "[Project]")
 
     def getChangedDeferredData(self, key):
         if key in self._deferred_data:
@@ -143,14 +446,131 @@ class Project(object):
         else:
             return False
 
+    def setChangedObject(self, key, index):
+        '''
+        marks a single object inside a data file as changed, ie. one actor
+        in "Actors" or one common event in "CommonEvents". the file it
+        lives in is written on the next save
+        '''
+        if key in self._data:
+            self._data[key][0] = True
+        elif key in self._deferred_data:
+            self._deferred_data[key][0] = True
+        else:
+            kernel.Log("Data key %s does not exist. changed flag not set" % key, "[Project]")
+            return
+        self._changed_objects.setdefault(key, set()).add(index)
+
+    def getChangedObjects(self, key):
+        return set(self._changed_objects.get(key, ()))
+
+    def onDataEdited(self, type, obj):
+        '''
+        marks the record an edit touched, and the file it is saved in, as
+        changed
+        '''
+        location = self.locateObject(obj)
+        if location is not None:
+            # take in the objects the edit added
+            key, index = location
+            if obj is self.getLoadedData(key):
+                self.indexData(key, obj)
+            else:
+                self.indexObjects(obj, key, index)
+        elif type in Project.data_types:
+            location = (Project.data_types[type], None)
+        if location is not None:
+            self.setChangedObject(*location)
+
+    def locateObject(self, obj):
+        '''
+        the data key and index of the record obj belongs to, ie.
+        ("Actors", 3) for an actor or one of its tables and ("Map004", 12)
+        for an event on that map, one of its pages or one of their
+        commands. the index is None for a whole file, a map or its tiles.
+        None if obj is not in any loaded data
+        '''
+        location = self._locations.get(id(obj))
+        if location is None or location[0] is not obj:
+            return None
+        return location[1], location[2]
+
+    def getLoadedData(self, key):
+        '''
+        the data or deferred data of key if it is loaded, without loading it
+        '''
+        if key in self._data:
+            return self._data[key][1]
+        if key in self._deferred_data:
+            return self._deferred_data[key][1]
+        return None
+
+    def indexData(self, key, value):
+        '''
+        remembers the location of every object in the data file value for
+        locateObject. the records of a file are the entries of a list or
+        dict and the events of a map, everything else in it belongs to the
+        whole file
+        '''
+        self.unindexData(key)
+        records = ()
+        if isinstance(value, list):
+            records = enumerate(value)
+        elif isinstance(value, dict):
+            records = value.items()
+        elif hasattr(value, "events"):
+            records = value.events.items()
+            self.indexObjects(value, key, None, skip=value.events)
+        else:
+            self.indexObjects(value, key, None)
+        for index, record in records:
+            if record is not None:
+                self.indexObjects(record, key, index)
+
+    def indexObjects(self, obj, key, index, skip=None):
+        '''
+        files obj and every object reachable from its attributes, lists
+        and dicts under key and index
+        '''
+        locations = self._locations
+        ids = self._indexed.setdefault(key, set())
+        seen = set()
+        stack = [obj]
+        while stack:
+            obj = stack.pop()
+            if obj is skip or id(obj) in seen:
+                continue
+            seen.add(id(obj))
+            if isinstance(obj, list):
+                stack.extend(obj)
+            elif isinstance(obj, dict):
+                stack.extend(obj.values())
+            elif hasattr(obj, "__dict__"):
+                locations[id(obj)] = (obj, key, index)
+                ids.add(id(obj))
+                stack.extend(obj.__dict__.values())
+
+    def unindexData(self, key):
+        locations = self._locations
+        for obj_id in self._indexed.pop(key, ()):
+            location = locations.get(obj_id)
+            if location is not None and location[1] == key:
+                del locations[obj_id]
+
     def getMapData(self, id_num):
         return self.getDeferredData("Map%03d" % id_num)
 
     def setMapData(self, id_num, value, changed=True):
         self.setDeferredData("Map%03d" % id_num, value, changed)
 
+    def pinMapData(self, id_num):
+        self.pinDeferredData("Map%03d" % id_num)
+
+    def releaseMapData(self, id_num):
+        self.releaseDeferredData("Map%03d" % id_num)
+
     def getChangedMapData(self, id_num):
-        self.getChangedDeferredData("Map%03d" % id_num)
+        return self.getChangedDeferredData("Map%03d" % id_num)
 
     def setChangedMapData(self, id_num, value):
         self.setChangedDeferredData("Map%03d" % id_num, value)
@@ -159,7 +579,7 @@ class Project(object):
         for key, value in self._data.items():
             if value[0]:
                 return True
-        for key, vlaue in self._deferred_data.items():
+        for key, value in self._deferred_data.items():
             if value[0]:
                 return True
         return False
@@ -171,26 +591,96 @@ class Project(object):
                 changed_flag = True
         return changed_flag
 
+    def canSave(self):
+        return ((self.encode_func is not None and self.write_func is not None) or
+                ((self.save_func != None) and callable(self.save_func)))
+
     def saveData(self, key):
-        if (self.save_func != None) and isinstance(self.save_func, collections.Callable):
-            Kernel.Protect(self.save_func)(os.path.dirname(self.project_path), key, self.getData(key))
+        if self.canSave():
+            objects = self.getChangedObjects(key)
             self.setChangedData(key, False)
+            self._saveFile(key, self.getData(key), False, objects)
         else:
-            Kernel.Log("Warning: no save function set for project. Data files NOT saved", "[Project]")
-       
+            kernel.Log("Warning: no save function set for project. Data files NOT saved", "[Project]")
+
     def saveDeferredData(self, key):
-        if (self.save_func != None) and isinstance(self.save_func, collections.Callable):
-            Kernel.Protect(self.save_func)(os.path.dirname(self.project_path), key, self.getDeferredData(key))
+        if self.canSave():
+            if key in self._deferred_data:
+                value = self._deferred_data[key][1]
+            else:
+                value = self.getDeferredData(key)
+            objects = self.getChangedObjects(key)
             self.setChangedDeferredData(key, False)
+            self._saveFile(key, value, True, objects)
         else:
-            Kernel.Log("Warning: no save function set for project. Data files NOT saved", "[Project]")
+            kernel.Log("Warning: no save function set for project. Data files NOT saved", "[Project]")
 
     def saveMapData(self, id_num):
-        if (self.save_func != None) and isinstance(self.save_func, collections.Callable):
-            self.save_func(os.path.dirname(self.project_path), "Map%03d" % id_num, self.getDeferredData("Map%03d" % id_num))
-            self.setChangedDeferredData("Map%03d" % id_num, False)
-        else:
-            Kernel.Log("Warning: no save function set for project. Data files NOT saved", "[Project]")
+        self.saveDeferredData("Map%03d" % id_num)
+
+    def _markUnsaved(self, key, deferred):
+        if deferred:
+            if key in self._deferred_data:
+                self._deferred_data[key][0] = True
+        elif key in self._data:
+            self._data[key][0] = True
+
+    def _saveFile(self, key, value, deferred, objects=(), args=()):
+        '''
+        encodes and writes one data file on the calling thread. the changed
+        flag is cleared before this is called, if the save fails the flag
+        is set again
+        '''
+        if self.encode_func is None or self.write_func is None:
+            start = time.perf_counter()
+            try:
+                self.save_func(os.path.dirname(self.project_path), key, value, *args)
+            except Exception:
+                kernel.Log("Exception saving data file %s. It is still marked as changed" % key, "[Project]", False, True)
+                self._markUnsaved(key, deferred)
+                return None
+            elapsed = time.perf_counter() - start
+            self.save_timings[key] = elapsed
+            kernel.Log("Saved %s in %.1f ms" % (key, elapsed * 1000), "[Project]")
+            return elapsed
+        encoded = self._encodeFile(key, value, deferred, args)
+        if encoded is None:
+            return None
+        return self._writeFile(key, deferred, objects, *encoded)
+
+    def _encodeFile(self, key, value, deferred, args=()):
+        '''
+        encodes one data file to bytes, returns them and the time it took
+        or None if it failed. always runs on the calling thread, the object
+        graph must not change while it is walked
+        '''
+        start = time.perf_counter()
+        try:
+            data = self.encode_func(key, value, *args)
+        except Exception:
+            kernel.Log("Exception encoding data file %s. It is still marked as changed" % key, "[Project]", False, True)
+            self._markUnsaved(key, deferred)
+            return None
+        return data, time.perf_counter() - start
+
+    def _writeFile(self, key, deferred, objects, data, encode_time):
+        '''
+        writes the encoded bytes of one data file, may run on the save
+        worker as it touches nothing but data
+        '''
+        start = time.perf_counter()
+        try:
+            self.write_func(os.path.dirname(self.project_path), key, data)
+        except Exception:
+            kernel.Log("Exception writing data file %s. It is still marked as changed" % key, "[Project]", False, True)
+            self._markUnsaved(key, deferred)
+            return None
+        write_time = time.perf_counter() - start
+        elapsed = encode_time + write_time
+        self.save_timings[key] = elapsed
+        kernel.Log("Saved %s (%d changed objects) in %.1f ms, encode %.1f ms, write %.1f ms" % (
+            key, len(objects), elapsed * 1000, encode_time * 1000, write_time * 1000), "[Project]")
+        return elapsed
 
     def saveInfo(self):
         config = configparser.ConfigParser()
@@ -198,6 +688,9 @@ class Project(object):
         for key, value in list(self._info.items()):
             config.set("Project", str(key), str(value[1]))
         filename = os.path.normpath(self.project_path)
+        dir_path = os.path.dirname(os.path.abspath(filename))
+        if not os.path.isdir(dir_path):
+            os.makedirs(dir_path)
         config.add_section("Files")
         filelist = ""
         files = list(self._data.keys())
@@ -208,18 +701,64 @@ class Project(object):
                 filelist += "|"
             i += 1
         config.set("Files", "List", filelist)
-        f = open(filename, 'wb')
+        f = io.StringIO()
         config.write(f)
-        f.close()
-
-    def saveProject(self, full=False):
+        AtomicWriteFile(filename, f.getvalue().encode("utf-8"))
+
+    def saveProject(self, full=False, background=False):
+        '''
+        writes the data files that changed since the last save, or all of
+        them when full is set. the files are always encoded here, on the
+        calling thread, so an edit can't land in the middle of one. with
+        background set the encoded bytes are written on the save worker
+        thread and the futures are returned, use waitForSave to block
+        until they are on disk
+        '''
+        # let any save still in flight finish first so the same file is
+        # never written by two saves at once
+        self.waitForSave()
+        if not self.canSave():
+            kernel.Log("Warning: no save function set for project. Data files NOT saved", "[Project]")
+            return []
+        jobs = []
         for key in self._data:
             if full or self.getChangedData(key):
-                self.saveData(key)
-        for key in self._deferred_data:
+                objects = self.getChangedObjects(key)
+                self.setChangedData(key, False)
+                jobs.append((key, self.getData(key), False, objects))
+        for key in list(self._deferred_data.keys()):
             if full or self.getChangedDeferredData(key):
-                self.saveDeferredData(key)
+                objects = self.getChangedObjects(key)
+                self.setChangedDeferredData(key, False)
+                jobs.append((key, self._deferred_data[key][1], True, objects))
         self.saveInfo()
+        args = ()
+        if self.save_context_func is not None:
+            args = (self.save_context_func(),)
+        if background and self.encode_func is not None and self.write_func is not None:
+            writes = []
+            for key, value, deferred, objects in jobs:
+                encoded = self._encodeFile(key, value, deferred, args)
+                if encoded is not None:
+                    writes.append((key, deferred, objects) + encoded)
+            if self._save_executor is None:
+                self._save_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            self._pending_saves = [self._save_executor.submit(self._writeFile, *write) for write in writes]
+            return list(self._pending_saves)
+        for job in jobs:
+            self._saveFile(*(job + (args,)))
+        # saved entries are no longer pinned
+        self.trimDeferredData()
+        return []
+
+    def isSaving(self):
+        return any(not future.done() for future in self._pending_saves)
+
+    def waitForSave(self):
+        if self._pending_saves:
+            concurrent.futures.wait(self._pending_saves)
+            self._pending_saves = []
+            self.trimDeferredData()
 
     def loadProject(self, backup=True):
         if os.path.exists(self.project_path):
@@ -230,55 +769,95 @@ class Project(object):
             for info in infos:
                 self.setInfo(info[0], info[1], False)
             filelist = config.get("Files", "List")
-            files = filelist.split("|")
-            for file_name in files:
-                if file_name != "":
-                    if (self.load_func != None) and isinstance(self.load_func, collections.Callable):
-                        self.setData(file_name, Kernel.Protect(self.load_func)(os.path.dirname(self.project_path), file_name), False)
-                    else:
-                        self.setData(file_name, None, False)
-                        Kernel.Log("Warning: no load function set for project. Data for %s set to None" % file_name, "[Project]")
+            files = [file_name for file_name in filelist.split("|") if file_name != ""]
+            if (self.load_func != None) and callable(self.load_func):
+                self.loadFiles(files)
+            else:
+                for file_name in files:
+                    self.setData(file_name, None, False)
+                    kernel.Log("Warning: no load function set for project. Data for %s set to None" % file_name, "[Project]")
         else:
-            Kernel.Log("Warning: project path %s does not exist. Project not loaded." % self.project_path, "[Project]")
+            kernel.Log("Warning: project path %s does not exist. Project not loaded." % self.project_path, "[Project]")
+
+    def loadFiles(self, files):
+        '''
+        decodes the data files one after another, reporting progress
+        through the status bar. a file that fails to load is logged and
+        set to None instead of aborting the open
+        '''
+        dir_name = os.path.dirname(self.project_path)
+        args = ()
+        if self.load_context_func is not None:
+            args = (self.load_context_func(),)
+        kernel.StatusBar.BeginTask(len(files), "Loading Project Data")
+        for loaded, file_name in enumerate(files, 1):
+            try:
+                value = self.load_func(dir_name, file_name, *args)
+            except Exception:
+                kernel.Log("Exception loading data file %s. Data set to None" % file_name, "[Project]", True, True)
+                value = None
+            self.setData(file_name, value, False)
+            kernel.StatusBar.updateTask(loaded, "Loaded %s" % file_name)
+        kernel.StatusBar.EndTask()
 
-    def addToZip(self, z, folder, rel_path=""):
-        folder = os.path.abspath(folder)
-        for fil in os.listdir(folder):
-            target = os.path.join(folder, fil)
-            if os.path.isfile(target):
-                z.write(target, os.path.join(rel_path, fil), zipfile.ZIP_DEFLATED)
-            elif os.path.isdir(target):
-                self.addToZip(z, target, os.path.join(rel_path, os.path.basename(target)))
+    def getBackupFolder(self):
+        return os.path.abspath(os.path.join(os.path.dirname(self.project_path), "Backups"))
 
     def Backup(self):
-        Kernel.StatusBar.BeginTask(3, "Making Project Backup")
-        Kernel.StatusBar.updateTask(0, "Ensure Backup Path")
+        '''
+        snapshots the Data folder into the backup store on a background
+        thread and returns a future for the path of the snapshot manifest
+        '''
         filename = os.path.splitext(os.path.basename(self.project_path))[0]
-        curTime = time.strftime("-%Y_%m_%d-%H_%M")
+        curTime = time.strftime("-%Y_%m_%d-%H_%M_%S")
         filename += curTime
-        filename += ".zip"
-        backupFolder = os.path.abspath(os.path.join(os.path.dirname(self.project_path), "Backups"))
-        if not os.path.exists(backupFolder) or not os.path.isdir(backupFolder):
-            os.makedirs(backupFolder)
-        zipFilename = os.path.abspath(os.path.join(backupFolder, filename))
-        z = zipfile.ZipFile(zipFilename, "w", zipfile.ZIP_DEFLATED)
-        Kernel.StatusBar.updateTask(1, "Adding Data folder to Backup")
-        self.addToZip(z, str(os.path.abspath(os.path.join(os.path.dirname(self.project_path), "Data"))), "Data")
-        z.close()
-        Kernel.StatusBar.updateTask(2, "Limiting the Number of Backups")
-        self.LimitBackups(backupFolder)
-        Kernel.StatusBar.updateTask(3, "Finished Backup")
-        Kernel.StatusBar.EndTask()
-        return zipFilename
+        backupFolder = self.getBackupFolder()
+        manifest_path = os.path.join(backupFolder, filename)
+        data_path = os.path.abspath(os.path.join(os.path.dirname(self.project_path), "Data"))
+        if self._backup_executor is None:
+            self._backup_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        return self._backup_executor.submit(self._backup, backupFolder, data_path, manifest_path)
+
+    def _backup(self, backupFolder, data_path, manifest_path):
+        start = time.perf_counter()
+        # backups run one at a time, so checking for a free name is safe
+        i = 0
+        name = manifest_path
+        while os.path.exists(name + ".json"):
+            i += 1
+            name = "%s-%d" % (manifest_path, i)
+        manifest_path = name + ".json"
+        try:
+            if not os.path.exists(backupFolder) or not os.path.isdir(backupFolder):
+                os.makedirs(backupFolder)
+            store = BackupStore(backupFolder)
+            stored = store.snapshot(data_path, "Data", manifest_path)
+            self.LimitBackups(backupFolder)
+            store.collectGarbage([backup[0] for backup in self.FindBackupFiles(backupFolder)
+                                  if backup[0].endswith(".json")])
+        except Exception:
+            kernel.Log("Exception making project backup %s" % manifest_path, "[Project]", False, True)
+            raise
+        kernel.Log("Backup %s finished in %.1f ms, %d changed files stored" % (
+            manifest_path, (time.perf_counter() - start) * 1000, stored), "[Project]")
+        return manifest_path
+
+    def waitForBackup(self):
+        if self._backup_executor is not None:
+            # queued after any backup already running
+            self._backup_executor.submit(lambda: None).result()
 
     def FindBackupFiles(self, path):
-        pattern = "%s-([0-9]+_[0-9]+_[0-9]+-[0-9]+_[0-9]+)" % os.path.splitext(os.path.basename(self.project_path))[0]
+        pattern = "%s-([0-9]+_[0-9]+_[0-9]+-[0-9]+_[0-9]+)(_[0-9]+)?" % os.path.splitext(os.path.basename(self.project_path))[0]
         namePattern = re.compile(pattern, re.IGNORECASE)
         files = []
         for fil in os.listdir(path):
             match = namePattern.search(fil)
             if match:
                 filetime = time.mktime(time.strptime(match.group(1), "%Y_%m_%d-%H_%M"))
+                if match.group(2):
+                    # seconds, older zip backups only have minutes
+                    filetime += int(match.group(2)[1:])
                 files.append([os.path.join(path, fil), filetime])
         return files
 
@@ -286,22 +865,43 @@ class Project(object):
         backups = self.FindBackupFiles(path)
         backups.sort(key=lambda backup: backup[1])
         try:
-            maxBackups = Kernel.Config.getUnified()["Main"]["MaxBackups"]
+            maxBackups = kernel.Config.getUnified()["Main"]["MaxBackups"]
         except:
             maxBackups = 10
-            Kernel.Log("Invalid setting for MaxBackups in configuration", "[Project]", error=True)
+            kernel.Log("Invalid setting for MaxBackups in configuration", "[Project]", error=True)
         if len(backups) > maxBackups:
             for i in range(len(backups) - maxBackups):
                 fil = backups.pop(0)
                 os.remove(fil[0])
 
-    def RestoreBackup(self, path):
-        backup = self.Backup()
+    def getBackupContents(self, path):
+        '''
+        the relative paths of the files held by a backup
+        '''
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path, "r") as z:
+                return [name for name in z.namelist() if not name.endswith("/")]
+        return sorted(BackupStore.readManifest(path)["files"].keys())
+
+    def RestoreBackup(self, path, filename=None):
+        '''
+        restores a backup over the project, or only the file filename
+        ("Data/Map001.arc" or just "Map001.arc") from it. a backup of the
+        current state is made first
+        '''
+        try:
+            backup = self.Backup().result()
+        except Exception:
+            kernel.Log("Could not back up the project before restoring, the backup was not restored", "[Project]", True)
+            return
+        local_path = os.path.abspath(os.path.dirname(self.project_path))
         if zipfile.is_zipfile(path):
+            # backups made before the backup store
             try:
                 z = zipfile.ZipFile(path, "r", zipfile.ZIP_DEFLATED)
-                local_path = os.path.abspath(os.path.dirname(self.project_path))
                 for fil in z.namelist():
+                    if filename is not None and fil != filename and fil.rsplit("/", 1)[-1] != filename:
+                        continue
                     member = z.getinfo(fil)
                     if member.filename[0] == '/':
                         targetpath = os.path.join(local_path, member.filename[1:])
@@ -314,9 +914,17 @@ class Project(object):
                             continue
                         z.extract(fil, local_path)
             except Exception:
-                Kernel.Log("There was an error restoring the backup, your project data may be corrupted. A backup was made before the restore was attempted, this backup can be found at %s" % backup, "[Project]", True, True)
+                kernel.Log("There was an error restoring the backup, your project data may be corrupted. A backup was made before the restore was attempted, this backup can be found at %s" % backup, "[Project]", True, True)
+        elif os.path.isfile(path):
+            try:
+                restored = BackupStore(os.path.dirname(os.path.abspath(path))).restore(path, local_path, filename)
+                if not restored:
+                    kernel.Log("File %s is not in backup %s. Nothing restored" % (filename, path), "[Project]", True)
+            except Exception:
+                kernel.Log("There was an error restoring the backup, your project data may be corrupted. A backup was made before the restore was attempted, this backup can be found at %s" % backup, "[Project]", True, True)
         else:
-            Kernel.Log("Backup file is not a valid zip file", "[Project]", True)
+            kernel.Log("Backup file is not a valid backup", "[Project]", True)
+
 
 class AdvancedDataHandler(object):
 
@@ -361,10 +969,9 @@ class ARCProjectCreator(object):
             #load the template
             self.project.setProjectPath(template[1])
             self.project.setLoadFunc(ARCProjectLoadFunction)
+            self.project.setLoadContextFunc(ARCProjectLoadContext)
             self.project.loadProject(backup=False)
-            mapinfos = self.project.getData("MapInfos")
-            for key in mapinfos:
-                self.project.getMapData(key)
+            template_dir = os.path.dirname(template[1])
         else:
             #set initial info
             self.project.setData("Actors", [], False)
@@ -387,10 +994,18 @@ class ARCProjectCreator(object):
         self.project.setChangedInfo("Title", False)
         #set the save function
         self.project.setSaveFunc(ARCProjectSaveFunction)
+        self.project.setSaveContextFunc(ARCProjectSaveContext)
+        self.project.setEncodeFunc(ARCProjectEncodeFunction)
+        self.project.setWriteFunc(ARCProjectWriteFunction)
         #set the project path
         self.project.setProjectPath(path)
         #save the project
         self.project.saveProject(full=True)
+        if template[0]:
+            #copy the template maps over without decoding them
+            mapinfos = self.project.getData("MapInfos")
+            for key in mapinfos:
+                ARCProjectCopyFunction(template_dir, os.path.dirname(path), "Map%03d" % key)
 
     def getProject(self):
         return self.project
@@ -398,38 +1013,97 @@ class ARCProjectCreator(object):
     def setProject(self, project):
         self.project = project
                    
-def ARCProjectSaveFunction(dir_name, filename, obj):
+def AtomicWriteFile(path, data):
+    '''
+    writes data to a temporary file next to path, flushes it to disk and
+    renames it over path, so a crash mid-write leaves the old file intact
+    '''
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def ARCProjectSaveContext():
+    redirects = {}
+    kernel.System.fire_event("ARCRedirectClassPathsOnSave", redirects)
+    return redirects
+
+def ARCProjectEncodeFunction(filename, obj, context=None):
+    if context is None:
+        context = ARCProjectSaveContext()
+    f = io.BytesIO()
+    ARCDataDumpFunction(f, obj, context)
+    return f.getvalue()
+
+def ARCProjectWriteFunction(dir_name, filename, data):
     dir_path = os.path.join(dir_name, "Data")
     path = os.path.join(dir_path, filename + ".arc")
     if (not os.path.exists(dir_path)) or (not os.path.isdir(dir_path)):
         os.makedirs(dir_path)
     try:
-        f = open(path, "wb")
-        redirects = {}
-        Kernel.System.fire_event("ARCRedirectClassPathsOnSave", redirects)
-        ARCDataDumpFunction(f, obj, redirects)
-        f.close()
+        AtomicWriteFile(path, data)
     except IOError:
-        Kernel.Log("IO Error encountered Saving file %s" % path, "[ARC Save Function]", True)
+        kernel.Log("IO Error encountered Saving file %s" % path, "[ARC Save Function]")
+        raise
+
+def ARCProjectSaveFunction(dir_name, filename, obj, context=None):
+    ARCProjectWriteFunction(dir_name, filename, ARCProjectEncodeFunction(filename, obj, context))
+
+def ProjectDataEdited(type, obj):
+    '''
+    marks what a DataAction edited as changed in the open project
+    '''
+    project = kernel.GlobalObjects["PROJECT"]
+    if project is not None:
+        project.onDataEdited(type, obj)
     
-def ARCProjectLoadFunction(dir_name, filename):
+def ARCProjectCopyFunction(src_dir_name, dir_name, filename):
+    src_path = os.path.join(src_dir_name, "Data", filename + ".arc")
+    dir_path = os.path.join(dir_name, "Data")
+    path = os.path.join(dir_path, filename + ".arc")
+    if not os.path.isfile(src_path):
+        kernel.Log("Warning: file %s does not exist. Not copied" % src_path, "[ARC Copy Function]")
+        return
+    if (not os.path.exists(dir_path)) or (not os.path.isdir(dir_path)):
+        os.makedirs(dir_path)
+    try:
+        shutil.copyfile(src_path, path)
+    except IOError:
+        kernel.Log("IO Error encountered copying file %s" % src_path, "[ARC Copy Function]", True)
+
+def ARCProjectLoadContext():
+    # the load events are fired here, on the calling thread, so the result
+    # can be shared by decoders running on worker threads
+    redirects = {}
+    kernel.System.fire_event("ARCRedirectClassPathsOnLoad", redirects)
+    extended_namespace = {}
+    kernel.System.fire_event("ARCExtendNamespaceOnLoad", extended_namespace)
+    return redirects, extended_namespace
+
+def ARCProjectLoadFunction(dir_name, filename, context=None):
     path = os.path.join(dir_name, "Data", filename + ".arc")
     if os.path.exists(path) and (not os.path.isdir(path)):
         try:
+            if context is None:
+                context = ARCProjectLoadContext()
+            redirects, extended_namespace = context
             f = open(path, "rb")
-            redirects = {}
-            Kernel.System.fire_event("ARCRedirectClassPathsOnLoad", redirects)
-            extended_namespace = {}
-            Kernel.System.fire_event("ARCExtendNamespaceOnLoad", extended_namespace)
-            obj = ARCDataLoadFunction(f, redirects, extended_namespace)
+            obj = ArcDecoder(redirects, extended_namespace).load(f)
             f.close()
             return obj
         except IOError:
-            Kernel.Log("IO Error encountered Loading file %s Returned None" % path, "[ARC Load Function]", True)
+            kernel.Log("IO Error encountered Loading file %s Returned None" % path, "[ARC Load Function]", True)
             return None
         
     else:
-        Kernel.Log("Warning: file %s does not exist. Returned None" % path, "[ARC Load Function]")
+        kernel.Log("Warning: file %s does not exist. Returned None" % path, "[ARC Load Function]")
         return None
     
 class ARCProjectSaver(object):
@@ -438,10 +1112,17 @@ class ARCProjectSaver(object):
         self.project = project
 
     def save(self, path=""):
+        # saving to a new location has to write every file, not just the
+        # changed ones
+        full = False
         if not path == "":
+            full = os.path.normpath(path) != os.path.normpath(self.project.getProjectPath())
             self.project.setProjectPath(path)
         self.project.setSaveFunc(ARCProjectSaveFunction)
-        self.project.saveProject()
+        self.project.setSaveContextFunc(ARCProjectSaveContext)
+        self.project.setEncodeFunc(ARCProjectEncodeFunction)
+        self.project.setWriteFunc(ARCProjectWriteFunction)
+        self.project.saveProject(full=full, background=True)
 
     def getProject(self):
         return self.project
@@ -457,6 +1138,7 @@ class ARCProjectLoader(object):
     def load(self, path):
         self.project.setProjectPath(path)
         self.project.setLoadFunc(ARCProjectLoadFunction)
+        self.project.setLoadContextFunc(ARCProjectLoadContext)
         self.project.loadProject()
         
 
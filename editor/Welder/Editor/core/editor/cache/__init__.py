@@ -1,4 +1,18 @@
 from .cache import ImageFunctions
+from .cache import AssetIndex
 from .cache import RTPFunctions
+from .cache import LRUCache
+from .cache import TileAtlas
 from .cache import RTPCache
 from .cache import RTPPygletCache
+
+
+def bind_on_enable():
+    import welder_kernel as kernel
+
+    # folders of the previous project are of no more use
+    kernel.System.bind_event("OpenProject", AssetIndex.Clear)
+    kernel.Log(
+        "Cache: bound AssetIndex.Clear to 'OpenProject'",
+        "[PLUGIN]"
+    )
@@ -1,9 +1,11 @@
 import os
 import gc
+import threading
 import collections
 
 import wx
 import pyglet
+from pyglet import gl
 import numpy
 from PIL import Image
 
@@ -13,111 +15,46 @@ import welder_kernel as kernel
 class ImageFunctions(object):
 
     @staticmethod
-    def Get_HSV_From_Image(image):
-        a = numpy.asarray(image.convert('RGB'), int)
-        R, G, B = a.T
-
-        m = numpy.min(a, 2).T
-        M = numpy.max(a, 2).T
-
-        C = M - m  # chroma
-        Cmsk = C != 0
-
-        # Hue
-        H = numpy.zeros(R.shape, int)
-        mask = (M == R) & Cmsk
-        H[mask] = numpy.mod(60 * (G[mask] - B[mask]) / C[mask], 360)
-        mask = (M == G) & Cmsk
-        H[mask] = (60 * (B[mask] - R[mask]) / C[mask] + 120)
-        mask = (M == B) & Cmsk
-        H[mask] = (60 * (R[mask] - G[mask]) / C[mask] + 240)
-        H *= 255
-        H /= 360  # if you prefer, leave as 0-360, but don't convert to uint8
-
-        # Value
-        V = M
-        # Saturation
-        S = numpy.zeros(R.shape, int)
-        S[Cmsk] = ((255 * C[Cmsk]) / V[Cmsk])
-
-        # H, S, and V are now defined as integers 0-255
-        return H, S, V
-
-    @staticmethod
-    def Get_RGB_From_HSV(H, S, V):
-        H = (H / 255.0) * 360.0
-        S = (S / 255.0)
-        V = (V / 255.0)
-
-        C = V * S
-        Hp = H / 60.0
-        X = C * (1 - numpy.absolute(numpy.mod(Hp, 2) - 1))
-
-        R = numpy.zeros(H.shape, float)
-        G = numpy.zeros(H.shape, float)
-        B = numpy.zeros(H.shape, float)
-
-        mask = (0 <= Hp) & (Hp < 1)
-        R[mask] = C[mask]
-        mask = (1 <= Hp) & (Hp < 2)
-        R[mask] = X[mask]
-        mask = (2 <= Hp) & (Hp < 3)
-        R[mask] = 0
-        mask = (3 <= Hp) & (Hp < 4)
-        R[mask] = 0
-        mask = (4 <= Hp) & (Hp < 5)
-        R[mask] = X[mask]
-        mask = (5 <= Hp) & (Hp < 6)
-        R[mask] = C[mask]
-
-        mask = (0 <= Hp) & (Hp < 1)
-        G[mask] = X[mask]
-        mask = (1 <= Hp) & (Hp < 2)
-        G[mask] = C[mask]
-        mask = (2 <= Hp) & (Hp < 3)
-        G[mask] = C[mask]
-        mask = (3 <= Hp) & (Hp < 4)
-        G[mask] = X[mask]
-        mask = (4 <= Hp) & (Hp < 5)
-        G[mask] = 0
-        mask = (5 <= Hp) & (Hp < 6)
-        G[mask] = 0
-
-        mask = (0 <= Hp) & (Hp < 1)
-        B[mask] = 0
-        mask = (1 <= Hp) & (Hp < 2)
-        B[mask] = 0
-        mask = (2 <= Hp) & (Hp < 3)
-        B[mask] = X[mask]
-        mask = (3 <= Hp) & (Hp < 4)
-        B[mask] = C[mask]
-        mask = (4 <= Hp) & (Hp < 5)
-        B[mask] = C[mask]
-        mask = (5 <= Hp) & (Hp < 6)
-        B[mask] = X[mask]
-
-        m = V - C
-        R += m
-        G += m
-        B += m
-
-        R *= 255
-        G *= 255
-        B *= 255
-
-        return R, G, B
+    def rotate_hue(rgb, hue):
+        '''
+        rotates the hue of an (..., 3) uint8 RGB array by hue degrees,
+        keeping the HSV saturation and value of every pixel. works on the
+        whole array at once instead of masking per hue sextant
+        '''
+        rgb = rgb.astype(numpy.float32)
+        R, G, B = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+        V = rgb.max(-1)
+        C = V - rgb.min(-1)  # chroma
+        safe_C = numpy.where(C == 0, 1, C)
+        # hue in sextants, 0 <= H < 6
+        H = numpy.where(V == R, (G - B) / safe_C,
+                        numpy.where(V == G, (B - R) / safe_C + 2,
+                                    (R - G) / safe_C + 4))
+        H += (hue % 360) / 60.0
+        H %= 6
+        out = numpy.empty(rgb.shape, numpy.uint8)
+        for i, n in enumerate((5, 3, 1)):
+            k = (H + n) % 6
+            channel = V - C * numpy.clip(numpy.minimum(k, 4 - k), 0, 1)
+            out[..., i] = channel + 0.5
+        return out
 
     @staticmethod
     def change_hue_PIL(image, hue):
-        Red, Green, Blue, Alpha = image.convert('RGBA').split()
-        H, S, V = ImageFunctions.Get_HSV_From_Image(image)
-        RH = (H + (int(255.0 * (hue / 360.0)))) % 255
-        r, g, b = ImageFunctions.Get_RGB_From_HSV(RH, S, V)
-        imagearray = numpy.array([r, g, b])
-        newimage = Image.fromarray(imagearray.T.astype('uint8'))
-        red, green, blue = newimage.split()
-        finishedimage = Image.merge('RGBA', (red, green, blue, Alpha))
-        return finishedimage
+        rgba = numpy.ascontiguousarray(image.convert('RGBA'), numpy.uint8)
+        if hue % 360 == 0:
+            return Image.fromarray(rgba.copy(), 'RGBA')
+        # one uint32 per pixel, in memory order so byte order doesn't matter
+        pixels = rgba.view(numpy.uint32)
+        alpha_mask = numpy.array([0, 0, 0, 255], numpy.uint8).view(numpy.uint32)[0]
+        # sprite sheets only use a handful of colours, rotate each distinct
+        # colour once and index the result back out
+        colours, inverse = numpy.unique(pixels & ~alpha_mask, return_inverse=True)
+        palette = numpy.zeros((len(colours), 4), numpy.uint8)
+        palette[:, :3] = ImageFunctions.rotate_hue(colours.view(numpy.uint8).reshape(-1, 4)[:, :3], hue)
+        # alpha is carried over untouched
+        rotated = palette.view(numpy.uint32)[:, 0][inverse.reshape(pixels.shape)] | (pixels & alpha_mask)
+        return Image.fromarray(rotated.view(numpy.uint8).reshape(rgba.shape), 'RGBA')
 
     @staticmethod
     def PilImageToWxImage(pilImage, copyAlpha=True):
@@ -142,61 +79,105 @@ class ImageFunctions(object):
         return wxImage
 
 
+class AssetIndex(object):
+
+    '''
+    index of the files in the asset folders of the project and the RTPs.
+    each folder is listed once and kept as file name -> path, it is only
+    listed again when the modification time of the folder changes. a
+    lookup costs one stat per folder instead of one per extension.
+    names are matched without case, the way Windows and macOS (where
+    most projects are made) find files, even on case sensitive systems
+    '''
+
+    _folders = {}
+
+    @staticmethod
+    def Folder(path):
+        path = os.path.normpath(os.path.expandvars(path))
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            AssetIndex._folders.pop(path, None)
+            return {}
+        entry = AssetIndex._folders.get(path)
+        if entry is None or entry[0] != mtime:
+            files = {}
+            with os.scandir(path) as entries:
+                for dir_entry in entries:
+                    if dir_entry.is_file():
+                        files.setdefault(dir_entry.name.lower(), dir_entry.path)
+            entry = (mtime, files)
+            AssetIndex._folders[path] = entry
+        return entry[1]
+
+    @staticmethod
+    def Find(path, folder_name, name, extensions):
+        '''
+        the path of name in path/folder_name with the first of extensions
+        that exists, or "" if there is none
+        '''
+        sub_folder, name = os.path.split(name)
+        files = AssetIndex.Folder(os.path.join(path, folder_name, sub_folder))
+        name = name.lower()
+        for ext in extensions:
+            if name + ext in files:
+                return files[name + ext]
+        return ""
+
+    @staticmethod
+    def Clear(*args):
+        AssetIndex._folders = {}
+
+
 class RTPFunctions(object):
 
     _image_ext = ["", ".png", ".gif", ".jpg", ".bmp"]
     _audio_ext = ['', '.wav', '.ogg']  # No .mid for now
 
     @staticmethod
-    def FindImageFile(folder_name, name):
+    def AssetPaths():
+        '''
+        the project folder followed by the RTP folders, in search order
+        '''
+        paths = [kernel.GlobalObjects["CurrentProjectDir"]]
+        rtps = kernel.Config.getUnified()["RTPs"]
+        paths.extend([os.path.expandvars(path) for rtp_name, path in rtps.items()])
+        return paths
+
+    @staticmethod
+    def FindFile(folder_name, name, extensions):
         if name is None or name == "":
             return ""
-        flag = False
-        flag, testpath = RTPFunctions.TestImageFiles(
-            kernel.GlobalObjects["CurrentProjectDir"], folder_name, name)
-        if flag:
-            return testpath
-        else:
-            rtps = kernel.Config.getUnified()["RTPs"]
-            for rtp_name, path in rtps.items():
-                flag, testpath = RTPFunctions.TestImageFiles(
-                    path, folder_name, name)
-            if flag:
+        for path in RTPFunctions.AssetPaths():
+            testpath = AssetIndex.Find(path, folder_name, name, extensions)
+            if testpath != "":
                 return testpath
-            else:
-                return ""
+        return ""
+
+    @staticmethod
+    def FindImageFile(folder_name, name):
+        return RTPFunctions.FindFile(folder_name, name, RTPFunctions._image_ext)
 
     @staticmethod
     def TestImageFiles(path, folder_name, name):
-        for ext in RTPFunctions._image_ext:
-            testpath = os.path.normpath(
-                os.path.expandvars(
-                    os.path.join(path, folder_name, name + ext)))
-            if os.path.exists(testpath) and os.path.isfile(testpath):
-                return True, testpath
-        return False, ""
+        testpath = AssetIndex.Find(path, folder_name, name, RTPFunctions._image_ext)
+        return testpath != "", testpath
 
     @staticmethod
     def GetFileList(folder, type='image'):
-        files, entries = [], []
+        files = []
         if type == 'image':
             extensions = RTPFunctions._image_ext
         elif type == 'audio':
             extensions = RTPFunctions._audio_ext
         else:
             return files
-        directories = [kernel.GlobalObjects['CurrentProjectDir']]
-        rtps = kernel.Config.getUnified()["RTPs"]
-        directories.extend([os.path.expandvars(path[1])
-                            for path in rtps.items()])
-        for dir in directories:
-            path = os.path.join(dir, folder)
-            if os.path.exists(path):
-                entries.extend(os.listdir(path))
-        for entry in entries:
-            file, ext = os.path.splitext(entry)
-            if ext in extensions:
-                files.append(file)
+        for dir in RTPFunctions.AssetPaths():
+            for entry in AssetIndex.Folder(os.path.join(dir, folder)).values():
+                file, ext = os.path.splitext(os.path.basename(entry))
+                if ext.lower() in extensions:
+                    files.append(file)
         return files
 
     @staticmethod
@@ -226,66 +207,159 @@ class RTPFunctions(object):
 
     @staticmethod
     def FindAudioFile(folder_name, name):
-        if name is None or name == "":
-            return ""
-        flag = False
-        flag, testpath = RTPFunctions.TestAudioFiles(
-            kernel.GlobalObjects["CurrentProjectDir"], folder_name, name)
-        if flag:
-            return testpath
-        else:
-            rtps = kernel.Config.getUnified()["RTPs"]
-            for rtp_name, path in rtps.items():
-                flag, testpath = RTPFunctions.TestAudioFiles(
-                    path, folder_name, name)
-            if flag:
-                return testpath
-            else:
-                return ""
+        return RTPFunctions.FindFile(folder_name, name, RTPFunctions._audio_ext)
 
     @staticmethod
     def TestAudioFiles(path, folder_name, name):
-        for ext in RTPFunctions._audio_ext:
-            testpath = os.path.normpath(
-                os.path.expandvars(
-                    os.path.join(path, folder_name, name + ext)))
-            if os.path.exists(testpath) and os.path.isfile(testpath):
-                return True, testpath
-        return False, ""
+        testpath = AssetIndex.Find(path, folder_name, name, RTPFunctions._audio_ext)
+        return testpath != "", testpath
+
+
+def ImageSize(image):
+    '''
+    bytes held by the pixels of a PIL image, pyglet image or numpy array
+    '''
+    if image is None:
+        return 0
+    if hasattr(image, "nbytes"):
+        # numpy arrays
+        return image.nbytes
+    if hasattr(image, "getbands"):
+        width, height = image.size
+        return width * height * len(image.getbands())
+    return image.width * image.height * 4
+
+
+def CacheSection():
+    '''
+    the cache section of the config, the default config names it "cache"
+    '''
+    config = kernel.Config.getUnified()
+    for name in ("Cache", "cache"):
+        if name in config and config[name] is not None:
+            return config[name]
+    return {}
+
+
+class LRUCache(object):
+
+    '''
+    least recently used cache with a budget in bytes and an optional cap on
+    the number of entries. a hit moves the entry to the end, once over
+    budget the entries at the front are dropped. the newest entry is
+    always kept, even if it is bigger than the budget on its own. counts
+    hits, misses and evictions for diagnostics. safe to use from worker
+    threads, like the thumbnail renderer
+    '''
+
+    def __init__(self, name, budget, max_entries=0, size_func=ImageSize):
+        self.name = name
+        self._entries = collections.OrderedDict()
+        # in bytes, 0 means no limit
+        self.budget = budget
+        # 0 means no limit
+        self.max_entries = max_entries
+        self.size_func = size_func
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                entry = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        if size is None:
+            size = self.size_func(value)
+        with self._lock:
+            self.remove(key)
+            self._entries[key] = (value, size)
+            self.bytes += size
+            self.trim()
+        return value
+
+    def remove(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.bytes -= entry[1]
+
+    def trim(self):
+        with self._lock:
+            while len(self._entries) > 1 and (
+                    (self.budget > 0 and self.bytes > self.budget) or
+                    (self.max_entries > 0 and len(self._entries) > self.max_entries)):
+                key, entry = self._entries.popitem(False)
+                self.bytes -= entry[1]
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries = collections.OrderedDict()
+            self.bytes = 0
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "budget": self.budget,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
 
 
 class PILCache(object):
 
-    _NormalCache = collections.OrderedDict()
-    _TileCache = collections.OrderedDict()
-    _AutoTileCache = collections.OrderedDict()
-
     _normal_limit = 200
     _tile_limit = 100
-    _hue_limit = 5
     _autotile_limit = 250
 
-    config = kernel.Config.getUnified()
-    if "Cache" in config:
-        section = config["Cache"]
-        if "normal_limit" in section:
-            _normal_limit = section["normal_limit"]
-            if _normal_limit <= 1:
-                _normal_limit = 2
-        if "tile_limit" in section:
-            _tile_limit = section["tile_limit"]
-            if _tile_limit <= 1:
-                _tile_limit = 2
-        if "autotile_limit" in section:
-            _autotile_limit = section["autotile_limit"]
-            if _autotile_limit <= 1:
-                _autotile_limit = 2
-        if "hue_limit" in section:
-            _hue_limit = section["hue_limit"]
-            if _hue_limit <= 1:
-                _hue_limit = 2
-        del section
-    del config
+    # in megabytes
+    _normal_budget = 128
+    _tile_budget = 16
+    _autotile_budget = 16
+
+    section = CacheSection()
+    if "normal_limit" in section:
+        _normal_limit = section["normal_limit"]
+        if _normal_limit <= 1:
+            _normal_limit = 2
+    if "tile_limit" in section:
+        _tile_limit = section["tile_limit"]
+        if _tile_limit <= 1:
+            _tile_limit = 2
+    if "autotile_limit" in section:
+        _autotile_limit = section["autotile_limit"]
+        if _autotile_limit <= 1:
+            _autotile_limit = 2
+    if "normal_budget" in section:
+        _normal_budget = section["normal_budget"]
+    if "tile_budget" in section:
+        _tile_budget = section["tile_budget"]
+    if "autotile_budget" in section:
+        _autotile_budget = section["autotile_budget"]
+    del section
+
+    _NormalCache = LRUCache("normal", _normal_budget * 1024 * 1024, _normal_limit)
+    _TileCache = LRUCache("tile", _tile_budget * 1024 * 1024, _tile_limit)
+    _AutoTileCache = LRUCache("autotile", _autotile_budget * 1024 * 1024, _autotile_limit)
 
     Autotiles = [
         [[27, 28, 33, 34], [5, 28, 33, 34], [27, 6, 33, 34],
@@ -316,34 +390,15 @@ class PILCache(object):
 
     @staticmethod
     def NormalCacheLimit():
-        cacheLen = len(PILCache._NormalCache)
-        if cacheLen > PILCache._normal_limit:
-            for i in range(cacheLen - PILCache._normal_limit):
-                item = PILCache._NormalCache.popitem(False)
-                del item
+        PILCache._NormalCache.trim()
 
     @staticmethod
     def TileCacheLimit():
-        if len(PILCache._TileCache) > PILCache._tile_limit:
-            for i in range(len(PILCache._TileCache) - PILCache._tile_limit):
-                item = PILCache._TileCache.popitem(False)
-                del item
+        PILCache._TileCache.trim()
 
     @staticmethod
     def AutotileCacheLimit():
-        cacheLen = len(PILCache._AutoTileCache)
-        if cacheLen > PILCache._autotile_limit:
-            for i in range(cacheLen - PILCache._autotile_limit):
-                item = PILCache._AutoTileCache.popitem(False)
-                del item
-
-    @staticmethod
-    def HueCacheLimit(cache, key):
-        if key in cache:
-            if len(cache[key]) > PILCache._hue_limit:
-                for i in range(len(cache[key]) - PILCache._hue_limit):
-                    item = cache[key].popitem(False)
-                    del item
+        PILCache._AutoTileCache.trim()
 
     @staticmethod
     def CacheLimit():
@@ -351,26 +406,26 @@ class PILCache(object):
         PILCache.TileCacheLimit()
         PILCache.AutotileCacheLimit()
 
+    @staticmethod
+    def Stats():
+        return [PILCache._NormalCache.stats(),
+                PILCache._TileCache.stats(),
+                PILCache._AutoTileCache.stats()]
+
     @staticmethod
     def Load_bitmap(folder_name, filename, hue=0):
-        key = (folder_name, filename)
-        if key not in PILCache._NormalCache:
-            PILCache._NormalCache[key] = collections.OrderedDict()
-        try:
-            return PILCache._NormalCache[key][hue]
-        except KeyError:
-            path = RTPFunctions.FindImageFile(folder_name, filename)
-            if path != "":
-                image = Image.open(path).convert('RGBA')
-                if hue != 0:
-                    image = PILCache.changeHue(image, hue)
-
-                PILCache._NormalCache[key][hue] = image
-                PILCache.HueCacheLimit(PILCache._NormalCache, key)
-                del image
-                return PILCache._NormalCache[key][hue]
-            else:
-                return None
+        key = (folder_name, filename, hue)
+        image = PILCache._NormalCache.get(key)
+        if image is not None:
+            return image
+        path = RTPFunctions.FindImageFile(folder_name, filename)
+        if path != "":
+            image = Image.open(path).convert('RGBA')
+            if hue != 0:
+                image = PILCache.changeHue(image, hue)
+            return PILCache._NormalCache.put(key, image)
+        else:
+            return None
 
     @staticmethod
     def Animation(filename, hue):
@@ -381,32 +436,57 @@ class PILCache(object):
         return PILCache.Load_bitmap("Graphics/Autotiles/", filename, 0)
 
     @staticmethod
-    def AutotilePattern(filename, pattern):
-        key = (filename, pattern, 0)
-        try:
-            return PILCache._AutoTileCache[key]
-        except KeyError:
-            autotile = PILCache.Autotile(filename)
-            if autotile:
-                # Collects Auto-Tile Tile Layout
-                tiles = PILCache.Autotiles[int(pattern) // 8][int(pattern) % 8]
-                PILCache._AutoTileCache[key] = Image.new(
-                    'RGBA', (32, 32), (0, 0, 0, 0))
-                for i in range(4):
-                    tile_position = tiles[i] - 1
-                    x = tile_position % 6 * 16
-                    y = tile_position // 6 * 16
-                    autotile_part = autotile.crop((x, y, x + 16, y + 16))
-                    tile_x = (i % 2 * 16)
-                    tile_y = (i // 2 * 16)
-                    PILCache._AutoTileCache[key].paste(
-                        autotile_part, (tile_x, tile_y))
-                    del autotile_part
-                del tiles
-                del autotile
-                return PILCache._AutoTileCache[key]
-            else:
-                return None
+    def AutotilePatterns(filename):
+        '''
+        all 48 patterns of every animation frame of an autotile sheet as a
+        (frames, 48, 32, 32, 4) RGBA array, index it with [frame, pattern].
+        built with one gather over the 16x16 quarter tiles of the sheet and
+        cached by file and modification time
+        '''
+        path = RTPFunctions.FindImageFile("Graphics/Autotiles/", filename)
+        if path == "":
+            return None
+        key = ("AutotilePatterns", path, os.stat(path).st_mtime_ns)
+        patterns = PILCache._AutoTileCache.get(key)
+        if patterns is not None:
+            return patterns
+        sheet = numpy.asarray(Image.open(path).convert('RGBA'))
+        height, width = sheet.shape[:2]
+        if height < 128:
+            # a single tile autotile, every pattern is the whole tile
+            frames = max(width // 32, 1)
+            tiles = numpy.zeros((frames, 32, 32, 4), numpy.uint8)
+            block = sheet[:32, :frames * 32]
+            block = block.reshape(block.shape[0], frames, -1, 4).transpose(1, 0, 2, 3)
+            tiles[:, :block.shape[1], :block.shape[2]] = block
+            patterns = numpy.repeat(tiles[:, numpy.newaxis], 48, axis=1)
+        else:
+            frames = max(width // 96, 1)
+            block = numpy.zeros((128, frames * 96, 4), numpy.uint8)
+            block[:, :min(width, frames * 96)] = sheet[:128, :frames * 96]
+            # (frames, 48, 16, 16, 4), quarters numbered row by row, 6 a row
+            quarters = block.reshape(8, 16, frames, 6, 16, 4)
+            quarters = quarters.transpose(2, 0, 3, 1, 4, 5).reshape(frames, 48, 16, 16, 4)
+            # the 4 quarters of every pattern, top left, top right,
+            # bottom left, bottom right
+            layout = numpy.array(PILCache.Autotiles).reshape(48, 4) - 1
+            patterns = quarters[:, layout].reshape(frames, 48, 2, 2, 16, 16, 4)
+            patterns = patterns.transpose(0, 1, 2, 4, 3, 5, 6).reshape(frames, 48, 32, 32, 4)
+        patterns = numpy.ascontiguousarray(patterns)
+        return PILCache._AutoTileCache.put(key, patterns)
+
+    @staticmethod
+    def AutotilePattern(filename, pattern, frame=0):
+        key = (filename, pattern, frame)
+        image = PILCache._AutoTileCache.get(key)
+        if image is not None:
+            return image
+        patterns = PILCache.AutotilePatterns(filename)
+        if patterns is not None:
+            image = Image.fromarray(patterns[frame % len(patterns), int(pattern)], 'RGBA')
+            return PILCache._AutoTileCache.put(key, image)
+        else:
+            return None
 
     @staticmethod
     def Battleback(filename):
@@ -454,73 +534,215 @@ class PILCache(object):
 
     @staticmethod
     def Tile(filename, tile_id, hue):
-        key = (filename, int(tile_id))
-        if key not in PILCache._TileCache:
-            PILCache._TileCache[key] = collections.OrderedDict()
-        try:
-            return PILCache._TileCache[key][hue]
-        except KeyError:
-            tileset = PILCache.Tileset(filename)
-            if tileset:
-                tid = int(tile_id) - 384
-                x = tid % 8 * 32
-                y = tid // 8 * 32
-                PILCache._TileCache[key][hue] = tileset.crop(
-                    (x, y, x + 32, y + 32))
-                PILCache.HueCacheLimit(PILCache._TileCache, key)
-                del tileset
-                return PILCache._TileCache[key][hue]
-
-            else:
-                return None
+        key = (filename, int(tile_id), hue)
+        image = PILCache._TileCache.get(key)
+        if image is not None:
+            return image
+        tileset = PILCache.Tileset(filename)
+        if tileset:
+            tid = int(tile_id) - 384
+            x = tid % 8 * 32
+            y = tid // 8 * 32
+            image = tileset.crop((x, y, x + 32, y + 32))
+            del tileset
+            return PILCache._TileCache.put(key, image)
+        else:
+            return None
+
+    @staticmethod
+    def TileImages(tileset_name, autotile_names):
+        '''
+        every tile from id 48 up as a read only (count, 32, 32, 4) RGBA
+        array, index it with tile id - 48. the first animation frame of
+        the 48 patterns of each of the 7 autotiles come first, then the
+        tiles of the tileset
+        '''
+        autotile_names = tuple(autotile_names[:7])
+        key = ("TileImages", tileset_name, autotile_names)
+        tiles = PILCache._TileCache.get(key)
+        if tiles is not None:
+            return tiles
+        tileset = PILCache.Tileset(tileset_name)
+        if tileset is not None:
+            tileset = numpy.asarray(tileset)
+            rows = tileset.shape[0] // 32
+            tileset = tileset[:rows * 32, :256]
+            tileset = tileset.reshape(rows, 32, 8, 32, 4)
+            tileset = tileset.transpose(0, 2, 1, 3, 4).reshape(-1, 32, 32, 4)
+        else:
+            tileset = numpy.zeros((0, 32, 32, 4), numpy.uint8)
+        tiles = numpy.zeros((336 + len(tileset), 32, 32, 4), numpy.uint8)
+        for i, name in enumerate(autotile_names):
+            if name:
+                patterns = PILCache.AutotilePatterns(name)
+                if patterns is not None:
+                    # the first animation frame
+                    tiles[i * 48:(i + 1) * 48] = patterns[0]
+        tiles[336:] = tileset
+        tiles.flags.writeable = False
+        return PILCache._TileCache.put(key, tiles)
 
     @staticmethod
     def Clear():
-        PILCache._NormalCache = collections.OrderedDict()
-        PILCache._TileCache = collections.OrderedDict()
-        PILCache._AutoTileCache = collections.OrderedDict()
+        PILCache._NormalCache.clear()
+        PILCache._TileCache.clear()
+        PILCache._AutoTileCache.clear()
         gc.collect()
 
 
+class TileAtlas(object):
+
+    '''
+    packs the tiles of a tileset and the 48 patterns of each of its 7
+    autotiles into as few textures as possible, 8 tiles to a row. every
+    tile id from 48 up has a slot (tile id - 48): the autotile patterns
+    come first, then the tileset. tex_coords and pages are lookup tables
+    indexed by tile id so a whole block of tiles can be mapped to the
+    atlas with one numpy index. blank tiles (ids below 48) have page -1.
+    the pixels of a page are only built while it is uploaded, the
+    textures are all the atlas keeps
+    '''
+
+    columns = 8
+    # rows of tiles in a texture, 4096 pixels high
+    page_rows = 128
+
+    def __init__(self, tileset_name, autotile_names):
+        self.tileset_name = tileset_name
+        self.autotile_names = list(autotile_names)
+        # (width, height) of each page
+        self.page_sizes = []
+        self.textures = []
+        self.tex_coords = None
+        self.pages = None
+        self.build()
+
+    @property
+    def nbytes(self):
+        return sum(width * height * 4 for width, height in self.page_sizes)
+
+    def getTileImages(self):
+        '''
+        every tile from id 48 up as a (count, 32, 32, 4) RGBA array
+        '''
+        return PILCache.TileImages(self.tileset_name, self.autotile_names)
+
+    def build(self):
+        tiles = self.getTileImages()
+        per_page = TileAtlas.columns * TileAtlas.page_rows
+        self.page_sizes = []
+        for start in range(0, len(tiles), per_page):
+            rows = -(-min(per_page, len(tiles) - start) // TileAtlas.columns)
+            self.page_sizes.append((TileAtlas.columns * 32, rows * 32))
+        count = 48 + len(tiles)
+        slots = numpy.arange(count) - 48
+        self.pages = numpy.where(slots < 0, -1, slots // per_page).astype(numpy.int16)
+        self.textures = []
+        self.tex_coords = None
+
+    def getPagePixels(self, page_index):
+        '''
+        the tiles of a page as a (height, width, 4) RGBA array
+        '''
+        per_page = TileAtlas.columns * TileAtlas.page_rows
+        block = self.getTileImages()[page_index * per_page:(page_index + 1) * per_page]
+        rows = -(-len(block) // TileAtlas.columns)
+        padded = numpy.zeros((rows * TileAtlas.columns, 32, 32, 4), numpy.uint8)
+        padded[:len(block)] = block
+        # rows of tiles top to bottom, like the tileset image
+        page = padded.reshape(rows, TileAtlas.columns, 32, 32, 4)
+        page = page.transpose(0, 2, 1, 3, 4).reshape(rows * 32, TileAtlas.columns * 32, 4)
+        return numpy.ascontiguousarray(page)
+
+    def getTextures(self):
+        '''
+        uploads the pages as textures the first time they are needed and
+        fills in the tex_coords lookup table
+        '''
+        if self.tex_coords is not None:
+            return self.textures
+        per_page = TileAtlas.columns * TileAtlas.page_rows
+        count = len(self.pages)
+        tex_coords = numpy.zeros((count, 12), numpy.float32)
+        for page_index, (width, height) in enumerate(self.page_sizes):
+            image = pyglet.image.ImageData(
+                width, height, 'RGBA', self.getPagePixels(page_index).tobytes(),
+                pitch=-width * 4)
+            texture = image.get_texture()
+            # keep the tiles sharp when zoomed
+            gl.glBindTexture(texture.target, texture.id)
+            gl.glTexParameteri(texture.target, gl.GL_TEXTURE_MIN_FILTER, gl.GL_NEAREST)
+            gl.glTexParameteri(texture.target, gl.GL_TEXTURE_MAG_FILTER, gl.GL_NEAREST)
+            self.textures.append(texture)
+            # the texture can be bigger than the page (power of two sizes)
+            u_scale = texture.tex_coords[6] / width
+            v_scale = texture.tex_coords[7] / height
+            tids = numpy.nonzero(self.pages == page_index)[0]
+            local = tids - 48 - page_index * per_page
+            u0 = (local % TileAtlas.columns) * 32 * u_scale
+            u1 = u0 + 32 * u_scale
+            v1 = (height - (local // TileAtlas.columns) * 32) * v_scale
+            v0 = v1 - 32 * v_scale
+            # bottom left, bottom right, top right, top left
+            tex_coords[tids, 0] = u0
+            tex_coords[tids, 1] = v0
+            tex_coords[tids, 3] = u1
+            tex_coords[tids, 4] = v0
+            tex_coords[tids, 6] = u1
+            tex_coords[tids, 7] = v1
+            tex_coords[tids, 9] = u0
+            tex_coords[tids, 10] = v1
+        self.tex_coords = tex_coords
+        return self.textures
+
+    def getTexCoords(self, tid):
+        self.getTextures()
+        if 0 <= tid < len(self.pages) and self.pages[tid] >= 0:
+            return self.textures[self.pages[tid]], tuple(self.tex_coords[tid])
+        return None, None
+
+
 class PygletCache(object):
 
     def __init__(self):
-        self._Cache = collections.OrderedDict()
-        self.limit = 200
+        limit = 200
+        # in megabytes
+        budget = 128
         try:
-            config = kernel.Config.getUnified()
-            if "Cache" in config:
-                section = config["Cache"]
-                if "pyglet_limit" in section:
-                    self.limit = config["Cache"]["pyglet_limit"]
+            section = CacheSection()
+            if "pyglet_limit" in section:
+                limit = section["pyglet_limit"]
+            if "pyglet_budget" in section:
+                budget = section["pyglet_budget"]
         except:
             kernel.Log(
                 "Error setting pyglet Cache Config", "[Cache]", error=True)
+        self._Cache = LRUCache("pyglet", budget * 1024 * 1024, limit)
 
     def CacheLimit(self):
-        if len(self._Cache) > self.limit:
-            for i in range(len(self._Cache) - self.limit):
-                item = self._Cache.popitem(False)
-                del item
+        self._Cache.trim()
+
+    def Stats(self):
+        return [self._Cache.stats()]
+
+    def _toPyglet(self, key, image):
+        pygletimage = pyglet.image.create(*image.size).get_image_data()
+        pitch = -len('RGBA') * pygletimage.width
+        data = image.tostring()
+        pygletimage.set_data('RGBA', pitch, data)
+        del data
+        return self._Cache.put(key, pygletimage)
 
     def Load_bitmap(self, folder_name, filename, hue=0):
         key = (folder_name, filename, hue)
-        try:
-            return self._Cache[key]
-        except KeyError:
-            image = PILCache.Load_bitmap(folder_name, filename, hue)
-            if image is not None:
-                pygletimage = pyglet.image.create(*image.size).get_image_data()
-                pitch = -len('RGBA') * pygletimage.width
-                data = image.tostring()
-                pygletimage.set_data('RGBA', pitch, data)
-                self._Cache[key] = pygletimage
-                del pygletimage
-                del data
-                del image
-                return self._Cache[key]
-            else:
-                return None
+        pygletimage = self._Cache.get(key)
+        if pygletimage is not None:
+            return pygletimage
+        image = PILCache.Load_bitmap(folder_name, filename, hue)
+        if image is not None:
+            return self._toPyglet(key, image)
+        else:
+            return None
 
     def Animation(self, filename, hue):
         return self.Load_bitmap("Graphics/Animations/", filename, hue)
@@ -528,24 +750,16 @@ class PygletCache(object):
     def Autotile(self, filename):
         return self.Load_bitmap("Graphics/Autotiles/", filename, 0)
 
-    def AutotilePattern(self, filename, pattern):
-        key = (filename, pattern, 0)
-        try:
-            return self._Cache[key]
-        except KeyError:
-            image = PILCache.AutotilePattern(filename, pattern)
-            if image is not None:
-                pygletimage = pyglet.image.create(*image.size).get_image_data()
-                pitch = -len('RGBA') * pygletimage.width
-                data = image.tostring()
-                pygletimage.set_data('RGBA', pitch, data)
-                self._Cache[key] = pygletimage
-                del image
-                del data
-                del pygletimage
-                return self._Cache[key]
-            else:
-                return None
+    def AutotilePattern(self, filename, pattern, frame=0):
+        key = (filename, pattern, frame)
+        pygletimage = self._Cache.get(key)
+        if pygletimage is not None:
+            return pygletimage
+        image = PILCache.AutotilePattern(filename, pattern, frame)
+        if image is not None:
+            return self._toPyglet(key, image)
+        else:
+            return None
 
     def Battleback(self, filename):
         return self.Load_bitmap("Graphics/Battlebacks/", filename, 0)
@@ -582,27 +796,25 @@ class PygletCache(object):
 
     def Tile(self, filename, tile_id, hue):
         key = (filename, int(tile_id), hue)
-        try:
-            return self._Cache[key]
-        except KeyError:
-            image = PILCache.Tile(filename, tile_id, hue)
-            if image is not None:
-                width, height = image.size
-                pygletimage = pyglet.image.create(
-                    width, height).get_image_data()
-                pitch = -len('RGBA') * pygletimage.width
-                data = image.tostring()
-                pygletimage.set_data('RGBA', pitch, data)
-                self._Cache[key] = pygletimage
-                del image
-                del data
-                del pygletimage
-                return self._Cache[key]
-            else:
-                return None
+        pygletimage = self._Cache.get(key)
+        if pygletimage is not None:
+            return pygletimage
+        image = PILCache.Tile(filename, tile_id, hue)
+        if image is not None:
+            return self._toPyglet(key, image)
+        else:
+            return None
+
+    def TileAtlas(self, tileset_name, autotile_names):
+        key = ("TileAtlas", tileset_name, tuple(autotile_names))
+        atlas = self._Cache.get(key)
+        if atlas is not None:
+            return atlas
+        atlas = TileAtlas(tileset_name, autotile_names)
+        return self._Cache.put(key, atlas, atlas.nbytes)
 
     def Clear(self):
-        self._Cache = collections.OrderedDict()
+        self._Cache.clear()
         gc.collect()
 
 global RTPCache, RTPPygletCache
@@ -173,6 +173,8 @@ class EditorMainWindow(wx.Frame):
                 dlg.Destroy()
                 if result == wx.YES:
                     kernel.System.load("SaveProjectHandler")()
+            # the files are written in the background, finish before exiting
+            current_project.waitForSave()
 
     def ProcessAutoSave(self, event):
         kernel.System.fire_event("AutoSave")
@@ -103,3 +103,16 @@ from .formater import Command355Formater
 from .formater import Command412Formater
 from .formater import Command404Formater
 from .formater import Command605Formater
+
+
+def bind_on_enable():
+    import welder_kernel as kernel
+
+    # formatted lines go stale when the names they show are edited
+    kernel.System.bind_event("DataEdited", EventCommandFormater.onDataEdited)
+    kernel.System.bind_event("OpenProject", EventCommandFormater.Clear)
+    kernel.System.bind_event("RefreshProject", EventCommandFormater.Clear)
+    kernel.Log(
+        "EventEditorFormater: bound EventCommandFormater cache invalidation",
+        "[PLUGIN]"
+    )
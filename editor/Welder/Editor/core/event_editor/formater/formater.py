@@ -1,13 +1,93 @@
+import re
+import weakref
+
 import welder_kernel as kernel
 
+from PyitectConsumes import Project
+
 
 class EventCommandFormater(object):
 
-    '''Formats event commands into HTML for display'''
+    '''
+    Formats event commands into HTML for display
+
+    format keeps the HTML of every command it formats until the command,
+    or a database the formatter read names from, is edited. so scrolling
+    a long event page only formats each line once
+    '''
+
+    # command -> (version, code, indent, ((database name, version), ...), html)
+    _cache = weakref.WeakKeyDictionary()
+    # bumped to drop every cached line
+    version = 0
+    # database name -> version, bumped when one of its records is edited
+    data_versions = {}
+    # the database names read while formatting, see getData
+    _reading = None
+
+    # event code -> formatCommand of its formatter, filled in when the
+    # module loads, see get_event_formater
+    formaters = {}
+
+    # the database each type of DataAction edits
+    data_types = Project.data_types
+
+    @staticmethod
+    def format(command):
+        '''
+        formatCommand, from the cache when nothing it depends on changed
+        '''
+        cache = EventCommandFormater._cache
+        try:
+            entry = cache.get(command)
+        except TypeError:
+            # can't be weakly referenced
+            return EventCommandFormater.formatCommand(command)
+        data_versions = EventCommandFormater.data_versions
+        if (entry is not None and entry[0] == EventCommandFormater.version and
+                entry[1] == command.code and entry[2] == command.indent and
+                all(data_versions.get(name, 0) == version
+                    for name, version in entry[3])):
+            return entry[4]
+        EventCommandFormater._reading = set()
+        try:
+            html = EventCommandFormater.formatCommand(command)
+            reading = EventCommandFormater._reading
+        finally:
+            EventCommandFormater._reading = None
+        cache[command] = (
+            EventCommandFormater.version, command.code, command.indent,
+            tuple((name, data_versions.get(name, 0)) for name in reading),
+            html)
+        return html
+
+    @staticmethod
+    def getData(name):
+        '''
+        a database of the open project, formatters read names through
+        this so the cache knows which edits make a line stale
+        '''
+        if EventCommandFormater._reading is not None:
+            EventCommandFormater._reading.add(name)
+        return kernel.GlobalObjects["PROJECT"].getData(name)
+
+    @staticmethod
+    def onDataEdited(type, obj):
+        if type == "EventCommand":
+            EventCommandFormater._cache.pop(obj, None)
+        elif type in EventCommandFormater.data_types:
+            name = EventCommandFormater.data_types[type]
+            data_versions = EventCommandFormater.data_versions
+            data_versions[name] = data_versions.get(name, 0) + 1
+
+    @staticmethod
+    def Clear():
+        EventCommandFormater.version += 1
+        EventCommandFormater._cache.clear()
 
     @staticmethod
     def formatCommand(command):
-        formater = EventCommandFormater.get_event_formater(command.code).object
+        formater = EventCommandFormater.get_event_formater(command.code)
         if formater is None:
             return ''.join(
                 (
@@ -16,7 +96,7 @@ class EventCommandFormater(object):
                     command.code
                 )
             )
-        text = formater.formatCommand(command.parameters)
+        text = formater(command.parameters)
         if text == "":
             return ''.join(
                 (
@@ -34,8 +114,31 @@ class EventCommandFormater(object):
 
     @staticmethod
     def get_event_formater(code):
-        name = "Command%03dFormater" % code
-        return kernel.System.load(name)
+        '''
+        the formatCommand of the formatter for code, or None if there is
+        none. codes not in this module are loaded from the plugin system
+        the first time they are seen and then kept in the table too
+        '''
+        formaters = EventCommandFormater.formaters
+        if code in formaters:
+            return formaters[code]
+        formater = None
+        try:
+            formater = kernel.System.load("Command%03dFormater" % code).formatCommand
+        except Exception:
+            kernel.Log("No formatter for event code [%s]" % code, "[EventEditor]", error=True)
+        formaters[code] = formater
+        return formater
+
+    @staticmethod
+    def mapFormaters(namespace):
+        '''
+        adds the Command###Formater classes in namespace to the table
+        '''
+        for name, value in namespace.items():
+            match = re.match(r"^Command(\d{3})Formater$", name)
+            if match is not None:
+                EventCommandFormater.formaters[int(match.group(1))] = value.formatCommand
 
 
 class EventHTMLFormater(object):
@@ -127,6 +230,8 @@ class Command000Formater(object):
 
     """place holder"""
 
+    html = EventHTMLFormater.color('#0000A0', EventHTMLFormater.bold('@>'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -135,13 +240,16 @@ class Command000Formater(object):
 
     @staticmethod
     def template(f):
-        return EventHTMLFormater.color('#0000A0', EventHTMLFormater.bold('@>'))
+        return Command000Formater.html
 
 
 class Command101Formater(object):
 
     """Show Text"""
 
+    html = '%s %s' % (
+        EventHTMLFormater.green('Text:'), EventHTMLFormater.italic('%(text)s'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -150,15 +258,16 @@ class Command101Formater(object):
 
     @staticmethod
     def template(f):
-        template = '%s %s' % (
-            EventHTMLFormater.green('Text:'), EventHTMLFormater.italic('%(text)s'))
-        return template % f
+        return Command101Formater.html % f
 
 
 class Command401Formater(object):
 
     """Show Text Extra Lines"""
 
+    html = '&nbsp;&nbsp;&nbsp;&nbsp;%s %s' % (
+        EventHTMLFormater.green(':'), EventHTMLFormater.italic('%(text)s'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -167,9 +276,7 @@ class Command401Formater(object):
 
     @staticmethod
     def template(f):
-        template = '&nbsp;&nbsp;&nbsp;&nbsp;%s %s' % (
-            EventHTMLFormater.green(':'), EventHTMLFormater.italic('%(text)s'))
-        return template % f
+        return Command401Formater.html % f
 
 
 class Command102Formater(object):
@@ -207,6 +314,9 @@ class Command402Formater(object):
 
     """When [**] The command that serves as an entry point for each potential choice"""
 
+    html = '&nbsp;&nbsp;%s (%s)%s' % (EventHTMLFormater.blue(EventHTMLFormater.bold(
+        'When')), EventHTMLFormater.red('%(choice_id)s'), EventHTMLFormater.green('%(choice_name)s'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -216,15 +326,15 @@ class Command402Formater(object):
 
     @staticmethod
     def template(f):
-        template = '&nbsp;&nbsp;%s (%s)%s' % (EventHTMLFormater.blue(EventHTMLFormater.bold(
-            'When')), EventHTMLFormater.red('%(choice_id)s'), EventHTMLFormater.green('%(choice_name)s'))
-        return template % f
+        return Command402Formater.html % f
 
 
 class Command403Formater(object):
 
     """When Cancel Choices"""
 
+    html = '&nbsp;&nbsp;%s %s' % (EventHTMLFormater.blue(EventHTMLFormater.bold('When')), EventHTMLFormater.green('Cancel'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -232,17 +342,23 @@ class Command403Formater(object):
 
     @staticmethod
     def template(f):
-        return '&nbsp;&nbsp;%s %s' % (EventHTMLFormater.blue(EventHTMLFormater.bold('When')), EventHTMLFormater.green('Cancel'))
+        return Command403Formater.html
 
 
 class Command103Formater(object):
 
     """Input Number"""
 
+    html = '%s Variable[%s: %s], (%s digit(s))' % (EventHTMLFormater.blue('Input Number:'),
+                                                   EventHTMLFormater.red(
+                                                       '%(variable_id)04d'),
+                                                   EventHTMLFormater.green(
+                                                       '%(variable_name)s'),
+                                                   EventHTMLFormater.bold('%(digits)s'))
+
     @staticmethod
     def formatCommand(params):
-        project = kernel.GlobalObjects["PROJECT"]
-        system = project.getData('System')
+        system = EventCommandFormater.getData('System')
         f = {}
         f['variable_id'] = params[0]
         f['variable_name'] = system.variables[params[0]]
@@ -251,19 +367,16 @@ class Command103Formater(object):
 
     @staticmethod
     def template(f):
-        template = '%s Variable[%s: %s], (%s digit(s))' % (EventHTMLFormater.blue('Input Number:'),
-                                                           EventHTMLFormater.red(
-                                                               '%(variable_id)04d'),
-                                                           EventHTMLFormater.green(
-                                                               '%(variable_name)s'),
-                                                           EventHTMLFormater.bold('%(digits)s'))
-        return template % f
+        return Command103Formater.html % f
 
 
 class Command104Formater(object):
 
     """Change Text Options"""
 
+    html = '%s [%s, %s]' % (EventHTMLFormater.italic('Change Text Options:'), EventHTMLFormater.bold(
+        '%(msg_pos)s'), EventHTMLFormater.bold('%(msg_frame)s'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -279,19 +392,19 @@ class Command104Formater(object):
 
     @staticmethod
     def template(f):
-        template = '%s [%s, %s]' % (EventHTMLFormater.italic('Change Text Options:'), EventHTMLFormater.bold(
-            '%(msg_pos)s'), EventHTMLFormater.bold('%(msg_frame)s'))
-        return template % f
+        return Command104Formater.html % f
 
 
 class Command105Formater(object):
 
     """Button Input Processing"""
 
+    html = '%s Variable[%s: %s]' % (EventHTMLFormater.bold(EventHTMLFormater.red(
+        'Button Input Processing: ')), EventHTMLFormater.red('%(var_id)04d'), EventHTMLFormater.green('%(var_name)s'))
+
     @staticmethod
     def formatCommand(params):
-        project = kernel.GlobalObjects["PROJECT"]
-        system = project.getData('System')
+        system = EventCommandFormater.getData('System')
 
         f = {}
         f['var_id'] = params[0]
@@ -300,15 +413,16 @@ class Command105Formater(object):
 
     @staticmethod
     def template(f):
-        template = '%s Variable[%s: %s]' % (EventHTMLFormater.bold(EventHTMLFormater.red(
-            'Button Input Processing: ')), EventHTMLFormater.red('%(var_id)04d'), EventHTMLFormater.green('%(var_name)s'))
-        return template % f
+        return Command105Formater.html % f
 
 
 class Command106Formater(object):
 
     """Wait"""
 
+    html = '%s %s %s' % (EventHTMLFormater.blue(EventHTMLFormater.bold(
+        'Wait:')), EventHTMLFormater.red('%(frames)s'), EventHTMLFormater.red('Frame(s)'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -317,15 +431,16 @@ class Command106Formater(object):
 
     @staticmethod
     def template(f):
-        template = '%s %s %s' % (EventHTMLFormater.blue(EventHTMLFormater.bold(
-            'Wait:')), EventHTMLFormater.red('%(frames)s'), EventHTMLFormater.red('Frame(s)'))
-        return template % f
+        return Command106Formater.html % f
 
 
 class Command108Formater(object):
 
     """Comment"""
 
+    html = '%s %s' % (EventHTMLFormater.green(
+        'Comment:'), EventHTMLFormater.italic(EventHTMLFormater.green('%(text)s')))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -334,15 +449,16 @@ class Command108Formater(object):
 
     @staticmethod
     def template(f):
-        template = '%s %s' % (EventHTMLFormater.green(
-            'Comment:'), EventHTMLFormater.italic(EventHTMLFormater.green('%(text)s')))
-        return template % f
+        return Command108Formater.html % f
 
 
 class Command408Formater(object):
 
     """Comment Extra Lines"""
 
+    html = '&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;%s %s' % (
+        EventHTMLFormater.green(':'), EventHTMLFormater.italic(EventHTMLFormater.green('%(text)s')))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -351,9 +467,7 @@ class Command408Formater(object):
 
     @staticmethod
     def template(f):
-        template = '&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;%s %s' % (
-            EventHTMLFormater.green(':'), EventHTMLFormater.italic(EventHTMLFormater.green('%(text)s')))
-        return template % f
+        return Command408Formater.html % f
 
 
 class Command111Formater(object):
@@ -372,8 +486,7 @@ class Command111Formater(object):
         f['mode'] = mode
         f['mode_name'] = mode_dict[params[0]]
 
-        project = kernel.GlobalObjects["PROJECT"]
-        system = project.getData('System')
+        system = EventCommandFormater.getData('System')
 
         if mode == 0:  # switch
             f['switch_id'] = params[1]
@@ -404,26 +517,26 @@ class Command111Formater(object):
             f['time'] = params[1]
             f['time_mode'] = params[2]
         elif mode == 4:  # actor
-            actors = project.getData('Actors')
+            actors = EventCommandFormater.getData('Actors')
             f['actor_id'] = params[1]
             f['actor_name'] = actors[params[1]].name
             f['actor_mode'] = params[2]
             if params[2] == 1:  # name
                 f['actor_condition_name'] = params[3]
             elif params[2] == 2:  # skill
-                skills = project.getData('Skills')
+                skills = EventCommandFormater.getData('Skills')
                 f['skill_id'] = params[3]
                 f['skill_name'] = skills[params[3]].name
             elif params[2] == 3:  # weapon
-                weapons = project.getData('Weapons')
+                weapons = EventCommandFormater.getData('Weapons')
                 f['weapon_id'] = params[3]
                 f['weapon_name'] = weapons[params[3]].name
             elif params[2] == 4:  # armor
-                armors = project.getData('Armors')
+                armors = EventCommandFormater.getData('Armors')
                 f['armor_id'] = params[3]
                 f['armor_name'] = armors[params[3]].name
             elif params[2] == 5:  # state
-                states = project.getData('States')  # system.states
+                states = EventCommandFormater.getData('States')  # system.states
                 f['state_id'] = params[3]
                 f['state_name'] = states[params[3]].name
             if params[2] != 0:
@@ -440,15 +553,15 @@ class Command111Formater(object):
             f['gold_mode'] = params[2]
             f['gold_value'] = params[1]
         elif mode == 8:  # item
-            items = project.getData('Items')
+            items = EventCommandFormater.getData('Items')
             f['item_id'] = params[1]
             f['item_name'] = items[params[1]].name
         elif mode == 9:  # weapon
-            weapons = project.getData('Weapons')
+            weapons = EventCommandFormater.getData('Weapons')
             f['weapon_id'] = params[1]
             f['weapon_name'] = weapons[params[1]].name
         elif mode == 10:  # armor
-            armors = project.getData('Armors')
+            armors = EventCommandFormater.getData('Armors')
             f['armor_id'] = params[1]
             f['armor_name'] = armors[params[1]].name
         elif mode == 11:  # button
@@ -631,6 +744,8 @@ class Command411Formater(object):
 
     """Else"""
 
+    html = '%s' % (EventHTMLFormater.blue('Else'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -638,13 +753,15 @@ class Command411Formater(object):
 
     @staticmethod
     def template(f):
-        return '%s' % (EventHTMLFormater.blue('Else'))
+        return Command411Formater.html
 
 
 class Command112Formater(object):
 
     """Loop"""
 
+    html = '%s' % (EventHTMLFormater.blue('Loop'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -652,13 +769,15 @@ class Command112Formater(object):
 
     @staticmethod
     def template(f):
-        return '%s' % (EventHTMLFormater.blue('Loop'))
+        return Command112Formater.html
 
 
 class Command413Formater(object):
 
     """Repeat Above"""
 
+    html = '%s' % (EventHTMLFormater.blue('Repeat Above'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -666,13 +785,15 @@ class Command413Formater(object):
 
     @staticmethod
     def template(f):
-        return '%s' % (EventHTMLFormater.blue('Repeat Above'))
+        return Command413Formater.html
 
 
 class Command113Formater(object):
 
     """Break Loop"""
 
+    html = '%s' % (EventHTMLFormater.blue('Break Loop'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -680,13 +801,15 @@ class Command113Formater(object):
 
     @staticmethod
     def template(f):
-        return '%s' % (EventHTMLFormater.blue('Break Loop'))
+        return Command113Formater.html
 
 
 class Command115Formater(object):
 
     """Exit Event Processing"""
 
+    html = '%s' % (EventHTMLFormater.red(EventHTMLFormater.bold('Exit Event Processing')))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -694,13 +817,15 @@ class Command115Formater(object):
 
     @staticmethod
     def template(f):
-        return '%s' % (EventHTMLFormater.red(EventHTMLFormater.bold('Exit Event Processing')))
+        return Command115Formater.html
 
 
 class Command116Formater(object):
 
     """Erase Event"""
 
+    html = '%s' % (EventHTMLFormater.red(EventHTMLFormater.bold('Erase Event')))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -708,13 +833,16 @@ class Command116Formater(object):
 
     @staticmethod
     def template(f):
-        return '%s' % (EventHTMLFormater.red(EventHTMLFormater.bold('Erase Event')))
+        return Command116Formater.html
 
 
 class Command117Formater(object):
 
     """Call Common Event"""
 
+    html = '%s: ID [%s]' % (EventHTMLFormater.red(
+        'Call Common Event'), EventHTMLFormater.red(EventHTMLFormater.bold('%(commonevent_id)s')))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -723,15 +851,16 @@ class Command117Formater(object):
 
     @staticmethod
     def template(f):
-        template = '%s: ID [%s]' % (EventHTMLFormater.red(
-            'Call Common Event'), EventHTMLFormater.red(EventHTMLFormater.bold('%(commonevent_id)s')))
-        return template % f
+        return Command117Formater.html % f
 
 
 class Command118Formater(object):
 
     """Label"""
 
+    html = '%s: %s' % (
+        EventHTMLFormater.blue('Label'), EventHTMLFormater.green('%(label_name)s'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -740,15 +869,16 @@ class Command118Formater(object):
 
     @staticmethod
     def template(f):
-        template = '%s: %s' % (
-            EventHTMLFormater.blue('Label'), EventHTMLFormater.green('%(label_name)s'))
-        return template % f
+        return Command118Formater.html % f
 
 
 class Command119Formater(object):
 
     """Jump to Label"""
 
+    html = '%s: %s' % (EventHTMLFormater.blue('Jump to Label'), EventHTMLFormater.green(
+        EventHTMLFormater.italic('%(jump_to_name)s')))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -757,9 +887,7 @@ class Command119Formater(object):
 
     @staticmethod
     def template(f):
-        template = '%s: %s' % (EventHTMLFormater.blue('Jump to Label'), EventHTMLFormater.green(
-            EventHTMLFormater.italic('%(jump_to_name)s')))
-        return template % f
+        return Command119Formater.html % f
 
 
 class Command121Formater(object):
@@ -769,8 +897,7 @@ class Command121Formater(object):
     @staticmethod
     def formatCommand(params):
         f = {}
-        project = kernel.GlobalObjects["PROJECT"]
-        system = project.getData('System')
+        system = EventCommandFormater.getData('System')
         f['params'] = params
         f['switch_1_id'] = params[0]
         f['switch_1_name'] = system.switches[params[0]]
@@ -835,8 +962,7 @@ class Command122Formater(object):
     @staticmethod
     def template(f):
         template = '%s: ' % (EventHTMLFormater.red('Control Variables'))
-        project = kernel.GlobalObjects["PROJECT"]
-        system = project.getData('System')
+        system = EventCommandFormater.getData('System')
         # Draw variable or batch
         if f['batch_low'] == f['batch_high']:
             f['var_name'] = system.variables[f['batch_low']]
@@ -859,12 +985,12 @@ class Command122Formater(object):
             template += '%s(%s, %s)' % (EventHTMLFormater.bold('rand'),
                                         EventHTMLFormater.red('%(op_param1)s'), EventHTMLFormater.red('%(op_param2)s'))
         elif f['operand'] == 3:  # item
-            items = project.getData('Items')
+            items = EventCommandFormater.getData('Items')
             f['item_name'] = items[f['op_param1']].name
             template += '[%s: %s] In Inventory' % (
                 EventHTMLFormater.red('%(op_param1)04d'), EventHTMLFormater.red('%(item_name)s'))
         elif f['operand'] == 4:  # actor
-            actors = project.getData('Actors')
+            actors = EventCommandFormater.getData('Actors')
             f['actor_name'] = actors[f['op_param1']].name
             template += '[%s: %s].' % (
                 EventHTMLFormater.red('%(op_param1)04d'), EventHTMLFormater.red('%(actor_name)s'))
@@ -965,6 +1091,11 @@ class Command123Formater(object):
 
     """Control Self Switch"""
 
+    html = '%s: %s %s %s' % (EventHTMLFormater.red('Control Self Switch'),
+                             EventHTMLFormater.green('%(self_switch)s'),
+                             EventHTMLFormater.bold('='),
+                             EventHTMLFormater.green('%(switch_state)s'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -977,11 +1108,7 @@ class Command123Formater(object):
 
     @staticmethod
     def template(f):
-        template = '%s: %s %s %s' % (EventHTMLFormater.red('Control Self Switch'),
-                                     EventHTMLFormater.green('%(self_switch)s'),
-                                     EventHTMLFormater.bold('='),
-                                     EventHTMLFormater.green('%(switch_state)s'))
-        return template % f
+        return Command123Formater.html % f
 
 
 class Command124Formater(object):
@@ -1030,8 +1157,7 @@ class Command125Formater(object):
             template += '%s' % (
                 EventHTMLFormater.bold(EventHTMLFormater.red('%(operand)s')))
         else:                           # variable
-            project = kernel.GlobalObjects["PROJECT"]
-            system = project.getData('System')
+            system = EventCommandFormater.getData('System')
             f['var_name'] = system.variables[f['operand']]
             template += 'Variable [%s: %s]' % (
                 EventHTMLFormater.bold('%(operand)04d'), EventHTMLFormater.red('%(var_name)s'))
@@ -1054,8 +1180,7 @@ class Command126Formater(object):
 
     @staticmethod
     def template(f):
-        project = kernel.GlobalObjects["PROJECT"]
-        items = project.getData('Items')
+        items = EventCommandFormater.getData('Items')
         f['item_name'] = items[f['item_id']].name
         template = '%s: [%s: %s], %s' % (EventHTMLFormater.italic(EventHTMLFormater.green('Change Items')), EventHTMLFormater.blue('%(item_id)04d'),
                                          EventHTMLFormater.blue('%(item_name)s'), EventHTMLFormater.bold('%(operation)s'))
@@ -1063,7 +1188,7 @@ class Command126Formater(object):
             template += '%s' % (
                 EventHTMLFormater.bold(EventHTMLFormater.red('%(operand)s')))
         else:                           # variable
-            system = project.getData('System')
+            system = EventCommandFormater.getData('System')
             f['var_name'] = system.variables[f['operand']]
             template += 'Variable [%s: %s]' % (
                 EventHTMLFormater.bold('%(operand)04d'), EventHTMLFormater.red('%(var_name)s'))
@@ -1086,8 +1211,7 @@ class Command127Formater(object):
 
     @staticmethod
     def template(f):
-        project = kernel.GlobalObjects["PROJECT"]
-        weapons = project.getData('Weapons')
+        weapons = EventCommandFormater.getData('Weapons')
         f['weapon_name'] = weapons[f['weapon_id']].name
         template = '%s: [%s: %s], %s' % (EventHTMLFormater.italic(EventHTMLFormater.green('Change Weapons')), EventHTMLFormater.blue('%(weapon_id)04d'),
                                          EventHTMLFormater.blue('%(weapon_name)s'), EventHTMLFormater.bold('%(operation)s'))
@@ -1095,7 +1219,7 @@ class Command127Formater(object):
             template += '%s' % (
                 EventHTMLFormater.bold(EventHTMLFormater.red('%(operand)s')))
         else:                           # variable
-            system = project.getData('System')
+            system = EventCommandFormater.getData('System')
             f['var_name'] = system.variables[f['operand']]
             template += 'Variable [%s: %s]' % (
                 EventHTMLFormater.bold('%(operand)04d'), EventHTMLFormater.red('%(var_name)s'))
@@ -1118,8 +1242,7 @@ class Command128Formater(object):
 
     @staticmethod
     def template(f):
-        project = kernel.GlobalObjects["PROJECT"]
-        armors = project.getData('Armors')
+        armors = EventCommandFormater.getData('Armors')
         f['armor_name'] = armors[f['armor_id']].name
         template = '%s: [%s: %s], %s' % (EventHTMLFormater.italic(EventHTMLFormater.green('Change Armors')), EventHTMLFormater.blue('%(armor_id)04d'),
                                          EventHTMLFormater.blue('%(armor_name)s'), EventHTMLFormater.bold('%(operation)s'))
@@ -1127,7 +1250,7 @@ class Command128Formater(object):
             template += '%s' % (
                 EventHTMLFormater.bold(EventHTMLFormater.red('%(operand)s')))
         else:                           # variable
-            system = project.getData('System')
+            system = EventCommandFormater.getData('System')
             f['var_name'] = system.variables[f['operand']]
             template += 'Variable [%s: %s]' % (
                 EventHTMLFormater.bold('%(operand)04d'), EventHTMLFormater.red('%(var_name)s'))
@@ -1142,8 +1265,7 @@ class Command129Formater(object):
     def formatCommand(params):
         f = {}
         f['actor_id'] = params[0]
-        project = kernel.GlobalObjects["PROJECT"]
-        actors = project.getData('Actors')
+        actors = EventCommandFormater.getData('Actors')
         f['actor_name'] = actors[params[0]].name
         operation = {0: 'Add', 1: 'Remove'}
         f['operation'] = operation[params[1]]
@@ -1163,6 +1285,9 @@ class Command131Formater(object):
 
     """Change Windowskin"""
 
+    html = '%s: %s' % (EventHTMLFormater.bold(
+        'Change Windowskin'), EventHTMLFormater.green('%(winskin_name)s'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -1171,9 +1296,7 @@ class Command131Formater(object):
 
     @staticmethod
     def template(f):
-        template = '%s: %s' % (EventHTMLFormater.bold(
-            'Change Windowskin'), EventHTMLFormater.green('%(winskin_name)s'))
-        return template % f
+        return Command131Formater.html % f
 
 
 class Command132Formater(object):
@@ -1418,6 +1541,8 @@ class Command210Formater(object):
 
     """Wait for Move's Completion"""
 
+    html = '%s' % (EventHTMLFormater.bold('Wait for Move\'s Completion'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -1425,13 +1550,15 @@ class Command210Formater(object):
 
     @staticmethod
     def template(f):
-        return '%s' % (EventHTMLFormater.bold('Wait for Move\'s Completion'))
+        return Command210Formater.html
 
 
 class Command221Formater(object):
 
     """Prepare for Transition"""
 
+    html = '%s' % (EventHTMLFormater.bold('Prepare for Transition'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -1439,7 +1566,7 @@ class Command221Formater(object):
 
     @staticmethod
     def template(f):
-        return '%s' % (EventHTMLFormater.bold('Prepare for Transition'))
+        return Command221Formater.html
 
 
 class Command222Formater(object):
@@ -1652,6 +1779,8 @@ class Command247Formater(object):
 
     """Memorize BGM/BGS"""
 
+    html = '%s' % (EventHTMLFormater.bold('Memorize BGM/BGS'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -1659,13 +1788,15 @@ class Command247Formater(object):
 
     @staticmethod
     def template(f):
-        return '%s' % (EventHTMLFormater.bold('Memorize BGM/BGS'))
+        return Command247Formater.html
 
 
 class Command248Formater(object):
 
     """Restore BGM/BGS"""
 
+    html = '%s' % (EventHTMLFormater.bold('Restore BGM/BGS'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -1673,7 +1804,7 @@ class Command248Formater(object):
 
     @staticmethod
     def template(f):
-        return '%s' % (EventHTMLFormater.bold('Restore BGM/BGS'))
+        return Command248Formater.html
 
 
 class Command249Formater(object):
@@ -1714,6 +1845,8 @@ class Command251Formater(object):
 
     """Stop SE"""
 
+    html = '%s' % (EventHTMLFormater.bold('Stop SE'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -1721,7 +1854,7 @@ class Command251Formater(object):
 
     @staticmethod
     def template(f):
-        return '%s' % (EventHTMLFormater.bold('Stop SE'))
+        return Command251Formater.html
 
 
 class Command301Formater(object):
@@ -1789,15 +1922,14 @@ class Command302Formater(object):
         f = {}
         f['params'] = params
         f['shop_item_type'] = params[0]
-        project = kernel.GlobalObjects["PROJECT"]
         if params[0] == 0:
-            items = project.getData('Items')
+            items = EventCommandFormater.getData('Items')
             f['shop_item'] = items[params[1]]
         elif params[0] == 1:
-            weapons = project.getData('Weapons')
+            weapons = EventCommandFormater.getData('Weapons')
             f['shop_item'] = weapons[params[1]]
         elif params[0] == 2:
-            armors = project.getData('Armors')
+            armors = EventCommandFormater.getData('Armors')
             f['shop_item'] = armors[params[1]]
         else:
             pass
@@ -1902,8 +2034,7 @@ class Command314Formater(object):
     @staticmethod
     def formatCommand(params):
         f = {}
-        project = kernel.GlobalObjects["PROJECT"]
-        actors = project.getData('Actors')
+        actors = EventCommandFormater.getData('Actors')
         f['params'] = params
         f['actor_id'] = params[0]
         if params[0] > 0:
@@ -2166,6 +2297,8 @@ class Command340Formater(object):
 
     """Abort Battle"""
 
+    html = '%s' % (EventHTMLFormater.bold('Abort Battle'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -2173,13 +2306,15 @@ class Command340Formater(object):
 
     @staticmethod
     def template(f):
-        return '%s' % (EventHTMLFormater.bold('Abort Battle'))
+        return Command340Formater.html
 
 
 class Command351Formater(object):
 
     """Call Menu Screen"""
 
+    html = '%s' % (EventHTMLFormater.bold('Call Menu Screen'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -2187,13 +2322,15 @@ class Command351Formater(object):
 
     @staticmethod
     def template(f):
-        return '%s' % (EventHTMLFormater.bold('Call Menu Screen'))
+        return Command351Formater.html
 
 
 class Command352Formater(object):
 
     """Call Save Screen"""
 
+    html = EventHTMLFormater.color('#2C3539', 'Call Save Screen:')
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -2202,13 +2339,15 @@ class Command352Formater(object):
 
     @staticmethod
     def template(f):
-        return EventHTMLFormater.color('#2C3539', 'Call Save Screen:')
+        return Command352Formater.html
 
 
 class Command353Formater(object):
 
     """Game Over"""
 
+    html = '%s' % (EventHTMLFormater.bold(EventHTMLFormater.red('Game Over')))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -2216,13 +2355,15 @@ class Command353Formater(object):
 
     @staticmethod
     def template(f):
-        return '%s' % (EventHTMLFormater.bold(EventHTMLFormater.red('Game Over')))
+        return Command353Formater.html
 
 
 class Command354Formater(object):
 
     """Return to Title Screen"""
 
+    html = '%s' % (EventHTMLFormater.bold('Return to Title Screen'))
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -2230,7 +2371,7 @@ class Command354Formater(object):
 
     @staticmethod
     def template(f):
-        return '%s' % (EventHTMLFormater.bold('Return to Title Screen'))
+        return Command354Formater.html
 
 
 class Command355Formater(object):
@@ -2251,6 +2392,8 @@ class Command412Formater(object):
 
     """Conditional Branch End"""
 
+    html = EventHTMLFormater.blue('Branch End')
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -2258,13 +2401,15 @@ class Command412Formater(object):
 
     @staticmethod
     def template(f):
-        return EventHTMLFormater.blue('Branch End')
+        return Command412Formater.html
 
 
 class Command404Formater(object):
 
     """Show Choices Branch End"""
 
+    html = EventHTMLFormater.blue('Choices End')
+
     @staticmethod
     def formatCommand(params):
         f = {}
@@ -2272,7 +2417,7 @@ class Command404Formater(object):
 
     @staticmethod
     def template(f):
-        return EventHTMLFormater.blue('Choices End')
+        return Command404Formater.html
 
 
 class Command605Formater(object):
@@ -2284,16 +2429,18 @@ class Command605Formater(object):
         f = {}
         f['params'] = params
         f['shop_item_type'] = params[0]
-        project = kernel.GlobalObjects["PROJECT"]
         if params[0] == 0:
-            items = project.getData('Items')
+            items = EventCommandFormater.getData('Items')
             f['shop_item'] = items[params[1]]
         elif params[0] == 1:
-            weapons = project.getData('Weapons')
+            weapons = EventCommandFormater.getData('Weapons')
             f['shop_item'] = weapons[params[1]]
         elif params[0] == 2:
-            armors = project.getData('Armors')
+            armors = EventCommandFormater.getData('Armors')
             f['shop_item'] = armors[params[1]]
         else:
             pass
         return Command605Formater.template(f)
+
+
+EventCommandFormater.mapFormaters(globals())
@@ -1,5 +1,3 @@
-import welder_kernel as kernel
-
 import wx
 
 import wx.lib.agw.foldpanelbar as fpb
@@ -8,6 +6,7 @@ import wx.lib.scrolledpanel as scrolled
 
 from PyitectConsumes import PanelBase, RTPCache
 from PyitectConsumes import EditorGLPanel
+from PyitectConsumes import EventCommandFormater
 
 
 class EventPanel(wx.Panel, PanelBase):
@@ -649,7 +648,7 @@ class EventListCtrl(wx.HtmlListBox):
                 self.list.remove(command)
 
     def OnGetItem(self, n):
-        EventCommandFormater = kernel.System.load("EventCommandFormater")
+        # cached, only the first paint of a line formats it
         html = EventCommandFormater.format(self.list[n])
         return html
 
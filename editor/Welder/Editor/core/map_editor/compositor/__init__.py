@@ -0,0 +1,3 @@
+from .compositor import MapCompositorSprite
+from .compositor import MapCompositor
+from .thumbnails import MapThumbnailCache
@@ -0,0 +1,327 @@
+import math
+
+import numpy
+from PIL import Image
+
+
+def premultiply(rgba, opacity=255):
+    '''
+    turns a (..., 4) uint8 RGBA array into float32 RGBA in 0 - 1 with the
+    colour multiplied by alpha (and by opacity / 255)
+    '''
+    out = rgba.astype(numpy.float32) / 255.0
+    if opacity != 255:
+        out[..., 3] *= opacity / 255.0
+    out[..., :3] *= out[..., 3:]
+    return out
+
+
+def unpremultiply(canvas):
+    '''
+    turns premultiplied float32 RGBA back into (..., 4) uint8 RGBA
+    '''
+    alpha = canvas[..., 3:]
+    rgb = numpy.divide(canvas[..., :3], alpha,
+                       out=numpy.zeros_like(canvas[..., :3]), where=alpha > 0)
+    out = numpy.empty(canvas.shape, numpy.float32)
+    out[..., :3] = rgb
+    out[..., 3:] = alpha
+    return (numpy.clip(out, 0.0, 1.0) * 255.0 + 0.5).astype(numpy.uint8)
+
+
+class MapCompositorSprite(object):
+
+    '''
+    an event graphic ready to be blended onto a canvas, pixels is
+    premultiplied float32 RGBA and x, y the map pixel of its top left
+    '''
+
+    def __init__(self, event_id, pixels, x, y, z, blend_type=0):
+        self.event_id = event_id
+        self.pixels = pixels
+        self.x = x
+        self.y = y
+        self.z = z
+        self.blend_type = blend_type
+
+
+class MapCompositor(object):
+
+    '''
+    draws a map into an RGBA numpy array on the CPU, no OpenGL context is
+    needed. layers are drawn in order, tiles with a priority above 0 and
+    event graphics are sorted the way the RGSS Tilemap sorts them: a tile
+    with priority p on row y is drawn at z = 32 * (y + p + 1), a
+    character at z = 32 * (y + 1), plus 31 when it is taller than a tile.
+    the map is composited a band of rows at a time so the memory used
+    follows the size of the output, not the size of the map. below a zoom
+    of 1 the tiles and graphics are scaled down first and composited at
+    the output size
+
+    cache is the PIL cache (RTPCache), it provides the tile images and
+    the character graphics
+    '''
+
+    # tile rows composited at a time at full size, more when zoomed out
+    band_rows = 16
+
+    def __init__(self, map, tileset, cache):
+        self.map = map
+        self.tileset = tileset
+        self.cache = cache
+        # tile id - 48 -> (32, 32, 4) RGBA
+        self.tiles = self.cache.TileImages(
+            self.tileset.tileset_name, self.tileset.autotile_names)
+        # tile size -> self.tiles scaled to it
+        self.scaled_tiles = {32: self.tiles}
+        # tile id -> priority, ids past the end of the tileset's table are 0
+        self.tile_limit = 48 + len(self.tiles)
+        self.priorities = numpy.zeros(self.tile_limit, numpy.intp)
+        priorities = self.tileset.priorities._data[:self.tile_limit]
+        self.priorities[:len(priorities)] = priorities
+
+    def getSize(self):
+        '''
+        the map size in tiles
+        '''
+        shape = self.map.data.getShape()
+        return shape[0], shape[1]
+
+    def getTileIds(self, x0, y0, x1, y1, z):
+        '''
+        the ids of a block of a layer as a (rows, columns) array, ids with
+        no tile image are 0
+        '''
+        tids = self.map.data._data[x0:x1, y0:y1, z].T.astype(numpy.intp)
+        tids[(tids < 48) | (tids >= self.tile_limit)] = 0
+        return tids
+
+    @staticmethod
+    def getTileSize(zoom):
+        '''
+        the size in pixels tiles are composited at for zoom
+        '''
+        if zoom >= 1.0:
+            return 32
+        return max(1, int(math.ceil(32 * zoom)))
+
+    @staticmethod
+    def scale(pixels, size, width, height):
+        '''
+        a (rows, columns, 4) uint8 RGBA array scaled down to width by height
+        '''
+        if size == 32:
+            return pixels
+        return numpy.asarray(Image.fromarray(pixels, 'RGBA').resize(
+            (max(width, 1), max(height, 1)), Image.BOX))
+
+    def getTileImages(self, size):
+        '''
+        self.tiles scaled to size by size pixels
+        '''
+        tiles = self.scaled_tiles.get(size)
+        if tiles is None:
+            tiles = numpy.zeros((len(self.tiles), size, size, 4), numpy.uint8)
+            for index, tile in enumerate(self.tiles):
+                tiles[index] = self.scale(tile, size, size, size)
+            self.scaled_tiles[size] = tiles
+        return tiles
+
+    def getTilePixels(self, tids, mask, size=32):
+        '''
+        the premultiplied pixels of a (rows, columns) block of tile ids,
+        tiles outside of mask are left transparent
+        '''
+        rows, columns = tids.shape
+        pixels = self.getTileImages(size)[numpy.maximum(tids - 48, 0)]
+        pixels = pixels * mask[:, :, numpy.newaxis, numpy.newaxis, numpy.newaxis]
+        pixels = pixels.transpose(0, 2, 1, 3, 4).reshape(rows * size, columns * size, 4)
+        return premultiply(pixels)
+
+    def getEventSprites(self, size=32):
+        '''
+        a MapCompositorSprite for every event on the map with a graphic on
+        its first page, in event id order, scaled for tiles of size pixels
+        '''
+        sprites = []
+        for key in sorted(self.map.events.keys()):
+            event = self.map.events[key]
+            if not event.pages:
+                continue
+            page = event.pages[0]
+            graphic = page.graphic
+            if graphic.tile_id >= 384:
+                image = self.cache.Tile(
+                    self.tileset.tileset_name, graphic.tile_id,
+                    graphic.character_hue)
+                if image is None:
+                    continue
+                pixels = numpy.asarray(image)
+                x = event.x * 32
+                y = event.y * 32
+                priority = 0
+                if graphic.tile_id < self.tile_limit:
+                    priority = self.priorities[graphic.tile_id]
+                z = 32 * (event.y + priority + 1)
+            elif graphic.character_name:
+                image = self.cache.Character(
+                    graphic.character_name, graphic.character_hue)
+                if image is None:
+                    continue
+                sheet = numpy.asarray(image)
+                cw = sheet.shape[1] // 4
+                ch = sheet.shape[0] // 4
+                sx = graphic.pattern * cw
+                sy = (graphic.direction - 2) // 2 * ch
+                pixels = sheet[sy:sy + ch, sx:sx + cw]
+                x = event.x * 32 + 16 - cw // 2
+                y = event.y * 32 + 32 - ch
+                z = 32 * (event.y + 1)
+                if ch > 32:
+                    z += 31
+            else:
+                continue
+            if page.always_on_top:
+                z = float('inf')
+            if size != 32:
+                pixels = self.scale(
+                    pixels, size, int(round(pixels.shape[1] * size / 32.0)),
+                    int(round(pixels.shape[0] * size / 32.0)))
+                x = int(round(x * size / 32.0))
+                y = int(round(y * size / 32.0))
+            sprites.append(MapCompositorSprite(
+                key, premultiply(pixels, graphic.opacity), x, y, z,
+                graphic.blend_type))
+        return sprites
+
+    @staticmethod
+    def blit(canvas, pixels, left, top, blend_type=0):
+        '''
+        blends premultiplied pixels onto canvas with their top left corner
+        at left, top, clipped to the canvas. blend_type is 0 for normal,
+        1 for add and 2 for subtract
+        '''
+        height, width = canvas.shape[:2]
+        x0 = max(left, 0)
+        y0 = max(top, 0)
+        x1 = min(left + pixels.shape[1], width)
+        y1 = min(top + pixels.shape[0], height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        src = pixels[y0 - top:y1 - top, x0 - left:x1 - left]
+        dst = canvas[y0:y1, x0:x1]
+        if blend_type == 1:
+            dst[..., :3] = numpy.minimum(dst[..., :3] + src[..., :3], 1.0)
+        elif blend_type == 2:
+            dst[..., :3] = numpy.maximum(dst[..., :3] - src[..., :3], 0.0)
+        else:
+            dst *= 1.0 - src[..., 3:]
+            dst += src
+
+    def drawBand(self, x0, x1, y0, y1, layers, sprites, size=32):
+        '''
+        composites tile rows y0 <= y < y1 of columns x0 <= x < x1 with
+        tiles of size pixels, returns premultiplied float32 RGBA. sprites
+        come from getEventSprites for the same size
+        '''
+        canvas = numpy.zeros(((y1 - y0) * size, (x1 - x0) * size, 4), numpy.float32)
+        # (z, kind, order, draw arguments), tiles sort before events
+        items = []
+        for layer in layers:
+            tids = self.getTileIds(x0, y0, x1, y1, layer)
+            priorities = self.priorities[tids]
+            # tiles with priority 0 are under everything, in layer order
+            ground = (tids > 0) & (priorities == 0)
+            if ground.any():
+                pixels = self.getTilePixels(tids, ground, size)
+                canvas *= 1.0 - pixels[..., 3:]
+                canvas += pixels
+            for row in range(y1 - y0):
+                for priority in numpy.unique(priorities[row][tids[row] > 0]):
+                    if priority == 0:
+                        continue
+                    z = 32 * (y0 + row + int(priority) + 1)
+                    items.append((z, 0, layer, row, int(priority)))
+        for index, sprite in enumerate(sprites):
+            if (sprite.x < x1 * size and sprite.x + sprite.pixels.shape[1] > x0 * size and
+                    sprite.y < y1 * size and sprite.y + sprite.pixels.shape[0] > y0 * size):
+                items.append((sprite.z, 1, index, 0, 0))
+        items.sort()
+        for z, kind, order, row, priority in items:
+            if kind == 0:
+                tids = self.getTileIds(x0, y0 + row, x1, y0 + row + 1, order)
+                mask = self.priorities[tids] == priority
+                self.blit(canvas, self.getTilePixels(tids, mask, size), 0, row * size)
+            else:
+                sprite = sprites[order]
+                self.blit(canvas, sprite.pixels, sprite.x - x0 * size,
+                          sprite.y - y0 * size, sprite.blend_type)
+        return canvas
+
+    def Render(self, x=0, y=0, width=None, height=None, zoom=1.0,
+               layers=None, events=True):
+        '''
+        renders the tiles x <= tx < x + width, y <= ty < y + height (the
+        whole map by default) as a (rows, columns, 4) uint8 RGBA array
+        scaled by zoom. layers limits the drawn layers, events turns the
+        event graphics off
+        '''
+        map_width, map_height = self.getSize()
+        if width is None:
+            width = map_width - x
+        if height is None:
+            height = map_height - y
+        x0 = max(x, 0)
+        y0 = max(y, 0)
+        x1 = min(x + width, map_width)
+        y1 = min(y + height, map_height)
+        if layers is None:
+            layers = range(self.map.data.getShape()[2])
+        layers = list(layers)
+        size = MapCompositor.getTileSize(zoom)
+        band_rows = MapCompositor.band_rows * 32 // size
+        sprites = self.getEventSprites(size) if events else []
+        out_width = int(round((x1 - x0) * 32 * zoom))
+        out_height = int(round((y1 - y0) * 32 * zoom))
+        result = numpy.zeros((max(out_height, 0), max(out_width, 0), 4), numpy.uint8)
+        if out_width <= 0 or out_height <= 0:
+            return result
+        for band_y0 in range(y0, y1, band_rows):
+            band_y1 = min(band_y0 + band_rows, y1)
+            band = unpremultiply(
+                self.drawBand(x0, x1, band_y0, band_y1, layers, sprites, size))
+            top = int(round((band_y0 - y0) * 32 * zoom))
+            bottom = int(round((band_y1 - y0) * 32 * zoom))
+            if bottom <= top:
+                continue
+            if band.shape[:2] != (bottom - top, out_width):
+                resample = Image.NEAREST if zoom > 1.0 else Image.BOX
+                band = numpy.asarray(Image.fromarray(band, 'RGBA').resize(
+                    (out_width, bottom - top), resample))
+            result[top:bottom] = band
+        return result
+
+    def RenderImage(self, *args, **kwargs):
+        '''
+        Render as a PIL image
+        '''
+        return Image.fromarray(self.Render(*args, **kwargs), 'RGBA')
+
+    def Thumbnail(self, max_width, max_height, events=True):
+        '''
+        the whole map as a PIL image scaled down to fit in max_width by
+        max_height, small maps are not scaled up
+        '''
+        map_width, map_height = self.getSize()
+        if map_width <= 0 or map_height <= 0:
+            return Image.new('RGBA', (1, 1), (0, 0, 0, 0))
+        zoom = min(float(max_width) / (map_width * 32),
+                   float(max_height) / (map_height * 32), 1.0)
+        return self.RenderImage(zoom=zoom, events=events)
+
+    def Save(self, path, zoom=1.0, events=True):
+        '''
+        renders the whole map to an image file, the format follows the
+        extension of path
+        '''
+        self.RenderImage(zoom=zoom, events=events).save(path)
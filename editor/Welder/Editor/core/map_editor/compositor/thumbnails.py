@@ -0,0 +1,221 @@
+import os
+import copy
+import hashlib
+import threading
+import concurrent.futures
+
+import welder_kernel as kernel
+
+from .compositor import MapCompositor
+
+
+class MapThumbnailCache(object):
+
+    '''
+    PNG thumbnails of the maps of a project, kept in its Thumbnails folder
+    as MapXXX-<sha1 of the map's .arc>.png so a map is only rendered again
+    once its file changes. renders run on a pool of worker threads and
+    decode the map straight from its file, the editor's copy of the map
+    is never touched. the thumbnails follow the saved maps, a save is what
+    brings a thumbnail up to date. maps whose file has not changed since
+    it was last hashed are never handed to the pool
+    '''
+
+    # the largest thumbnail, in pixels
+    max_size = (192, 144)
+
+    def __init__(self, project, cache, workers=None):
+        self.project = project
+        # the PIL cache (RTPCache)
+        self.cache = cache
+        if workers is None:
+            workers = self.getWorkers()
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        # map id -> (size, mtime_ns, sha1) of the .arc last hashed
+        self._hashes = {}
+        # map id -> future of a render in flight
+        self._pending = {}
+
+    def getWorkers(self):
+        try:
+            workers = int(kernel.Config.getUnified()["Main"]["ThumbnailWorkers"])
+        except Exception:
+            workers = 2
+        return max(workers, 1)
+
+    def getFolder(self):
+        return os.path.join(os.path.dirname(self.project.getProjectPath()), "Thumbnails")
+
+    def getMapPath(self, map_id):
+        return os.path.join(
+            os.path.dirname(self.project.getProjectPath()), "Data", "Map%03d.arc" % map_id)
+
+    def getThumbnailPath(self, map_id, digest):
+        return os.path.join(self.getFolder(), "Map%03d-%s.png" % (map_id, digest))
+
+    def getKnownDigest(self, map_id, stat):
+        '''
+        the sha1 of the map's file if it was hashed since it last changed
+        '''
+        with self._lock:
+            record = self._hashes.get(map_id)
+        if record is not None and record[:2] == (stat.st_size, stat.st_mtime_ns):
+            return record[2]
+        return None
+
+    def hashMap(self, map_id):
+        path = self.getMapPath(map_id)
+        stat = os.stat(path)
+        digest = self.getKnownDigest(map_id, stat)
+        if digest is not None:
+            return digest
+        sha = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(65536), b""):
+                sha.update(block)
+        digest = sha.hexdigest()
+        with self._lock:
+            self._hashes[map_id] = (stat.st_size, stat.st_mtime_ns, digest)
+        return digest
+
+    def getCurrentPath(self, map_id):
+        '''
+        the path of the map's thumbnail if it is known to be up to date,
+        nothing is hashed or rendered
+        '''
+        try:
+            stat = os.stat(self.getMapPath(map_id))
+        except OSError:
+            return None
+        digest = self.getKnownDigest(map_id, stat)
+        if digest is not None:
+            path = self.getThumbnailPath(map_id, digest)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def Get(self, map_id):
+        '''
+        the path of an up to date thumbnail of the map, or None when there
+        is none yet, in which case one is requested
+        '''
+        if self.project.getProjectPath() == "":
+            return None
+        path = self.getCurrentPath(map_id)
+        if path is None:
+            self.Request(map_id)
+        return path
+
+    def getJob(self):
+        '''
+        what a render needs from the calling thread: the load context,
+        which fires events, and a copy of the tilesets so edits made while
+        the render runs can't reach it. one job is shared by a batch of
+        renders
+        '''
+        context = None
+        if self.project.load_context_func is not None:
+            context = self.project.load_context_func()
+        return context, copy.deepcopy(self.project.getData("Tilesets"))
+
+    def Request(self, map_id, callback=None, job=None):
+        '''
+        renders the map's thumbnail on the worker pool unless it is up to
+        date and returns a future for its path (None if the map could not
+        be drawn). callback is called with the future on a worker thread,
+        or right away when the thumbnail is already up to date, use
+        wx.CallAfter from it to touch the UI. job is from getJob, one is
+        made when it is needed and not given
+        '''
+        path = self.getCurrentPath(map_id)
+        if path is not None:
+            future = concurrent.futures.Future()
+            future.set_result(path)
+        else:
+            with self._lock:
+                future = self._pending.get(map_id)
+                if future is None or future.done():
+                    if self._executor is None:
+                        self._executor = concurrent.futures.ThreadPoolExecutor(
+                            max_workers=self.workers)
+                    if job is None:
+                        job = self.getJob()
+                    future = self._executor.submit(self._render, map_id, *job)
+                    self._pending[map_id] = future
+        if callback is not None:
+            future.add_done_callback(callback)
+        return future
+
+    def RequestAll(self, map_ids):
+        '''
+        brings the thumbnails of every map in map_ids up to date, only the
+        maps whose files changed are rendered
+        '''
+        if self.project.getProjectPath() == "":
+            return []
+        futures = []
+        job = None
+        for map_id in map_ids:
+            if job is None and self.getCurrentPath(map_id) is None:
+                job = self.getJob()
+            futures.append(self.Request(map_id, job=job))
+        return futures
+
+    def _render(self, map_id, context, tilesets):
+        if not os.path.isfile(self.getMapPath(map_id)):
+            return None
+        try:
+            digest = self.hashMap(map_id)
+            path = self.getThumbnailPath(map_id, digest)
+            if os.path.isfile(path):
+                return path
+            args = ()
+            if context is not None:
+                args = (context,)
+            map = self.project.load_func(
+                os.path.dirname(self.project.getProjectPath()), "Map%03d" % map_id, *args)
+            if map is None:
+                return None
+            tileset = tilesets[map.tileset_id]
+            image = MapCompositor(map, tileset, self.cache).Thumbnail(
+                *MapThumbnailCache.max_size)
+            folder = self.getFolder()
+            if not os.path.isdir(folder):
+                os.makedirs(folder, exist_ok=True)
+            temp_path = path + ".tmp"
+            image.save(temp_path, "PNG")
+            os.replace(temp_path, path)
+            self.removeStale(map_id, path)
+            return path
+        except Exception:
+            kernel.Log("Exception rendering the thumbnail of Map%03d" % map_id,
+                       "[MapThumbnailCache]", False, True)
+            return None
+
+    def removeStale(self, map_id, keep):
+        '''
+        deletes the older thumbnails of a map
+        '''
+        prefix = "Map%03d-" % map_id
+        keep = os.path.basename(keep)
+        for name in os.listdir(self.getFolder()):
+            if name.startswith(prefix) and name.endswith(".png") and name != keep:
+                try:
+                    os.remove(os.path.join(self.getFolder(), name))
+                except OSError:
+                    pass
+
+    def Close(self):
+        '''
+        drops the renders not yet started and lets the worker threads go
+        '''
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending = {}
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=False)
@@ -1 +1,2 @@
+from .controls import MapThumbnailPopup
 from .controls import MapTreeCtrl
@@ -2,6 +2,26 @@ import wx
 import welder_kernel as kernel
 
 
+class MapThumbnailPopup(wx.PopupWindow):
+
+    '''
+    a borderless window showing the thumbnail of the map under the mouse
+    '''
+
+    def __init__(self, parent):
+        wx.PopupWindow.__init__(self, parent, wx.BORDER_SIMPLE)
+        self.bitmap = wx.StaticBitmap(self, wx.ID_ANY, wx.NullBitmap)
+        self.path = None
+
+    def ShowThumbnail(self, path, position):
+        if path != self.path:
+            self.path = path
+            self.bitmap.SetBitmap(wx.Bitmap(path, wx.BITMAP_TYPE_PNG))
+            self.SetClientSize(self.bitmap.GetBestSize())
+        self.Position(position, (16, 16))
+        self.Show()
+
+
 class MapTreeCtrl(wx.TreeCtrl):
 
     def __init__(self, parent, id, pos, size, edit=False):
@@ -24,9 +44,16 @@ class MapTreeCtrl(wx.TreeCtrl):
         self.maps = {}
         self.struct = {0: []}
 
+        # map thumbnails, shown when the mouse rests on a map
+        self.thumbnails = None
+        self.preview = MapThumbnailPopup(self)
+        self.hover_map = None
+
         self.Expand(root)
 
         self.Bind(wx.EVT_WINDOW_DESTROY, self.onClose, self)
+        self.Bind(wx.EVT_MOTION, self.onMotion)
+        self.Bind(wx.EVT_LEAVE_WINDOW, self.onLeave)
 
         self.Refresh_Map_List()
 
@@ -118,7 +145,61 @@ class MapTreeCtrl(wx.TreeCtrl):
             else:
                 stack.append([key, value])
         self.Expand(root)
+        self.refreshThumbnails(project, mapinfos)
+
+    def refreshThumbnails(self, project, mapinfos):
+        '''
+        renders the thumbnails of the maps saved since they were last drawn
+        '''
+        if self.thumbnails is None or self.thumbnails.project is not project:
+            if self.thumbnails is not None:
+                self.thumbnails.Close()
+            MapThumbnailCache = kernel.System.load("MapThumbnailCache")
+            self.thumbnails = MapThumbnailCache(project, kernel.System.load("RTPCache"))
+        self.thumbnails.RequestAll(list(mapinfos.keys()))
+
+    def getMapAt(self, position):
+        item, flags = self.HitTest(position)
+        if item and item.IsOk() and flags & wx.TREE_HITTEST_ONITEMLABEL:
+            data = self.GetItemData(item)
+            if data:
+                return data[0]
+        return None
+
+    def showThumbnail(self, map_id):
+        if self.thumbnails is None or map_id != self.hover_map:
+            return
+        path = self.thumbnails.Get(map_id)
+        if path is not None:
+            self.preview.ShowThumbnail(path, wx.GetMousePosition())
+
+    def onThumbnailRendered(self, map_id):
+        # called through wx.CallAfter once a render finishes
+        if self and map_id == self.hover_map:
+            self.showThumbnail(map_id)
+
+    def onMotion(self, event):
+        map_id = self.getMapAt(event.GetPosition())
+        if map_id != self.hover_map:
+            self.hover_map = map_id
+            self.preview.Hide()
+            if map_id is not None and self.thumbnails is not None:
+                path = self.thumbnails.Get(map_id)
+                if path is not None:
+                    self.preview.ShowThumbnail(path, wx.GetMousePosition())
+                else:
+                    # shown once rendered, if the mouse is still there
+                    self.thumbnails.Request(
+                        map_id, lambda future: wx.CallAfter(self.onThumbnailRendered, map_id))
+        event.Skip()
+
+    def onLeave(self, event):
+        self.hover_map = None
+        self.preview.Hide()
+        event.Skip()
 
     def onClose(self, event):
         kernel.System.unbind_event('RefreshProject', self.Refresh_Map_List)
+        if self.thumbnails is not None:
+            self.thumbnails.Close()
         event.Skip()
@@ -0,0 +1 @@
+from .map_tools import MapTools
@@ -0,0 +1,135 @@
+from bisect import bisect_left, bisect_right
+
+import numpy
+
+from PyitectConsumes import TableEditAction
+
+
+class MapTools(object):
+
+    '''
+    whole layer edits for the map editor. each one works out the cells it
+    touches with numpy and applies them as a single TableEditAction with a
+    mask, so it is one undo step however many cells change
+    '''
+
+    @staticmethod
+    def getRuns(same):
+        '''
+        the runs of True cells along each row of a (rows, columns) bool
+        array as row, start and end (exclusive) lists, in row order
+        '''
+        rows = same.shape[0]
+        padded = numpy.zeros((rows, same.shape[1] + 2), numpy.int8)
+        padded[:, 1:-1] = same
+        steps = numpy.diff(padded, axis=1)
+        run_rows, starts = numpy.nonzero(steps == 1)
+        ends = numpy.nonzero(steps == -1)[1]
+        return run_rows.tolist(), starts.tolist(), ends.tolist()
+
+    @staticmethod
+    def getFillMask(table, x, y, z):
+        '''
+        a (width, height) bool mask of the cells of layer z joined to x, y
+        (up, down, left or right) that hold the same tile id as x, y.
+        the layer is cut into runs of matching cells along each row and
+        the fill spreads between runs that touch on the rows above and
+        below, so the work follows the number of runs, not cells
+        '''
+        layer = table._data[:, :, z]
+        # rows are y
+        same = numpy.ascontiguousarray((layer == layer[x, y]).T)
+        height, width = same.shape
+        run_rows, starts, ends = MapTools.getRuns(same)
+        # the first run of every row, and one past the last
+        row_first = numpy.searchsorted(run_rows, numpy.arange(height + 1)).tolist()
+        seed = bisect_right(starts, x, row_first[y], row_first[y + 1]) - 1
+        filled = [False] * len(starts)
+        filled[seed] = True
+        pending = [seed]
+        while pending:
+            run = pending.pop()
+            row = run_rows[run]
+            start = starts[run]
+            end = ends[run]
+            for other_row in (row - 1, row + 1):
+                if other_row < 0 or other_row >= height:
+                    continue
+                first = row_first[other_row]
+                last = row_first[other_row + 1]
+                # the runs of that row overlapping start <= column < end
+                begin = bisect_right(ends, start, first, last)
+                stop = bisect_left(starts, end, first, last)
+                for other in range(begin, stop):
+                    if not filled[other]:
+                        filled[other] = True
+                        pending.append(other)
+        # paint the filled runs back into a mask with a running sum
+        filled = numpy.flatnonzero(filled)
+        edges = numpy.zeros((height, width + 1), numpy.int32)
+        rows = numpy.asarray(run_rows)[filled]
+        numpy.add.at(edges, (rows, numpy.asarray(starts)[filled]), 1)
+        numpy.add.at(edges, (rows, numpy.asarray(ends)[filled]), -1)
+        return numpy.cumsum(edges, axis=1)[:, :width].T > 0
+
+    @staticmethod
+    def getLayerMask(table, layer_mask, z):
+        '''
+        a mask over the whole table from a (width, height) mask of layer z
+        '''
+        mask = numpy.zeros(table._data.shape, bool)
+        mask[:, :, z] = layer_mask
+        return mask
+
+    @staticmethod
+    def applyMask(table, mask, value):
+        action = TableEditAction(
+            table, {"dim": len(table.getShape()), "index": mask, "value": value})
+        action.apply()
+        return action
+
+    @staticmethod
+    def Fill(table, x, y, z, tile_id):
+        '''
+        bucket fill of tile_id from x, y on layer z, returns the action
+        '''
+        mask = MapTools.getFillMask(table, x, y, z)
+        return MapTools.applyMask(
+            table, MapTools.getLayerMask(table, mask, z), tile_id)
+
+    @staticmethod
+    def Replace(table, old_id, new_id, layers=None):
+        '''
+        replaces old_id with new_id across the map, or only on the layers
+        listed, returns the action
+        '''
+        mask = table._data == old_id
+        if layers is not None:
+            keep = numpy.zeros(mask.shape[2], bool)
+            keep[list(layers)] = True
+            mask &= keep
+        return MapTools.applyMask(table, mask, new_id)
+
+    @staticmethod
+    def Paint(table, x, y, z, tile_ids, mask=None):
+        '''
+        writes a (width, height) block of tile ids to layer z with its top
+        left at x, y, clipped to the map. cells where mask (the same shape
+        as tile_ids) is False are left alone. returns the action
+        '''
+        tile_ids = numpy.asarray(tile_ids, numpy.int16)
+        if mask is None:
+            mask = numpy.ones(tile_ids.shape, bool)
+        shape = table._data.shape
+        x0 = max(x, 0)
+        y0 = max(y, 0)
+        x1 = min(x + tile_ids.shape[0], shape[0])
+        y1 = min(y + tile_ids.shape[1], shape[1])
+        layer_mask = numpy.zeros(shape[:2], bool)
+        layer_ids = numpy.zeros(shape[:2], numpy.int16)
+        if x0 < x1 and y0 < y1:
+            block = (slice(x0 - x, x1 - x), slice(y0 - y, y1 - y))
+            layer_mask[x0:x1, y0:y1] = mask[block]
+            layer_ids[x0:x1, y0:y1] = tile_ids[block]
+        full_mask = MapTools.getLayerMask(table, layer_mask, z)
+        return MapTools.applyMask(table, full_mask, layer_ids[layer_mask])
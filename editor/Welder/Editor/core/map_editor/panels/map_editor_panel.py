@@ -29,12 +29,17 @@ class MapEditorPanel(wx.Panel, PanelBase):
         "Snappable": True
     }
 
-    def __init__(self, parent, map, tilesets):
+    def __init__(self, parent, map, tilesets, map_id=None):
         '''lays out a toolbar and the map window'''
         super(MapEditorPanel, self).__init__(parent)
         
         # set data
         self.map = map
+        self.map_id = map_id
+        # keep the map loaded while it is open here
+        self.project = kernel.GlobalObjects["PROJECT"]
+        if self.map_id is not None and self.project is not None:
+            self.project.pinMapData(self.map_id)
         self.caption = "Map Editor:"
         self.panel_name = "Map Editor:"
         self.tilesets = tilesets
@@ -49,6 +54,12 @@ class MapEditorPanel(wx.Panel, PanelBase):
         self.Layout()
 
         self.Bind(wx.EVT_UPDATE_UI, self.updateUI)
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.onClose, self)
+
+    def onClose(self, event):
+        if self.map_id is not None and self.project is not None:
+            self.project.releaseMapData(self.map_id)
+        event.Skip()
         
 
     def Create_Toolbar(self):
@@ -61,7 +61,7 @@ class MapManagerPanel(wx.Panel, PanelBase):
             kernel.GlobalObjects["PanelManager"].dispatchPanel(
                 "MapEditorPanel",
                 "MapEditorPanel" + str(map_id),
-                arguments=[map_data, tilesets],
+                arguments=[map_data, tilesets, map_id],
                 info={
                     "Name": "MapEditorPanel" + str(map_id),
                     "Caption": "[" + str(map_id) + "] " + name
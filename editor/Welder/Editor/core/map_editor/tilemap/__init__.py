@@ -1,6 +1,7 @@
 from .tilemap import TilemapEventStruct
 from .tilemap import TilemapEventGrid
 from .tilemap import TilemapTileGrid
+from .tilemap import TilemapChunk
 from .tilemap import Tilemap
 from .tilemap import TilemapMouseSprite
 from .tilemap import TilemapMouseManager
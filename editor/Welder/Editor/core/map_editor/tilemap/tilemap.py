@@ -1,9 +1,13 @@
 import rabbyt
 import numpy
 import pyglet
+from pyglet import gl
 
 import welder_kernel as kernel
 
+from PyitectConsumes import ActionManager
+from PyitectConsumes import EventIndex
+
 
 class TilemapEventStruct(object):
 
@@ -26,7 +30,10 @@ class TilemapEventGrid(object):
 
     '''
     A organizer class, organizes and updates the sprites for events and
-    their background when they are drawn in the editor
+    their background when they are drawn in the editor. the sprites are
+    only touched when an event is edited (the "EventEdited" and
+    "MapEdited" kernel events) and drawing asks the map's EventIndex for
+    the events on screen
     '''
 
     def __init__(self, map, cache, tileset=""):
@@ -34,16 +41,15 @@ class TilemapEventGrid(object):
         self.map = map
         self.cache = cache
         self.tileset_name = tileset
-        # setup the rendering batch and the oarding groups
         # set up data containers
         self.events = {}
         self.sprites = {}
-        self.graphics = []
-        self.backgrounds = []
         # setup the outline image used for background sprites
         self.setupOutline()
         # update the sprites
         self.update()
+        kernel.System.bind_event("EventEdited", self.onEventEdited)
+        kernel.System.bind_event("MapEdited", self.onMapEdited)
 
     def setupOutline(self):
         '''
@@ -64,20 +70,16 @@ class TilemapEventGrid(object):
         '''
         # get event
         event = self.events[key]
+        bitmap = None
         # if the graphic is a tile
         if event.tile_id >= 384:
             bitmap = self.cache.Tile(
                 self.tileset_name, event.tile_id, event.hue)
-            if not bitmap:
-                bitmap = self.cache.Tile(
-                    self.tileset_name, event.tile_id, event.hue)
             if bitmap:
                 rect = (5, 5, 22, 22)
         # other wise the graphic is a sprite
         else:
             bitmap = self.cache.Character(event.name, event.hue)
-            if not bitmap:
-                bitmap = self.cache.Character(event.name, event.hue)
             if bitmap:
                 cw = bitmap.width // 4
                 ch = bitmap.height // 4
@@ -90,23 +92,23 @@ class TilemapEventGrid(object):
             image = pyglet.image.create(32, 32).get_texture()
             region = bitmap.get_region(*rect)
             image.blit_into(region, 5, 5, 0)
-        xpos = event.x * 32 + 16
-        ypos = ((self.map.height - event.y) * 32) - 32 + 16
-        if key not in self.sprites or self.sprites[key][0] is None:
-            sprite = None
-            if bitmap:
-                sprite = rabbyt.Sprite(image, x=xpos, y=ypos)
-                self.graphics.append(sprite)
+        xpos, ypos = self.getSpritePosition(event)
+        if key not in self.sprites:
             background = rabbyt.Sprite(
                 self.eventOutline.get_texture(), x=xpos, y=ypos)
-            self.backgrounds.append(background)
-            self.sprites[key] = [sprite, background]
-        else:
-            if bitmap:
-                self.sprites[key][0].texture = image
+            self.sprites[key] = [None, background]
+        if bitmap:
+            if self.sprites[key][0] is None:
+                self.sprites[key][0] = rabbyt.Sprite(image, x=xpos, y=ypos)
             else:
-                self.graphics.remove(self.sprites[key][0])
-                self.sprites[key][0] = None
+                self.sprites[key][0].texture = image
+        else:
+            self.sprites[key][0] = None
+
+    def getSpritePosition(self, event):
+        xpos = event.x * 32 + 16
+        ypos = ((self.map.height - event.y) * 32) - 32 + 16
+        return xpos, ypos
 
     def updateEvent(self, key):
         '''
@@ -116,7 +118,7 @@ class TilemapEventGrid(object):
         # get event
         flag = False
         mapEvent = self.map.events[key]
-        graphic = self.map.events[key].pages[0].graphic
+        graphic = mapEvent.pages[0].graphic
         if key not in self.events:
             event = TilemapEventStruct(mapEvent.x, mapEvent.y, graphic.tile_id, graphic.character_name,
                                        graphic.character_hue, graphic.direction, graphic.pattern)
@@ -126,16 +128,13 @@ class TilemapEventGrid(object):
             event = self.events[key]
             if event.x != mapEvent.x:
                 event.x = mapEvent.x
-            if event.y != mapEvent.x:
+            if event.y != mapEvent.y:
                 event.y = mapEvent.y
-            xpos = event.x * 32 + 16
-            ypos = ((self.map.height - event.y) * 32) - 32 + 16
+            xpos, ypos = self.getSpritePosition(event)
             if key in self.sprites:
-                if self.sprites[key][0] is not None:
-                    if self.sprites[key][0].x != xpos or self.sprites[key][0].y != ypos:
-                        self.sprites[key][0].xy = xpos, ypos
-                    if self.sprites[key][1].x != xpos or self.sprites[key][1].y != ypos:
-                        self.sprites[key][1].xy = xpos, ypos
+                for sprite in self.sprites[key]:
+                    if sprite is not None and (sprite.x != xpos or sprite.y != ypos):
+                        sprite.xy = xpos, ypos
             if event.tile_id != graphic.tile_id:
                 flag = True
                 event.tile_id = graphic.tile_id
@@ -153,123 +152,210 @@ class TilemapEventGrid(object):
                 event.pattern = graphic.pattern
         if flag:
             self.setEventGraphic(key)
-        # test values that are drawn to see if the graphic (or position) need
-        # to be updated
+
+    def removeEvent(self, key):
+        self.events.pop(key, None)
+        self.sprites.pop(key, None)
 
     def update(self):
         '''
         loops through every event and removes sprites for events that have been deleted,
-        then calls the updateEvent method for the rest of the events
-        '''
-        b = set(self.map.events.keys())
-        a = list(self.events.keys())
-        removed = [x for x in a if x not in b]
-        for key in removed:
-            self.graphics.remove(self.sprites[key][0])
-            self.backgrounds.remove(self.sprites[key][1])
-            del self.events[key]
-            del self.sprites[key]
+        then calls the updateEvent method for the rest of the events. only
+        needed when the events of the map were replaced, single edits go
+        through onEventEdited
+        '''
+        for key in [key for key in self.events if key not in self.map.events]:
+            self.removeEvent(key)
         for key in self.map.events.keys():
             self.updateEvent(key)
 
-    def Draw(self):
+    def onEventEdited(self, obj):
+        '''
+        obj is an edited event, event page or page graphic
+        '''
+        index = EventIndex.forMap(self.map)
+        key = index.getEventKey(obj)
+        if key is None:
+            # an event put on or taken off this map
+            key = getattr(obj, "id", None)
+            if key is None:
+                return
+            if self.map.events.get(key) is obj:
+                index.updateEvent(obj)
+        if key in self.map.events:
+            self.updateEvent(key)
+        elif key in self.events:
+            self.removeEvent(key)
+
+    def onMapEdited(self, map):
+        if map is self.map:
+            self.update()
+
+    def getVisibleSprites(self, x, y, width, height):
+        graphics = []
+        backgrounds = []
+        index = EventIndex.forMap(self.map)
+        for key in index.getEventIdsIn(x, y, x + width, y + height):
+            if key not in self.sprites:
+                continue
+            sprite, background = self.sprites[key]
+            if sprite is not None:
+                graphics.append(sprite)
+            backgrounds.append(background)
+        return graphics, backgrounds
+
+    def Draw(self, x, y, width, height):
         '''
-        Draws the rendering batch and thus all the attached sprites
+        Draws the sprites of the events on screen
         '''
-        rabbyt.render_unsorted(self.backgrounds)
-        rabbyt.render_unsorted(self.graphics)
+        graphics, backgrounds = self.getVisibleSprites(x, y, width, height)
+        rabbyt.render_unsorted(backgrounds)
+        rabbyt.render_unsorted(graphics)
+
+    def Close(self):
+        kernel.System.unbind_event("EventEdited", self.onEventEdited)
+        kernel.System.unbind_event("MapEdited", self.onMapEdited)
 
 
 class TilemapTileGrid(object):
 
     '''
-    A container and organizer class. maintains sprites that form a transparent
-    grid over the tilemap when in the event mode
+    draws a transparent grid over the tilemap when in the event mode, as a
+    single quad over the part of the map on screen with the outline of a
+    tile repeated across it
     '''
 
     def __init__(self, map):
         # store the map
         self.map = map
-        # create an image for the sprites
-        self.grid_image = pyglet.image.create(32, 32)
-        # get a rendering batch to draw the grid quickly
-        self.renderingBatch = pyglet.graphics.Batch()
         # setup the grid image
         self.setupGridImage()
-        # create all the sprites in the grid and store them in a numpy array of
-        # dtype object
-        self.sprites = self.createGrid()
 
     def setupGridImage(self):
         '''
         draws the black outline around the edge of the tile
         '''
-        self.black_pattern = pyglet.image.SolidColorImagePattern(
-            (0, 0, 0, 255))
-        self.grid_image = self.black_pattern.create_image(32, 32).get_texture()
-        self.cut_pattern = pyglet.image.create(30, 30)
-        self.grid_image.blit_into(self.cut_pattern, 1, 1, 0)
-
-    def createGrid(self):
-        '''
-        loops through the maps x and y to create all the necessary sprites
-        '''
-        shape = (self.map.width, self.map.height)
-        sprites = numpy.empty(shape, dtype=object)
-        for x in range(shape[0]):
-            for y in range(shape[1]):
-                sprite = self.makeSprite(x, y)
-                sprites[x, y] = sprite
-        return sprites
-
-    def makeSprite(self, x, y):
-        xpos = x * 32 + 16
-        ypos = ((self.map.height - y) * 32) - 32 + 16
-        sprite = rabbyt.Sprite(self.grid_image.get_texture(), x=xpos, y=ypos)
-        sprite.alpha = 0.3
-        return sprite
+        pixels = numpy.zeros((32, 32, 4), numpy.uint8)
+        pixels[[0, -1], :, 3] = 255
+        pixels[:, [0, -1], 3] = 255
+        self.grid_image = pyglet.image.ImageData(
+            32, 32, 'RGBA', pixels.tobytes()).get_texture()
+        gl.glBindTexture(self.grid_image.target, self.grid_image.id)
+        gl.glTexParameteri(self.grid_image.target, gl.GL_TEXTURE_WRAP_S, gl.GL_REPEAT)
+        gl.glTexParameteri(self.grid_image.target, gl.GL_TEXTURE_WRAP_T, gl.GL_REPEAT)
 
     def update(self):
         '''
-        updates the sprites in the grid so that if the map size changes the grid changes too
+        the grid follows the map size when drawn, nothing to do
         '''
-        # if it isn't the same size as the map
-        shape = (self.map.width, self.map.height)
-        if self.sprites.shape != shape:
-            self.resize(*shape)
+        pass
 
     def Draw(self, x, y, width, height):
         '''
-        draws the rendering batch and thus all the attached sprites
-        '''
-        rabbyt.render_unsorted(
-            self.sprites[x:x + width, y:y + height].flatten())
+        draws the grid over tiles x <= tx < x + width, y <= ty < y + height
+        '''
+        width = min(width, self.map.width - x)
+        height = min(height, self.map.height - y)
+        if width <= 0 or height <= 0:
+            return
+        left = x * 32
+        right = (x + width) * 32
+        bottom = (self.map.height - y - height) * 32
+        top = (self.map.height - y) * 32
+        gl.glEnable(self.grid_image.target)
+        gl.glBindTexture(self.grid_image.target, self.grid_image.id)
+        gl.glColor4f(1.0, 1.0, 1.0, 0.3)
+        pyglet.graphics.draw(
+            4, gl.GL_QUADS,
+            ('v2i', (left, bottom, right, bottom, right, top, left, top)),
+            ('t2f', (0.0, 0.0, float(width), 0.0,
+                     float(width), float(height), 0.0, float(height))))
+        gl.glColor4f(1.0, 1.0, 1.0, 1.0)
+        gl.glDisable(self.grid_image.target)
+
+
+class TilemapChunk(object):
 
-    def resize(self, xsize=1, ysize=1):
-        '''
-        '''
-        newdata = numpy.empty((xsize, ysize), dtype=object)
-        shape = self.sprites.shape
-        mask = [0, 0, 0]
-        if xsize >= shape[0]:
-            mask[0] = shape[0]
-        else:
-            mask[0] = xsize
-        if ysize >= shape[1]:
-            mask[1] = shape[1]
-        else:
-            mask[1] = ysize
-        newdata[:mask[0], :mask[1]] = self.sprites[:mask[0], :mask[1]]
-        self.sprites = newdata
-        shape = self.sprites.shape
-        for x in range(shape[0]):
-            for y in range(shape[1]):
-                if self.sprites[x, y] is None:
-                    self.sprites[x, y] = self.makeSprite(x, y)
-                else:
-                    xpos = x * 32 + 16
-                    ypos = ((self.map.height - y) * 32) - 32 + 16
-                    self.sprites[x, y].xy = xpos, ypos
+    '''
+    a square block of the map. every layer of the block is baked into its
+    own rendering batch of quads textured from the tile atlas, and only
+    rebuilt when the chunk is marked dirty. the quads carry no colour, the
+    layer opacity is set by the tilemap as GL state before drawing.
+    chunks are built the first time they are on screen so the cost of
+    opening and drawing a map follows what is visible, not the size of
+    the map
+    '''
+
+    size = 16
+
+    def __init__(self, tilemap, cx, cy):
+        self.tilemap = tilemap
+        self.cx = cx
+        self.cy = cy
+        self.batches = []
+        self.vertex_lists = []
+        self.dirty = True
+
+    def getBounds(self):
+        shape = self.tilemap.table.getShape()
+        x0 = self.cx * TilemapChunk.size
+        y0 = self.cy * TilemapChunk.size
+        x1 = min(x0 + TilemapChunk.size, shape[0])
+        y1 = min(y0 + TilemapChunk.size, shape[1])
+        return x0, y0, x1, y1
+
+    def build(self):
+        '''
+        rebuilds the batches from the tile ids in the table
+        '''
+        self.delete()
+        x0, y0, x1, y1 = self.getBounds()
+        atlas = self.tilemap.atlas
+        textures = atlas.getTextures()
+        data = self.tilemap.table._data
+        # the quad of every cell in the block, bottom left, bottom right,
+        # top right, top left. y runs down from the top edge of the map so
+        # the quads stay put when the map height changes, Tilemap.Draw
+        # moves them into place
+        xs, ys = numpy.meshgrid(
+            numpy.arange(x0, x1), numpy.arange(y0, y1), indexing='ij')
+        left = xs * 32
+        bottom = -(ys + 1) * 32
+        quads = numpy.stack((left, bottom, left + 32, bottom,
+                             left + 32, bottom + 32, left, bottom + 32), -1)
+        for z in range(data.shape[2]):
+            batch = pyglet.graphics.Batch()
+            vertex_lists = []
+            tids = data[x0:x1, y0:y1, z].astype(numpy.intp)
+            # ids outside of the atlas draw as blank tiles
+            tids[(tids < 0) | (tids >= len(atlas.pages))] = 0
+            pages = atlas.pages[tids]
+            for page_index, texture in enumerate(textures):
+                mask = pages == page_index
+                count = int(mask.sum())
+                if count == 0:
+                    continue
+                vertex_lists.append(batch.add(
+                    4 * count, gl.GL_QUADS, pyglet.graphics.TextureGroup(texture),
+                    ('v2i', quads[mask].ravel().tolist()),
+                    ('t3f', atlas.tex_coords[tids[mask]].ravel().tolist())))
+            self.batches.append(batch)
+            self.vertex_lists.append(vertex_lists)
+        self.dirty = False
+
+    def delete(self):
+        for vertex_lists in self.vertex_lists:
+            for vertex_list in vertex_lists:
+                vertex_list.delete()
+        self.batches = []
+        self.vertex_lists = []
+        self.dirty = True
+
+    def Draw(self, layer):
+        if self.dirty:
+            self.build()
+        if layer < len(self.batches):
+            self.batches[layer].draw()
 
 
 class Tilemap(object):
@@ -279,8 +365,9 @@ class Tilemap(object):
         self.cache = cache
 
         self.table = table
-        self.tile_ids = numpy.zeros(self.table.getShape(), order='F')
-        self.blank_tile = pyglet.image.create(32, 32)
+        # the shape and table version the chunks were last checked against
+        self.shape = self.table.getShape()
+        self.table_version = self.table.version
 
         # diming image
         self.dimmingImagePatteren = None
@@ -302,7 +389,11 @@ class Tilemap(object):
         # tileset name
         self.tileset_name = tileset
 
-        self.tiles = self.createTilemap()
+        # the tileset and autotiles packed into a few textures
+        self.atlas = self.cache.TileAtlas(self.tileset_name, self.autotile_names)
+        self.layer_opacity = [1.0] * self.table.getShape()[2]
+        # (cx, cy) -> TilemapChunk, created when first drawn
+        self.chunks = {}
 
     def updateDimmingSprite(self, width, height, scale):
         '''
@@ -326,128 +417,66 @@ class Tilemap(object):
         if self.dimmingSprite is not None:
             self.dimmingSprite.xy = x, y
 
-    def createTilemap(self):
+    def getChunk(self, cx, cy):
+        key = (cx, cy)
+        if key not in self.chunks:
+            self.chunks[key] = TilemapChunk(self, cx, cy)
+        return self.chunks[key]
+
+    def markDirty(self, x0, y0, x1, y1):
         '''
-        create the tilemap
+        marks the chunks holding tiles x0 <= x < x1, y0 <= y < y1 for a
+        rebuild, chunks that were never built are left alone
         '''
-        shape = self.table.getShape()
-        sprites = numpy.empty(shape, dtype=object, order='F')
-        for x in range(shape[0]):
-            for y in range(shape[1]):
-                for z in range(shape[2]):
-                    sprites[x, y, z] = self.makeSprite(x, y, z)
-        return sprites
-
-    def resizeTilemap(self, tiles, shape):
-        newtiles = numpy.empty(shape, dtype=object, order='F')
-        mask = [0, 0, 0]
-        tileshape = tiles.shape
-        if shape[0] >= tileshape[0]:
-            mask[0] = tileshape[0]
-        else:
-            mask[0] = shape[0]
-        if shape[1] >= tileshape[1]:
-            mask[1] = tileshape[1]
-        else:
-            mask[1] = shape[1]
-        if shape[2] >= tileshape[2]:
-            mask[2] = tileshape[2]
-        else:
-            mask[2] = shape[2]
-        newtiles[:mask[0], :mask[1], :mask[2]] = tiles[
-            :mask[0], :mask[1], :mask[2]]
-        indexes = numpy.argwhere(newtiles == numpy.array([None]))
-        for x, y, z in indexes:
-            newtiles[x, y, z] = self.makeSprite(x, y, z)
-        return newtiles
-
-    def resizeTileIDs(self, newshape):
-        newids = numpy.zeros(newshape, dtype=numpy.int16, order='F')
-        shape = self.tile_ids.shape
-        mask = [0, 0, 0]
-        if newshape[0] >= shape[0]:
-            mask[0] = shape[0]
-        else:
-            mask[0] = newshape[0]
-        if newshape[1] >= shape[1]:
-            mask[1] = shape[1]
-        else:
-            mask[1] = newshape[1]
-        if newshape[2] >= shape[2]:
-            mask[2] = shape[2]
-        else:
-            mask[2] = newshape[2]
-        newids[:mask[0], :mask[1], :mask[2]] = self.tile_ids[
-            :mask[0], :mask[1], :mask[2]]
-        self.tile_ids = newids
-
-    def makeSprite(self, x, y, z, texture=None):
-        xpos = x * 32 + 16
-        ypos = ((self.table.getShape()[1] - y) * 32) - 32 + 16
-        if texture is None:
-            texture = self.blank_tile.get_texture()
-        sprite = rabbyt.Sprite(texture, x=xpos, y=ypos)
-        return sprite
+        size = TilemapChunk.size
+        for cx in range(x0 // size, (x1 - 1) // size + 1):
+            for cy in range(y0 // size, (y1 - 1) // size + 1):
+                chunk = self.chunks.get((cx, cy))
+                if chunk is not None:
+                    chunk.dirty = True
+
+    def resize(self, xsize=1, ysize=1, zsize=1):
+        '''
+        drops the chunks that are now off the map, the cells the resize
+        changed come through the table's change journal like any other
+        write so only the chunks holding them are rebuilt
+        '''
+        self.shape = self.table.getShape()
+        opacity = self.layer_opacity[:zsize]
+        self.layer_opacity = opacity + [1.0] * (zsize - len(opacity))
+        size = TilemapChunk.size
+        for key in list(self.chunks.keys()):
+            if key[0] * size >= xsize or key[1] * size >= ysize:
+                self.chunks.pop(key).delete()
 
     def update(self):
         '''
-        checks for change in tile ids and updates the tilemap
+        marks the chunks holding tiles written since the last update for a
+        rebuild, going by the table's change journal so an idle map costs
+        nothing
         '''
         # if the arn't the same size
-        if self.tile_ids.shape != self.table.getShape():
+        if self.shape != self.table.getShape():
             self.resize(*self.table.getShape())
-        # find the tiles who's ids have changed
-        indexes = numpy.argwhere(self.table._data != self.tile_ids)
-        # we have the idexes of the tiles we need to update so copy
-        # the changed data over so we don;t have to update again
-        self.tile_ids[:] = self.table._data[:]
-        for index in indexes:
-            self.set_image(tuple(index), self.tile_ids[tuple(index)])
-
-    def set_image(self, index, tid):
-        '''
-        change the bitmap of a tile (by making a new sprite)
-        '''
-        # if for some reason the sprite does not exist (ie. the map was
-        # resized) make it
-        x, y, z = index
-        if self.tiles[index] is None:
-            self.tiles[index] = self.makeSprite(x, y, z)
-
-        # get the tile bitmap
-        if tid < 384:
-            if tid <= 47:
-                bitmap = self.blank_tile
-            else:
-                # get the filename
-                autotile = self.autotile_names[int(tid) // 48 - 1]
-                # get the right pattern
-                pattern = tid % 48
-                # collect the tile form the cache checking the local project folder
-                # and the system RTP folder
-                bitmap = self.cache.AutotilePattern(autotile, pattern)
-                if not bitmap:
-                    bitmap = self.cache.AutotilePattern(autotile, pattern)
-                if not bitmap:
-                    bitmap = self.blank_tile
-        # normal tile
-        else:
-            # get the tile bitmap
-            bitmap = self.cache.Tile(self.tileset_name, tid, 0)
-            if not bitmap:
-                bitmap = self.cache.Tile(self.tileset_name, tid, 0)
-            if not bitmap:
-                bitmap = self.blank_tile
-        # draw the tile to the surface
-        self.tiles[index].texture = bitmap.get_texture()
+        if self.table_version == self.table.version:
+            return
+        changes = self.table.getChanges(self.table_version)
+        self.table_version = self.table.version
+        if changes is None:
+            # too much changed to be journaled, rebuild everything built
+            for chunk in self.chunks.values():
+                chunk.dirty = True
+            return
+        for (x0, x1), (y0, y1), (z0, z1) in changes:
+            if x1 > x0 and y1 > y0:
+                self.markDirty(x0, y0, x1, y1)
 
     def SetLayerOpacity(self, layer, opacity):
         '''
-        sets the alpha of all the sprite in a layer
+        sets the alpha of a layer, applied as the GL colour when the layer
+        is drawn so no chunk has to be touched
         '''
-        layer = self.tiles[:, :, layer]
-        for sprite in layer.flatten():
-            sprite.alpha = opacity
+        self.layer_opacity[layer] = opacity
 
     def SetActiveLayer(self, layer):
         '''
@@ -480,19 +509,39 @@ class Tilemap(object):
             for z in range(self.table.getShape()[2]):
                 self.SetLayerOpacity(z, 1.0)
 
+    def getVisibleChunks(self, x, y, width, height):
+        size = TilemapChunk.size
+        shape = self.table.getShape()
+        x1 = min(x + width, shape[0])
+        y1 = min(y + height, shape[1])
+        chunks = []
+        for cx in range(x // size, (x1 - 1) // size + 1):
+            for cy in range(y // size, (y1 - 1) // size + 1):
+                chunks.append(self.getChunk(cx, cy))
+        return chunks
+
     def Draw(self, x, y, width, height):
         '''
         draw the layers of the map
         '''
-        on_screen = self.tiles[x:x + width, y:y + height]
-        if not self.LayerDimming or self.activeLayer > on_screen.shape[2]:
+        chunks = self.getVisibleChunks(x, y, width, height)
+        layers = self.table.getShape()[2]
+        # the chunks are laid out down from the top edge of the map
+        top = self.table.getShape()[1] * 32
+        if not self.LayerDimming or self.activeLayer > layers:
             # draw the dimlayer first
             self.dimmingSprite.render()
-        for z in range(on_screen.shape[2]):
+        for z in range(layers):
             if z == self.activeLayer and self.LayerDimming:
                 if self.dimmingSprite is not None:
                     self.dimmingSprite.render()
-            rabbyt.render_unsorted(on_screen[:, :, z].flatten())
+            gl.glColor4f(1.0, 1.0, 1.0, self.layer_opacity[z])
+            gl.glPushMatrix()
+            gl.glTranslatef(0.0, float(top), 0.0)
+            for chunk in chunks:
+                chunk.Draw(z)
+            gl.glPopMatrix()
+        gl.glColor4f(1.0, 1.0, 1.0, 1.0)
 
 
 class TilemapMouseSprite(object):
@@ -841,6 +890,26 @@ class TilemapMouseManager(object):
         self.sprite = None
         self.topLeft = [-1, -1]
         self.bottomRight = [-1, -1]
+        self.stroke = False
+
+    def beginStroke(self):
+        '''
+        starts a brush stroke, the edits made until endStroke are undone
+        and redone as one action
+        '''
+        if not self.stroke:
+            ActionManager.BeginCompound()
+            self.stroke = True
+
+    def endStroke(self):
+        '''
+        ends a brush stroke, returns the action it made or None if nothing
+        was painted
+        '''
+        if self.stroke:
+            self.stroke = False
+            return ActionManager.EndCompound()
+        return None
 
     def setSprite(self, sprite):
         self.sprite = sprite
@@ -14,6 +14,7 @@ from PyitectConsumes import TilemapEventGrid
 from PyitectConsumes import TilemapTileGrid
 from PyitectConsumes import Tilemap
 from PyitectConsumes import TilemapMouseSprite
+from PyitectConsumes import EventIndex
 
 
 class TilemapPanel(PygletGLPanel):
@@ -65,13 +66,26 @@ class TilemapPanel(PygletGLPanel):
         self.canvas.Bind(wx.EVT_LEFT_UP, self.OnLeftButtonEvent)
         self.canvas.Bind(wx.EVT_MOTION, self.OnLeftButtonEvent)
         self.canvas.Bind(wx.EVT_LEFT_DCLICK, self.OnLeftButtonDEvent)
+        self.canvas.Bind(wx.EVT_MOUSE_CAPTURE_LOST, self.OnMouseCaptureLost)
         # UI update
         self.Bind(wx.EVT_UPDATE_UI, self.update)
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.onClose, self)
+
+    def onClose(self, event):
+        # close a stroke cut short by the panel closing
+        self.MouseManager.endStroke()
+        # stop listening for event edits
+        eventGrid = getattr(self, "eventGrid", None)
+        if eventGrid is not None:
+            eventGrid.Close()
+        event.Skip()
 
     def OnLeftButtonDEvent(self, event):
         if self.onEventLayer():
             mgr = kernel.GlobalObjects["PanelManager"]
             x, y = self.ConvertEventCoords(event)
+            x = x // int(32 * self.zoom)
+            y = y // int(32 * self.zoom)
             event = self.FindEvent(x, y)
             if event:
                 pass
@@ -80,10 +94,7 @@ class TilemapPanel(PygletGLPanel):
             #mgr.dispatchPanel("MainActorsPanel", "Main Actors Panel")
 
     def FindEvent(self, x, y):
-        for event in self.map.events:
-            if event.x == x and event.y == y:
-                return event
-        return None
+        return EventIndex.forMap(self.map).getEvent(x, y)
 
     def OnLeftButtonEvent(self, event):
         if not self.onEventLayer():
@@ -91,6 +102,10 @@ class TilemapPanel(PygletGLPanel):
                 self.SetTopLeftXY(event)
             self.SetBottomRightXY(event)
         if event.LeftDown():
+            if not self.onEventLayer():
+                # everything painted until the button is let go is one
+                # undo step
+                self.MouseManager.beginStroke()
             kernel.System.fire_event("MapEditorMouseLeftDown", event)
             self.SetFocus()
             self.canvas.CaptureMouse()
@@ -98,14 +113,22 @@ class TilemapPanel(PygletGLPanel):
                 self.SetTopLeftXY(event)
             self.drawing = True
         elif event.LeftUp():
-            self.canvas.ReleaseMouse()
-            # if self.drawing:
-            #    self.commitBrush()
+            if self.canvas.HasCapture():
+                self.canvas.ReleaseMouse()
+            if self.drawing:
+                self.MouseManager.endStroke()
             self.drawing = False
         if self.NeedRedraw:
             self.ForceRedraw()
         event.Skip()
 
+    def OnMouseCaptureLost(self, event):
+        # another window took the mouse mid stroke, the button up will
+        # never come so the stroke ends here
+        if self.drawing:
+            self.MouseManager.endStroke()
+        self.drawing = False
+
     def onEventLayer(self):
         return (self.activeLayer == (self.map.data.getShape()[2] + 1))
 
@@ -198,8 +221,7 @@ class TilemapPanel(PygletGLPanel):
         self.tilemap.Draw(x, y, width, height)
         if self.activeLayer == (shape[2] + 1):
             self.tileGrid.Draw(x, y, width, height)
-            self.eventGrid.update()
-            self.eventGrid.Draw()
+            self.eventGrid.Draw(x, y, width, height)
         self.mouseSprite.update()
         self.mouseSprite.Draw()
 
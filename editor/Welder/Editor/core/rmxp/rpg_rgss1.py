@@ -539,7 +539,7 @@ class _TestBattler(object):
         self.armor4_id = 0
 
 class _Words(object):
-    _arc_class_path = "RPG::Words"
+    _arc_class_path = "RPG::System::Words"
     _arc_instance_variables = ['gold', 'hp', 'sp', 'str', 'dex', 'agi',
                             'int', 'atk', 'pdef', 'mdef', 'weapon',
                             'armor1', 'armor2', 'armor3', 'armor4',
@@ -1,3 +1,4 @@
 from .rpgutil import Table
 from .rpgutil import Color
 from .rpgutil import Tone
+from .rpgutil import EventIndex
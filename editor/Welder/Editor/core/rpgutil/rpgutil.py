@@ -8,7 +8,10 @@ Classes in this module
 Table - three dimensional table
 Color - contains RGB color data
 Tone - contains RGBGr tone data
+EventIndex - (x, y) -> ids of the events of a map
 """
+import weakref
+
 import numpy
 from struct import pack, unpack
 
@@ -18,6 +21,10 @@ class Table(object):
     """a three dimensional table object"""
     _arc_class_path = "Table"
 
+    # how many changed regions are remembered, readers that fall further
+    # behind than this have to treat the whole table as changed
+    journal_size = 256
+
     def __init__(self, *args):
         if len(args) != 1 and len(args) != 2 and len(args) != 3:
             raise TypeError(
@@ -40,22 +47,41 @@ class Table(object):
             shape = (self.xsize,)
         self._data = numpy.zeros(shape, dtype=numpy.int16)
         self._data = numpy.reshape(self._data, shape, order='F')
+        # bumped on every write, see markChanged and getChanges
+        self.version = 0
+        self._journal = []
 
     def __getitem__(self, key):
+        if isinstance(key, list):
+            key = tuple(key)
         if isinstance(key, int):
             if self.dim > 1:
                 raise TypeError(
                     "wrong number of arguments (%d for %d)" % (1, self.dim))
+        elif isinstance(key, numpy.ndarray) and key.dtype == bool:
+            # a mask over the whole table
+            if key.shape != self._data.shape:
+                raise IndexError(
+                    "mask shape %s does not match table shape %s"
+                    % (key.shape, self._data.shape))
         elif len(key) != self.dim:
             raise TypeError(
                 "wrong number of arguments (%d for %d)" % (len(key), self.dim))
         return self._data[key]
 
     def __setitem__(self, key, value):
+        if isinstance(key, list):
+            key = tuple(key)
         if isinstance(key, int):
             if self.dim > 1:
                 raise TypeError(
                     "wrong number of arguments (%d for %d)" % (1, self.dim))
+        elif isinstance(key, numpy.ndarray) and key.dtype == bool:
+            # a mask over the whole table
+            if key.shape != self._data.shape:
+                raise IndexError(
+                    "mask shape %s does not match table shape %s"
+                    % (key.shape, self._data.shape))
         elif len(key) != self.dim:
             raise TypeError(
                 "wrong number of arguments (%d for %d)" % (len(key), self.dim))
@@ -63,12 +89,95 @@ class Table(object):
             self._data[key] = value
         except:
             print('__SETITEM__ THREW EXCEPTION')
+        else:
+            self.markChanged(key)
+
+    def _keyBounds(self, key):
+        '''
+        the ((x0, x1), (y0, y1), (z0, z1)) box an index touches, the whole
+        table for an index that can't be bounded cheaply
+        '''
+        shape = self._data.shape
+        bounds = [(0, size) for size in shape]
+        if key is None:
+            pass
+        elif isinstance(key, numpy.ndarray) and key.dtype == bool:
+            # a mask over the whole table
+            points = numpy.argwhere(key)
+            if len(points) == 0:
+                return None
+            bounds = list(zip(points.min(0).tolist(),
+                              (points.max(0) + 1).tolist()))
+        else:
+            if not isinstance(key, tuple):
+                key = (key,)
+            for axis, part in enumerate(key[:len(shape)]):
+                if isinstance(part, slice):
+                    start, stop, step = part.indices(shape[axis])
+                    if step < 0:
+                        start, stop = stop + 1, start + 1
+                    bounds[axis] = (start, max(start, stop))
+                elif isinstance(part, (int, numpy.integer)):
+                    part = int(part) % shape[axis] if shape[axis] else 0
+                    bounds[axis] = (part, part + 1)
+                else:
+                    # a list or array of indexes
+                    part = numpy.asarray(part)
+                    if part.dtype == bool or part.size == 0:
+                        continue
+                    part = part % shape[axis]
+                    bounds[axis] = (int(part.min()), int(part.max()) + 1)
+        while len(bounds) < 3:
+            bounds.append((0, 1))
+        return tuple(bounds)
+
+    def markChanged(self, key=None):
+        '''
+        records that the cells under key (any index Table accepts, None
+        for the whole table) were written, code that writes to _data
+        directly should call this afterwards
+        '''
+        bounds = self._keyBounds(key)
+        if bounds is None:
+            return
+        self._journalBounds(bounds)
+
+    def _journalBounds(self, bounds):
+        bounds = tuple(bounds) + ((0, 1),) * (3 - len(bounds))
+        self.version += 1
+        self._journal.append((self.version, bounds))
+        if len(self._journal) > Table.journal_size:
+            del self._journal[:len(self._journal) - Table.journal_size]
+
+    def getChanges(self, version):
+        '''
+        the ((x0, x1), (y0, y1), (z0, z1)) boxes written since version, or
+        None when the journal no longer reaches that far back
+        '''
+        if version == self.version:
+            return []
+        if not self._journal or self._journal[0][0] > version + 1:
+            return None
+        return [bounds for entry_version, bounds in self._journal
+                if entry_version > version]
 
-    def resize(self, *args):
-        # should work to increase and decrease the table size
+    def resize(self, *args, offset=None):
+        '''
+        changes the size of the table keeping the values that still fit.
+        offset has one int per dimension (all 0 by default) and is where
+        the old first cell lands in the new table, a positive offset grows
+        the table at the start (left or up on a map) and a negative one
+        crops the start away
+        '''
         if len(args) != self.dim:
             raise TypeError(
                 "wrong number of arguments (%d for %d)" % (len(args), self.dim))
+        if offset is None:
+            offset = (0,) * self.dim
+        elif len(offset) != self.dim:
+            raise TypeError(
+                "wrong number of offsets (%d for %d)" % (len(offset), self.dim))
+        old_shape = self._data.shape
         self.xsize = args[0]
         if len(args) >= 2:
             self.ysize = args[1]
@@ -78,54 +187,52 @@ class Table(object):
             self.zsize = args[2]
         else:
             self.zsize = 1
-        newdata = numpy.zeros(self.getShape(), dtype=numpy.int16)
-        shape = self._data.shape
-        mask = [0, 0, 0]
-        if self.dim == 1:
-            if self.xsize >= shape[0]:
-                mask[0] = shape[0]
-            else:
-                mask[0] = self.xsize
-            newdata[:mask[0]] = self._data[:mask[0]]
-        elif self.dim == 2:
-            if self.xsize >= shape[0]:
-                mask[0] = shape[0]
-            else:
-                mask[0] = self.xsize
-            if self.ysize >= shape[1]:
-                mask[1] = shape[1]
-            else:
-                mask[1] = self.ysize
-            newdata[:mask[0], :mask[1]] = self._data[:mask[0], :mask[1]]
-        elif self.dim == 3:
-            if self.xsize >= shape[0]:
-                mask[0] = shape[0]
-            else:
-                mask[0] = self.xsize
-            if self.ysize >= shape[1]:
-                mask[1] = shape[1]
-            else:
-                mask[1] = self.ysize
-            if self.zsize >= shape[2]:
-                mask[2] = shape[2]
-            else:
-                mask[2] = self.zsize
-            newdata[:mask[0], :mask[1], :mask[2]] = self._data[
-                :mask[0], :mask[1], :mask[2]]
+        new_shape = self.getShape()
+        newdata = numpy.zeros(new_shape, dtype=numpy.int16)
+        # copy the block the old and new table share in one go
+        src = []
+        dst = []
+        for old, new, shift in zip(old_shape, new_shape, offset):
+            start = max(shift, 0)
+            skip = max(-shift, 0)
+            count = min(old - skip, new - start)
+            if count <= 0:
+                break
+            src.append(slice(skip, skip + count))
+            dst.append(slice(start, start + count))
+        else:
+            newdata[tuple(dst)] = self._data[tuple(src)]
         self._data = newdata
+        if any(offset):
+            # everything moved
+            self.markChanged()
+            return
+        # only the cells past the smaller of the two sizes on some axis
+        # changed, a region may reach past the new size where cells were
+        # cropped away
+        extent = [max(old, new) for old, new in zip(old_shape, new_shape)]
+        for axis in range(self.dim):
+            low = min(old_shape[axis], new_shape[axis])
+            high = max(old_shape[axis], new_shape[axis])
+            if high > low:
+                bounds = [(0, size) for size in extent]
+                bounds[axis] = (low, high)
+                self._journalBounds(bounds)
 
     def _arc_dump(self, d=0):
         s = pack("<IIII", self.dim, self.xsize, self.ysize, self.zsize)
-        data = self._data.flatten('F').tolist()
-        s += pack("<" + ("h" * (self.xsize * self.ysize * self.zsize)), *data)
-        return s
+        # the tile data is written straight from the array buffer as
+        # little endian int16 in column-major (x fastest) order
+        data = numpy.asarray(self._data, dtype="<i2")
+        return s + data.tobytes(order="F")
 
     @staticmethod
     def _arc_load(s):
         dim, nx, ny, nz = unpack("<IIII", s[0:16])
         size = nx * ny * nz
-        data = numpy.array(
-            unpack("<" + ("h" * size), s[16:16 + size * 2]), dtype=numpy.int16)
+        data = numpy.frombuffer(s, dtype="<i2", count=size, offset=16)
+        # frombuffer returns a read-only view of s, take a native copy
+        data = data.astype(numpy.int16)
         if dim == 3:
             t = Table(nx, ny, nz)
             shape = (nx, ny, nz)
@@ -261,3 +368,145 @@ class Tone(object):
     @staticmethod
     def _arc_load(s):
         return Tone(*unpack("<ffff", s))
+
+
+class EventIndex(object):
+
+    """
+    a spatial index of the events of a map, (x, y) -> the ids of the
+    events standing there. get one with EventIndex.forMap, it is kept on
+    the map (not saved) and rebuilt when the map's events dict is
+    replaced. edits that move, add or remove events tell the index
+    through eventChanged and rebuild, the event edit actions do. it also
+    knows which event the pages and graphics it saw belong to, see
+    getEventKey
+    """
+
+    # event object -> the index holding it
+    _owners = weakref.WeakKeyDictionary()
+
+    def __init__(self, events):
+        # the dict of event id -> event that is indexed
+        self.events = events
+        # (x, y) -> set of event ids
+        self._cells = {}
+        # event id -> (x, y)
+        self._positions = {}
+        # id() of an indexed event, one of its pages or their graphics ->
+        # (the object, the event's key in events)
+        self._keys = {}
+        # key -> the id()s it owns in self._keys
+        self._owned = {}
+        self.rebuild()
+
+    @staticmethod
+    def forMap(map):
+        index = getattr(map, "_event_index", None)
+        if index is None or index.events is not map.events:
+            index = EventIndex(map.events)
+            map._event_index = index
+        return index
+
+    @staticmethod
+    def eventChanged(event):
+        """
+        updates the index holding event, if any, after it was edited
+        """
+        try:
+            index = EventIndex._owners.get(event)
+        except TypeError:
+            return
+        if index is not None:
+            index.updateEvent(event)
+
+    def rebuild(self):
+        for event in self.events.values():
+            EventIndex._owners.pop(event, None)
+        self._cells = {}
+        self._positions = {}
+        self._keys = {}
+        self._owned = {}
+        for key, event in self.events.items():
+            self._add(key, event)
+
+    def _add(self, key, event):
+        position = (event.x, event.y)
+        self._cells.setdefault(position, set()).add(key)
+        self._positions[key] = position
+        owned = [event]
+        for page in getattr(event, "pages", None) or ():
+            owned.append(page)
+            owned.append(page.graphic)
+        for obj in owned:
+            self._keys[id(obj)] = (obj, key)
+        self._owned[key] = [id(obj) for obj in owned]
+        EventIndex._owners[event] = self
+
+    def removeEvent(self, key):
+        position = self._positions.pop(key, None)
+        if position is not None:
+            cell = self._cells[position]
+            cell.discard(key)
+            if not cell:
+                del self._cells[position]
+        for obj_id in self._owned.pop(key, ()):
+            entry = self._keys.get(obj_id)
+            if entry is not None and entry[1] == key:
+                del self._keys[obj_id]
+
+    def getEventKey(self, obj):
+        """
+        the key of the event obj is, or of the event one of whose pages
+        or page graphics it is. None for anything else
+        """
+        entry = self._keys.get(id(obj))
+        if entry is not None and entry[0] is obj:
+            return entry[1]
+        return None
+
+    def updateEvent(self, event):
+        """
+        re-files an event after its position, id or pages changed, or
+        drops it if it is no longer in the events dict
+        """
+        old_key = self.getEventKey(event)
+        if old_key is not None:
+            self.removeEvent(old_key)
+        key = getattr(event, "id", None)
+        if key is not None and self.events.get(key) is event:
+            self.removeEvent(key)
+            self._add(key, event)
+        else:
+            EventIndex._owners.pop(event, None)
+
+    def getEventIds(self, x, y):
+        return sorted(self._cells.get((x, y), ()))
+
+    def getEvents(self, x, y):
+        return [self.events[key] for key in self.getEventIds(x, y)]
+
+    def getEvent(self, x, y):
+        """
+        the event at x, y with the lowest id, or None
+        """
+        ids = self._cells.get((x, y))
+        if ids:
+            return self.events[min(ids)]
+        return None
+
+    def getEventIdsIn(self, x0, y0, x1, y1):
+        """
+        the ids of the events in x0 <= x < x1, y0 <= y < y1, looks at
+        whichever is smaller: the cells of the rectangle or the occupied
+        positions
+        """
+        ids = []
+        if (x1 - x0) * (y1 - y0) <= len(self._cells):
+            for x in range(x0, x1):
+                for y in range(y0, y1):
+                    ids.extend(self._cells.get((x, y), ()))
+        else:
+            for (x, y), cell in self._cells.items():
+                if x0 <= x < x1 and y0 <= y < y1:
+                    ids.extend(cell)
+        return sorted(ids)
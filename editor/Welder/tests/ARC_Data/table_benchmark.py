@@ -0,0 +1,77 @@
+'''
+Benchmarks Table serialization (the bulk of every Map*.arc file)
+
+prints the dump and load time per megabyte of tile data for a few map
+sizes, for the buffer based Table._arc_dump/_arc_load and for the old
+per-element struct implementation they replaced
+
+usage: python table_benchmark.py
+'''
+import os
+import sys
+import time
+from struct import pack, unpack
+
+import numpy
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "Editor", "core"))
+
+from rpgutil import Table
+
+
+def legacy_dump(table):
+    s = pack("<IIII", table.dim, table.xsize, table.ysize, table.zsize)
+    data = table._data.flatten('F').tolist()
+    s += pack("<" + ("h" * (table.xsize * table.ysize * table.zsize)), *data)
+    return s
+
+
+def legacy_load(s):
+    dim, nx, ny, nz = unpack("<IIII", s[0:16])
+    size = nx * ny * nz
+    data = numpy.array(
+        unpack("<" + ("h" * size), s[16:16 + size * 2]), dtype=numpy.int16)
+    t = Table(nx, ny, nz)
+    t._data = numpy.reshape(data, (nx, ny, nz), order="F")
+    return t
+
+
+def timed(func, arg, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func(arg)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def run(width, height, repeat=3):
+    table = Table(width, height, 3)
+    table._data[:] = numpy.random.randint(
+        0, 384 + 8 * 512, size=table.getShape()).astype(numpy.int16)
+    megabytes = table._data.nbytes / (1024.0 * 1024.0)
+
+    dump_time, data = timed(Table._arc_dump, table, repeat)
+    load_time, loaded = timed(Table._arc_load, data, repeat)
+    if not numpy.array_equal(loaded._data, table._data):
+        raise RuntimeError("round trip mismatch for %dx%d" % (width, height))
+
+    legacy_dump_time, legacy_data = timed(legacy_dump, table, 1)
+    legacy_load_time, legacy_loaded = timed(legacy_load, legacy_data, 1)
+    if legacy_data != data:
+        raise RuntimeError("output differs from legacy for %dx%d" % (width, height))
+
+    print("%4dx%-4d %7.2f MB | dump %8.2f ms/MB  load %8.2f ms/MB | "
+          "legacy dump %8.2f ms/MB  load %8.2f ms/MB" % (
+              width, height, megabytes,
+              dump_time * 1000 / megabytes, load_time * 1000 / megabytes,
+              legacy_dump_time * 1000 / megabytes,
+              legacy_load_time * 1000 / megabytes))
+
+
+if __name__ == "__main__":
+    for size in (20, 100, 250, 500):
+        run(size, size)
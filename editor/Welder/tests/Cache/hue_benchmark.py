@@ -0,0 +1,104 @@
+'''
+Benchmarks hue rotation of character sheets
+
+prints the time ImageFunctions.change_hue_PIL takes per sheet for a few
+hues and the time of the old per sextant masked implementation it
+replaced, along with the largest per channel difference between the two
+
+usage: python hue_benchmark.py [Graphics/Characters folder]
+'''
+import os
+import sys
+import time
+
+import numpy
+from PIL import Image
+
+EDITOR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "Editor")
+sys.path.insert(0, EDITOR)
+sys.path.insert(0, os.path.join(EDITOR, "core", "editor"))
+
+from cache import ImageFunctions
+
+DEFAULT_FOLDER = os.path.join(
+    EDITOR, "..", "..", "..", "RTP", "Graphics", "Characters")
+
+
+def legacy_change_hue(image, hue):
+    a = numpy.asarray(image.convert('RGB'), int)
+    R, G, B = a.T
+    m = numpy.min(a, 2).T
+    M = numpy.max(a, 2).T
+    C = M - m
+    Cmsk = C != 0
+    H = numpy.zeros(R.shape, int)
+    mask = (M == R) & Cmsk
+    H[mask] = numpy.mod(60 * (G[mask] - B[mask]) / C[mask], 360)
+    mask = (M == G) & Cmsk
+    H[mask] = (60 * (B[mask] - R[mask]) / C[mask] + 120)
+    mask = (M == B) & Cmsk
+    H[mask] = (60 * (R[mask] - G[mask]) / C[mask] + 240)
+    # was H *= 255; H /= 360, which no longer runs on an int array
+    H = H * 255 // 360
+    V = M
+    S = numpy.zeros(R.shape, int)
+    S[Cmsk] = ((255 * C[Cmsk]) / V[Cmsk])
+    H = (H + (int(255.0 * (hue / 360.0)))) % 255
+
+    H = (H / 255.0) * 360.0
+    S = (S / 255.0)
+    V = (V / 255.0)
+    C = V * S
+    Hp = H / 60.0
+    X = C * (1 - numpy.absolute(numpy.mod(Hp, 2) - 1))
+    channels = []
+    for order in ((C, X, 0, 0, X, C), (X, C, C, X, 0, 0), (0, 0, X, C, C, X)):
+        out = numpy.zeros(H.shape, float)
+        for i, value in enumerate(order):
+            mask = (i <= Hp) & (Hp < i + 1)
+            out[mask] = value[mask] if not isinstance(value, int) else value
+        channels.append((out + V - C) * 255)
+    alpha = image.convert('RGBA').split()[3]
+    rgb = Image.fromarray(numpy.array(channels).T.astype('uint8'))
+    red, green, blue = rgb.split()
+    return Image.merge('RGBA', (red, green, blue, alpha))
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def run(folder, hues=(45, 120, 270)):
+    names = sorted(name for name in os.listdir(folder)
+                   if os.path.splitext(name)[1].lower() in (".png", ".bmp", ".jpg", ".gif"))
+    if not names:
+        print("no images in %s" % folder)
+        return
+    images = [Image.open(os.path.join(folder, name)).convert('RGBA') for name in names]
+    pixels = sum(image.size[0] * image.size[1] for image in images)
+    print("%d sheets, %.2f megapixels" % (len(images), pixels / 1000000.0))
+    for hue in hues:
+        new_time = legacy_time = 0.0
+        difference = 0
+        for image in images:
+            elapsed, new = timed(ImageFunctions.change_hue_PIL, image, hue)
+            new_time += elapsed
+            elapsed, old = timed(legacy_change_hue, image, hue)
+            legacy_time += elapsed
+            difference = max(difference, int(numpy.abs(
+                numpy.asarray(new, int) - numpy.asarray(old, int)).max()))
+        print("hue %3d | change_hue_PIL %7.2f ms/sheet | legacy %7.2f ms/sheet | "
+              "%5.1fx | max difference %d" % (
+                  hue, new_time * 1000 / len(images),
+                  legacy_time * 1000 / len(images),
+                  legacy_time / new_time, difference))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run(sys.argv[1])
+    else:
+        run(DEFAULT_FOLDER)
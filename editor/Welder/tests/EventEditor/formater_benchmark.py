@@ -0,0 +1,223 @@
+'''
+Benchmarks formatting event commands into HTML for the event editor
+
+formats every command of every map event page and common event of a
+project three ways: the way EventCommandFormater did before it kept a
+dispatch table (a plugin system lookup for every command and the
+template built on every call, from the copies in TEMPLATES), through the
+dispatch table (EventCommandFormater.formatCommand) and through the HTML
+cache (EventCommandFormater.format, once to fill it and once from it).
+checks all of them give the same HTML and prints the time per pass
+
+usage: python formater_benchmark.py [project folder]
+'''
+import glob
+import os
+import sys
+import time
+
+EDITOR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "Editor")
+sys.path.insert(0, EDITOR)
+
+import welder_kernel as kernel
+
+DEFAULT_PROJECT = os.path.join(
+    EDITOR, "..", "..", "..", "RTP", "Templates", "Chronicles of Sir Lag-A-Lot")
+
+# loaded by build_system, the TEMPLATES use it
+EventHTMLFormater = None
+
+
+def build_system():
+    global EventHTMLFormater
+    kernel.buildSystem(kernel.PluginCFG.getUnified())
+    kernel.System.search(os.path.join(EDITOR, "core"))
+    kernel.System.enable_plugins([
+        kernel.System.plugins[n][v]
+        for n in kernel.System.plugins
+        for v in kernel.System.plugins[n]])
+    EventHTMLFormater = kernel.System.load("EventHTMLFormater")
+
+
+def load_project(path):
+    '''
+    opens the project at path as the current project, returns the list
+    of every event command in it
+    '''
+    Project = kernel.System.load("Project")
+    load = kernel.System.load("ARCProjectLoadFunction")
+    context = kernel.System.load("ARCProjectLoadContext")()
+    project = Project()
+    project.setProjectPath(path)
+    for name in ("System", "Actors", "Classes", "Skills", "Items", "Weapons",
+                 "Armors", "Enemies", "Troops", "States", "Animations",
+                 "Tilesets", "CommonEvents", "MapInfos"):
+        project.setData(name, load(path, name, context), False)
+    if not kernel.GlobalObjects.has_key("PROJECT"):
+        kernel.GlobalObjects.newKey("PROJECT", "CORE", project)
+    kernel.GlobalObjects["PROJECT"] = project
+
+    commands = []
+    for map_path in sorted(glob.glob(os.path.join(path, "Data", "Map[0-9]*.arc"))):
+        name = os.path.splitext(os.path.basename(map_path))[0]
+        map = load(path, name, context)
+        for event in map.events.values():
+            for page in event.pages:
+                commands.extend(page.list)
+    for common_event in project.getData("CommonEvents"):
+        if common_event is not None:
+            commands.extend(common_event.list)
+    return commands
+
+
+# the html of every formatter class that builds it once, as the legacy
+# formatter built it on every call. run checks each against its class
+TEMPLATES = {
+    "Command000Formater": lambda: EventHTMLFormater.color('#0000A0', EventHTMLFormater.bold('@>')),
+    "Command101Formater": lambda: '%s %s' % (
+        EventHTMLFormater.green('Text:'), EventHTMLFormater.italic('%(text)s')),
+    "Command401Formater": lambda: '&nbsp;&nbsp;&nbsp;&nbsp;%s %s' % (
+        EventHTMLFormater.green(':'), EventHTMLFormater.italic('%(text)s')),
+    "Command402Formater": lambda: '&nbsp;&nbsp;%s (%s)%s' % (EventHTMLFormater.blue(EventHTMLFormater.bold(
+        'When')), EventHTMLFormater.red('%(choice_id)s'), EventHTMLFormater.green('%(choice_name)s')),
+    "Command403Formater": lambda: '&nbsp;&nbsp;%s %s' % (EventHTMLFormater.blue(EventHTMLFormater.bold('When')), EventHTMLFormater.green('Cancel')),
+    "Command103Formater": lambda: '%s Variable[%s: %s], (%s digit(s))' % (EventHTMLFormater.blue('Input Number:'),
+        EventHTMLFormater.red(
+            '%(variable_id)04d'),
+        EventHTMLFormater.green(
+            '%(variable_name)s'),
+        EventHTMLFormater.bold('%(digits)s')),
+    "Command104Formater": lambda: '%s [%s, %s]' % (EventHTMLFormater.italic('Change Text Options:'), EventHTMLFormater.bold(
+        '%(msg_pos)s'), EventHTMLFormater.bold('%(msg_frame)s')),
+    "Command105Formater": lambda: '%s Variable[%s: %s]' % (EventHTMLFormater.bold(EventHTMLFormater.red(
+        'Button Input Processing: ')), EventHTMLFormater.red('%(var_id)04d'), EventHTMLFormater.green('%(var_name)s')),
+    "Command106Formater": lambda: '%s %s %s' % (EventHTMLFormater.blue(EventHTMLFormater.bold(
+        'Wait:')), EventHTMLFormater.red('%(frames)s'), EventHTMLFormater.red('Frame(s)')),
+    "Command108Formater": lambda: '%s %s' % (EventHTMLFormater.green(
+        'Comment:'), EventHTMLFormater.italic(EventHTMLFormater.green('%(text)s'))),
+    "Command408Formater": lambda: '&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;%s %s' % (
+        EventHTMLFormater.green(':'), EventHTMLFormater.italic(EventHTMLFormater.green('%(text)s'))),
+    "Command411Formater": lambda: '%s' % (EventHTMLFormater.blue('Else')),
+    "Command112Formater": lambda: '%s' % (EventHTMLFormater.blue('Loop')),
+    "Command413Formater": lambda: '%s' % (EventHTMLFormater.blue('Repeat Above')),
+    "Command113Formater": lambda: '%s' % (EventHTMLFormater.blue('Break Loop')),
+    "Command115Formater": lambda: '%s' % (EventHTMLFormater.red(EventHTMLFormater.bold('Exit Event Processing'))),
+    "Command116Formater": lambda: '%s' % (EventHTMLFormater.red(EventHTMLFormater.bold('Erase Event'))),
+    "Command117Formater": lambda: '%s: ID [%s]' % (EventHTMLFormater.red(
+        'Call Common Event'), EventHTMLFormater.red(EventHTMLFormater.bold('%(commonevent_id)s'))),
+    "Command118Formater": lambda: '%s: %s' % (
+        EventHTMLFormater.blue('Label'), EventHTMLFormater.green('%(label_name)s')),
+    "Command119Formater": lambda: '%s: %s' % (EventHTMLFormater.blue('Jump to Label'), EventHTMLFormater.green(
+        EventHTMLFormater.italic('%(jump_to_name)s'))),
+    "Command123Formater": lambda: '%s: %s %s %s' % (EventHTMLFormater.red('Control Self Switch'),
+        EventHTMLFormater.green('%(self_switch)s'),
+        EventHTMLFormater.bold('='),
+        EventHTMLFormater.green('%(switch_state)s')),
+    "Command131Formater": lambda: '%s: %s' % (EventHTMLFormater.bold(
+        'Change Windowskin'), EventHTMLFormater.green('%(winskin_name)s')),
+    "Command210Formater": lambda: '%s' % (EventHTMLFormater.bold('Wait for Move\'s Completion')),
+    "Command221Formater": lambda: '%s' % (EventHTMLFormater.bold('Prepare for Transition')),
+    "Command247Formater": lambda: '%s' % (EventHTMLFormater.bold('Memorize BGM/BGS')),
+    "Command248Formater": lambda: '%s' % (EventHTMLFormater.bold('Restore BGM/BGS')),
+    "Command251Formater": lambda: '%s' % (EventHTMLFormater.bold('Stop SE')),
+    "Command340Formater": lambda: '%s' % (EventHTMLFormater.bold('Abort Battle')),
+    "Command351Formater": lambda: '%s' % (EventHTMLFormater.bold('Call Menu Screen')),
+    "Command352Formater": lambda: EventHTMLFormater.color('#2C3539', 'Call Save Screen:'),
+    "Command353Formater": lambda: '%s' % (EventHTMLFormater.bold(EventHTMLFormater.red('Game Over'))),
+    "Command354Formater": lambda: '%s' % (EventHTMLFormater.bold('Return to Title Screen')),
+    "Command412Formater": lambda: EventHTMLFormater.blue('Branch End'),
+    "Command404Formater": lambda: EventHTMLFormater.blue('Choices End'),
+}
+
+
+def check_templates():
+    for name, build in TEMPLATES.items():
+        if build() != kernel.System.load(name).html:
+            raise RuntimeError("the %s template copy is out of date" % name)
+
+
+def legacy_format(command):
+    '''
+    formats a command the way EventCommandFormater did before it kept a
+    dispatch table: the formatter is looked up through the plugin system
+    for every command and its template is built on every call
+    '''
+    name = "Command%03dFormater" % command.code
+    try:
+        formater = kernel.System.load(name)
+    except Exception:
+        formater = None
+    if formater is None:
+        return ''.join(
+            (
+                EventHTMLFormater.indent(command.indent),
+                '<font color="red"><b>ERROR:</b> No Handeler for event code [%s]</font>' %
+                command.code
+            )
+        )
+    if name in TEMPLATES:
+        formater.html = TEMPLATES[name]()
+    text = formater.formatCommand(command.parameters)
+    if text == "":
+        return ''.join(
+            (
+                EventHTMLFormater.indent(command.indent),
+                '<font color="red"><b>ERROR:</b> Event code [%s] defined but not implemented</font>' %
+                command.code
+            )
+        )
+    return ''.join(
+        (
+            EventHTMLFormater.indent(command.indent),
+            text
+        )
+    )
+
+
+def timed(func, commands, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = [func(command) for command in commands]
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def run(commands, EventCommandFormater, repeat=5):
+    check_templates()
+    # commands some formatter can't handle raise the same way on every
+    # path, they are left out
+    formatable = []
+    for command in commands:
+        try:
+            EventCommandFormater.formatCommand(command)
+        except Exception:
+            continue
+        formatable.append(command)
+
+    legacy_time, legacy = timed(legacy_format, formatable, repeat)
+    table_time, table = timed(EventCommandFormater.formatCommand, formatable, repeat)
+    EventCommandFormater.Clear()
+    fill_time, filled = timed(EventCommandFormater.format, formatable, 1)
+    cached_time, cached = timed(EventCommandFormater.format, formatable, repeat)
+    if not legacy == table == filled == cached:
+        raise RuntimeError("formatted HTML differs between paths")
+
+    count = len(formatable)
+    print("%d commands (%d skipped)" % (count, len(commands) - count))
+    for name, elapsed in (("legacy", legacy_time),
+                          ("dispatch table", table_time),
+                          ("cache fill", fill_time),
+                          ("cached", cached_time)):
+        print("%-15s %8.2f ms  %6.2f us/command  %5.1fx" % (
+            name, elapsed * 1000, elapsed * 1e6 / max(count, 1),
+            legacy_time / elapsed))
+
+
+if __name__ == "__main__":
+    build_system()
+    commands = load_project(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PROJECT)
+    run(commands, kernel.System.load("EventCommandFormater"))